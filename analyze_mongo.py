@@ -1,143 +1,289 @@
-import csv
-import json
-from pymongo import MongoClient
-
-mongo_client = MongoClient("mongodb://mongo:27017/")
-users_collection = mongo_client["adtech"]["users_engagement"]
-
-def dump_to_json(data, filename):
-    with open(filename, "w", encoding="utf8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-def dump_to_csv(data, filename):
-    if not data:
-        return
-    keys = data[0].keys()
-    with open(filename, "w", newline='', encoding="utf8") as f:
-        writer = csv.DictWriter(f, fieldnames=keys)
-        writer.writeheader()
-        writer.writerows(data)
-
-# 1. Get all ad interactions (impressions + clicks) for a user
-def get_user_interactions(user_id, filename="user_interactions.json"):
-    doc = users_collection.find_one({"user_id": user_id})
-    interactions = []
-    if doc:
-        for session in doc['ad_sessions']:
-            for imp in session['ad_impressions']:
-                record = {
-                    "session_id": session["session_id"],
-                    "device": session["device"],
-                    "impression_id": imp["impression_id"],
-                    "ad_id": imp["ad_id"],
-                    "campaign_id": imp.get("campaign_id"),
-                    "timestamp": imp["timestamp"],
-                    "was_clicked": imp.get("was_clicked"),
-                    "click": imp.get("click")
-                }
-                interactions.append(record)
-    dump_to_json(interactions, filename)
-    print(f"Wrote {len(interactions)} user interactions to {filename}")
-
-# 2. Last 5 sessions for a user with timestamps and clicks
-def get_last5_sessions(user_id, filename="last5_sessions.json"):
-    pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$project": {"ad_sessions": {"$slice": ["$ad_sessions", -5]}, "_id":0}}
-    ]
-    docs = list(users_collection.aggregate(pipeline))
-    sessions = []
-    if docs:
-        for session in docs[0]["ad_sessions"]:
-            clicks_in_session = sum(1 for imp in session["ad_impressions"] if imp.get("was_clicked"))
-            sessions.append({
-                "session_id": session["session_id"],
-                "device": session["device"],
-                "start_time": session["start_time"],
-                "num_ads": len(session["ad_impressions"]),
-                "num_clicks": clicks_in_session,
-            })
-    dump_to_json(sessions, filename)
-    print(f"Wrote last 5 sessions for user to {filename}")
-
-# 3. Clicks per hour per campaign in the last 24 hours for an advertiser
-def clicks_per_hour_campaign(advertiser_campaign_ids, filename="clicks_per_hour.json"):
-    from datetime import datetime, timedelta
-    last_24h = (datetime.utcnow() - timedelta(hours=24)).isoformat()
-
-    pipeline = [
-        {"$unwind": "$ad_sessions"},
-        {"$unwind": "$ad_sessions.ad_impressions"},
-        {"$match": {
-            "ad_sessions.ad_impressions.campaign_id": {"$in": advertiser_campaign_ids},
-            "ad_sessions.ad_impressions.timestamp": {"$gte": last_24h},
-            "ad_sessions.ad_impressions.was_clicked": True
-        }},
-        {"$project": {
-            "campaign_id": "$ad_sessions.ad_impressions.campaign_id",
-            "click_hour": {"$hour": {"$dateFromString":{"dateString":"$ad_sessions.ad_impressions.timestamp"}}}
-        }},
-        {"$group": {
-            "_id": {"campaign_id":"$campaign_id", "hour":"$click_hour"},
-            "num_clicks": {"$sum":1}
-        }},
-        {"$sort": {"_id.campaign_id":1, "_id.hour":1}}
-    ]
-    out = list(users_collection.aggregate(pipeline))
-    records = [{
-        "campaign_id": row["_id"]["campaign_id"],
-        "hour": row["_id"]["hour"],
-        "clicks": row["num_clicks"]
-    } for row in out]
-    dump_to_csv(records, filename)
-    print(f"Wrote campaign clicks per hour to {filename}")
-
-# 4. Users who have seen the same ad 5+ times but never clicked
-def find_ad_fatigued_users(filename="ad_fatigued_users.json"):
-    pipeline = [
-        {"$unwind": "$ad_sessions"},
-        {"$unwind": "$ad_sessions.ad_impressions"},
-        {"$group": {
-            "_id": {"user_id":"$user_id", "ad_id":"$ad_sessions.ad_impressions.ad_id"},
-            "impressions": {"$sum": 1},
-            "total_clicked": {"$sum":{
-                "$cond":[{"$eq":["$ad_sessions.ad_impressions.was_clicked", True]},1,0]
-            }},
-        }},
-        {"$match": {"impressions": {"$gte":5}, "total_clicked":0}},
-        {"$group": {
-            "_id": "$_id.user_id",
-            "ad_ids": {"$addToSet":"$_id.ad_id"},
-            "num_ads": {"$sum":1}
-        }}
-    ]
-    fatigued = list(users_collection.aggregate(pipeline))
-    dump_to_json(fatigued, filename)
-    print(f"Wrote ad-fatigued users to {filename}")
-
-# 5. User's top 3 engaged ad categories based on past clicks
-def top3_ad_categories(user_id, filename="top3_ad_categories.json"):
-    pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$unwind": "$ad_sessions"},
-        {"$unwind": "$ad_sessions.ad_impressions"},
-        {"$match": {"ad_sessions.ad_impressions.was_clicked": True}},
-        {"$group": {
-            "_id": "$ad_sessions.ad_impressions.ad_category",
-            "clicks": {"$sum": 1}
-        }},
-        {"$sort": {"clicks": -1}},
-        {"$limit": 3}
-    ]
-    top = list(users_collection.aggregate(pipeline))
-    result = [{"category": x["_id"], "clicks": x["clicks"]} for x in top]
-    dump_to_csv(result, filename)
-    print(f"Wrote top 3 categories to {filename}")
-
-
-if __name__ == "__main__":
-    get_user_interactions(user_id=12345)                # Example user_id
-    get_last5_sessions(user_id=12345)
-    clicks_per_hour_campaign(advertiser_campaign_ids=[11,12,13])
-    find_ad_fatigued_users()
-    top3_ad_categories(user_id=12345)
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pymongo import MongoClient
+
+from load_to_mongodb import decode_field_key
+
+mongo_client = MongoClient("mongodb://mongo:27017/")
+users_collection = mongo_client["adtech"]["users_engagement"]
+# Flat impressions maintained by load_to_mongodb.py, indexed on
+# (campaign_id, timestamp) and (user_id, ad_id)
+impressions_collection = mongo_client["adtech"]["ad_impressions"]
+# Per-user summaries maintained by load_to_mongodb.py, unique index on user_id
+summaries_collection = mongo_client["adtech"]["user_summaries"]
+
+# Documents per cursor round trip and records per Parquet row group;
+# exporters hold at most one batch in memory regardless of result size
+CURSOR_BATCH_SIZE = 5000
+PARQUET_CHUNK_ROWS = 50_000
+# Multi-user lookups: user IDs per $in query and concurrent queries in flight
+USER_CHUNK_SIZE = 1000
+QUERY_WORKERS = 4
+
+# Explicit Parquet schemas: a column that is null in the first row group
+# (e.g. click) must not fix its type for the rest of the file
+INTERACTION_FIELDS = [
+    ("session_id", pa.string()),
+    ("device", pa.string()),
+    ("impression_id", pa.string()),
+    ("ad_id", pa.string()),
+    ("campaign_id", pa.int64()),
+    ("timestamp", pa.timestamp("ms")),
+    ("was_clicked", pa.bool_()),
+    ("click", pa.struct([("click_timestamp", pa.timestamp("ms"))])),
+]
+SESSION_FIELDS = [
+    ("session_id", pa.string()),
+    ("device", pa.string()),
+    ("start_time", pa.timestamp("ms")),
+    ("num_ads", pa.int64()),
+    ("num_clicks", pa.int64()),
+]
+INTERACTIONS_SCHEMA = pa.schema(INTERACTION_FIELDS)
+USER_INTERACTIONS_SCHEMA = pa.schema([("user_id", pa.int64())] + INTERACTION_FIELDS)
+SESSIONS_SCHEMA = pa.schema(SESSION_FIELDS)
+USER_SESSIONS_SCHEMA = pa.schema([("user_id", pa.int64())] + SESSION_FIELDS)
+CLICKS_PER_HOUR_SCHEMA = pa.schema([("campaign_id", pa.int64()), ("hour", pa.int64()), ("clicks", pa.int64())])
+FATIGUED_USERS_SCHEMA = pa.schema([("_id", pa.int64()), ("ad_ids", pa.list_(pa.int64())), ("num_ads", pa.int64())])
+TOP_CATEGORIES_SCHEMA = pa.schema([("category", pa.string()), ("clicks", pa.int64())])
+
+
+def aggregate(collection, pipeline):
+    """Streaming aggregation: server-side batches, $group/$sort may spill to disk."""
+    return collection.aggregate(pipeline, allowDiskUse=True, batchSize=CURSOR_BATCH_SIZE)
+
+def dump_to_json(records, filename):
+    """Write a JSON array one record at a time, same layout as json.dump(..., indent=2)."""
+    count = 0
+    with open(filename, "w", encoding="utf8") as f:
+        f.write("[")
+        for record in records:
+            f.write(",\n  " if count else "\n  ")
+            f.write(json.dumps(record, ensure_ascii=False, indent=2, default=str).replace("\n", "\n  "))
+            count += 1
+        f.write("\n]" if count else "]")
+    return count
+
+def dump_to_ndjson(records, filename):
+    count = 0
+    with open(filename, "w", encoding="utf8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, default=str))
+            f.write("\n")
+            count += 1
+    return count
+
+def dump_to_csv(records, filename):
+    """Write CSV rows as they arrive; the header comes from the first record."""
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return 0
+    count = 1
+    with open(filename, "w", newline='', encoding="utf8") as f:
+        writer = csv.DictWriter(f, fieldnames=first.keys())
+        writer.writeheader()
+        writer.writerow(first)
+        for record in records:
+            writer.writerow(record)
+            count += 1
+    return count
+
+def dump_to_parquet(records, filename, schema, chunk_rows=PARQUET_CHUNK_ROWS):
+    """Write one Parquet row group per chunk; an empty result still gets a file with the schema."""
+    records = iter(records)
+    count = 0
+    with pq.ParquetWriter(filename, schema) as writer:
+        while True:
+            chunk = list(islice(records, chunk_rows))
+            if not chunk:
+                break
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            count += len(chunk)
+    return count
+
+EXPORTERS = {
+    ".json": dump_to_json,
+    ".ndjson": dump_to_ndjson,
+    ".jsonl": dump_to_ndjson,
+    ".csv": dump_to_csv,
+    ".parquet": dump_to_parquet,
+}
+
+def export(records, filename, schema, fmt=None):
+    """Stream records to the exporter matching fmt or the file extension; returns the row count.
+
+    schema is the Parquet schema of the records and is used only for .parquet.
+    """
+    extension = fmt or os.path.splitext(filename)[1].lower()
+    if extension not in EXPORTERS:
+        raise ValueError(f"Unsupported export format: {filename}")
+    if extension == ".parquet":
+        return dump_to_parquet(records, filename, schema)
+    return EXPORTERS[extension](records, filename)
+
+def chunked(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def find_by_users(collection, user_ids, projection, chunk_size=USER_CHUNK_SIZE, workers=QUERY_WORKERS):
+    """Documents for many users via chunked $in queries on a bounded thread pool, keyed by user_id."""
+    projection = {**projection, "user_id": 1, "_id": 0}
+
+    def fetch(chunk):
+        cursor = collection.find({"user_id": {"$in": chunk}}, projection).batch_size(CURSOR_BATCH_SIZE)
+        return [(doc["user_id"], doc) for doc in cursor]
+
+    docs = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for rows in pool.map(fetch, chunked(dict.fromkeys(user_ids), chunk_size)):
+            docs.update(rows)
+    return docs
+
+def interaction_record(session, imp):
+    return {
+        "session_id": session["session_id"],
+        "device": session["device"],
+        "impression_id": imp["impression_id"],
+        "ad_id": imp["ad_id"],
+        "campaign_id": imp.get("campaign_id"),
+        "timestamp": imp["timestamp"],
+        "was_clicked": imp.get("was_clicked"),
+        "click": imp.get("click")
+    }
+
+def iter_interactions(doc):
+    """Flat interaction records from a users_engagement document."""
+    for session in doc["ad_sessions"] if doc else []:
+        for imp in session["ad_impressions"]:
+            yield interaction_record(session, imp)
+
+def export_by_user(results, filename, schema):
+    """Export {user_id: [records]} as flat records with a user_id column."""
+    records = ({"user_id": user_id, **record} for user_id, rows in results.items() for record in rows)
+    return export(records, filename, schema)
+
+# 1. Get all ad interactions (impressions + clicks) for a user
+def get_user_interactions(user_id, filename="user_interactions.json"):
+    # Unwind on the server so impressions arrive in cursor batches, not as one document
+    pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$unwind": "$ad_sessions"},
+        {"$unwind": "$ad_sessions.ad_impressions"},
+        {"$project": {
+            "_id": 0,
+            "session_id": "$ad_sessions.session_id",
+            "device": "$ad_sessions.device",
+            "imp": "$ad_sessions.ad_impressions"
+        }}
+    ]
+    interactions = (interaction_record(row, row["imp"]) for row in aggregate(users_collection, pipeline))
+    count = export(interactions, filename, INTERACTIONS_SCHEMA)
+    print(f"Wrote {count} user interactions to {filename}")
+
+# 1b. Interactions for many users, keyed by user_id
+def get_users_interactions(user_ids, filename=None, chunk_size=USER_CHUNK_SIZE, workers=QUERY_WORKERS):
+    # Only session identity and impressions, no user attributes
+    projection = {"ad_sessions.session_id": 1, "ad_sessions.device": 1, "ad_sessions.ad_impressions": 1}
+    docs = find_by_users(users_collection, user_ids, projection, chunk_size, workers)
+    interactions = {user_id: list(iter_interactions(docs.pop(user_id, None)))
+                    for user_id in dict.fromkeys(user_ids)}
+    if filename:
+        count = export_by_user(interactions, filename, USER_INTERACTIONS_SCHEMA)
+        print(f"Wrote {count} interactions for {len(interactions)} users to {filename}")
+    return interactions
+
+# 2. Last 5 sessions for a user with timestamps and clicks
+def get_last5_sessions(user_id, filename="last5_sessions.json"):
+    # Single indexed read of the precomputed session headers
+    summary = summaries_collection.find_one({"user_id": user_id}, {"last_sessions": {"$slice": -5}, "_id": 0})
+    sessions = summary["last_sessions"] if summary else []
+    export(sessions, filename, SESSIONS_SCHEMA)
+    print(f"Wrote last 5 sessions for user to {filename}")
+
+# 2b. Last 5 sessions for many users, keyed by user_id
+def get_users_last5_sessions(user_ids, filename=None, chunk_size=USER_CHUNK_SIZE, workers=QUERY_WORKERS):
+    projection = {"last_sessions": {"$slice": -5}}
+    summaries = find_by_users(summaries_collection, user_ids, projection, chunk_size, workers)
+    sessions = {user_id: summaries[user_id]["last_sessions"] if user_id in summaries else []
+                for user_id in dict.fromkeys(user_ids)}
+    if filename:
+        count = export_by_user(sessions, filename, USER_SESSIONS_SCHEMA)
+        print(f"Wrote {count} sessions for {len(sessions)} users to {filename}")
+    return sessions
+
+# 3. Clicks per hour per campaign in the last 24 hours for an advertiser
+def clicks_per_hour_campaign(advertiser_campaign_ids, filename="clicks_per_hour.json", fmt=".csv"):
+    # fmt=".csv" keeps the existing output: CSV rows in clicks_per_hour.json
+    from datetime import datetime, timedelta
+    # timestamps are BSON dates, so the window filter is a date range on the index
+    last_24h = datetime.utcnow() - timedelta(hours=24)
+
+    # Index range scan on (campaign_id, timestamp)
+    pipeline = [
+        {"$match": {
+            "campaign_id": {"$in": advertiser_campaign_ids},
+            "timestamp": {"$gte": last_24h},
+            "was_clicked": True
+        }},
+        {"$project": {
+            "campaign_id": 1,
+            "click_hour": {"$hour": "$timestamp"}
+        }},
+        {"$group": {
+            "_id": {"campaign_id":"$campaign_id", "hour":"$click_hour"},
+            "num_clicks": {"$sum":1}
+        }},
+        {"$sort": {"_id.campaign_id":1, "_id.hour":1}}
+    ]
+    records = ({
+        "campaign_id": row["_id"]["campaign_id"],
+        "hour": row["_id"]["hour"],
+        "clicks": row["num_clicks"]
+    } for row in aggregate(impressions_collection, pipeline))
+    export(records, filename, CLICKS_PER_HOUR_SCHEMA, fmt)
+    print(f"Wrote campaign clicks per hour to {filename}")
+
+# 4. Users who have seen the same ad (campaign) 5+ times but never clicked
+def find_ad_fatigued_users(filename="ad_fatigued_users.json"):
+    # Partial index on fatigued=True, no regrouping of (user, ad) pairs
+    cursor = summaries_collection.find(
+        {"fatigued": True}, {"user_id": 1, "fatigued_ads": 1, "_id": 0}
+    ).batch_size(CURSOR_BATCH_SIZE)
+    fatigued = ({
+        "_id": doc["user_id"],
+        "ad_ids": [int(campaign_id) for campaign_id in doc["fatigued_ads"]],
+        "num_ads": len(doc["fatigued_ads"])
+    } for doc in cursor)
+    count = export(fatigued, filename, FATIGUED_USERS_SCHEMA)
+    print(f"Wrote {count} ad-fatigued users to {filename}")
+
+# 5. User's top 3 engaged ad categories based on past clicks
+def top3_ad_categories(user_id, filename="top3_ad_categories.json", fmt=".csv"):
+    # fmt=".csv" keeps the existing output: CSV rows in top3_ad_categories.json
+    # Single indexed read of the per-category click counters
+    summary = summaries_collection.find_one({"user_id": user_id}, {"category_clicks": 1, "_id": 0})
+    category_clicks = summary.get("category_clicks", {}) if summary else {}
+    top = sorted(category_clicks.items(), key=lambda item: item[1], reverse=True)[:3]
+    result = [{"category": decode_field_key(category), "clicks": clicks} for category, clicks in top]
+    export(result, filename, TOP_CATEGORIES_SCHEMA, fmt)
+    print(f"Wrote top 3 categories to {filename}")
+
+
+if __name__ == "__main__":
+    get_user_interactions(user_id=12345)                # Example user_id
+    get_last5_sessions(user_id=12345)
+    get_users_last5_sessions(user_ids=[12345, 12346, 12347], filename="users_last5_sessions.ndjson")
+    clicks_per_hour_campaign(advertiser_campaign_ids=[11,12,13])
+    find_ad_fatigued_users()
+    top3_ad_categories(user_id=12345)
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import platform
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+import dataset
+import load_to_mongodb
+from dataset import merge_targeting_criteria
+from metrics import peak_rss_mb
+from transforms_data import AdTechDataTransformer, config
+
+# Наскрізний бенчмарк пайплайна: парсинг CSV, трансформації, вставка в MySQL по таблицях,
+# побудова та запис документів MongoDB, звітні запити. Кожен етап пише час, кількість
+# рядків, рядків/с та піковий RSS процесу у JSON, щоб прогони можна було порівнювати.
+# Етапи з MySQL та MongoDB виконуються лише за наявності --mysql / --mongo.
+
+
+class Benchmark:
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Замір одного етапу; кількість рядків можна задати після виконання через record['rows']"""
+        record = {'stage': name, 'rows': rows}
+        start = time.perf_counter()
+        yield record
+        self.add(name, time.perf_counter() - start, record['rows'])
+
+    def add(self, name, seconds, rows=None):
+        record = {'stage': name, 'seconds': round(seconds, 4), 'rows': rows,
+                  'rows_per_sec': round(rows / seconds) if rows and seconds > 0 else None,
+                  'peak_rss_mb': peak_rss_mb()}
+        self.stages.append(record)
+        throughput = f", {record['rows_per_sec']} рядків/с" if record['rows_per_sec'] else ''
+        print(f"⏱ {name}: {seconds:.3f} с{throughput}, RSS {record['peak_rss_mb']} МБ")
+
+
+def bench_parse(bench):
+    """Парсинг сирих CSV у Parquet-кеш (кеш видаляється, щоб виміряти саме парсинг)"""
+    for path, csv_options in [(dataset.AD_EVENTS_PATH, dataset.AD_EVENTS_CSV),
+                              (dataset.CAMPAIGNS_PATH, dataset.CAMPAIGNS_CSV),
+                              (dataset.USERS_PATH, dataset.USERS_CSV)]:
+        target, _ = dataset.cache_path(path, csv_options)
+        if os.path.exists(target):
+            os.remove(target)
+        with bench.stage(f'csv_parse:{os.path.basename(path)}') as record:
+            dataset.build_cache(path, csv_options)
+            record['rows'] = pq.ParquetFile(target).metadata.num_rows
+
+
+def bench_transforms(bench):
+    """Трансформації імпортера без бази: мапінг рекламодавців будується з CSV"""
+    transformer = AdTechDataTransformer({})
+    with bench.stage('cache_read:ad_events') as record:
+        ad_events = dataset.read_ad_events()
+        record['rows'] = len(ad_events)
+    with bench.stage('transform:merge_targeting_criteria', len(ad_events)):
+        transformer.ad_events = merge_targeting_criteria(ad_events)
+    transformer.campaigns = dataset.read_campaigns()
+    transformer.users = dataset.read_users()
+
+    advertiser_mapping = {name: i for i, name in enumerate(pd.unique(transformer.campaigns['AdvertiserName']), 1)}
+    locations = pd.concat([transformer.users['Location'], transformer.ad_events['Location']]).dropna()
+    transformer.location_mapping = {name: i for i, name in enumerate(pd.unique(locations), 1)}
+    with bench.stage('transform:campaigns', len(transformer.campaigns)):
+        transformer.transform_campaigns(advertiser_mapping)
+    with bench.stage('transform:users_and_interests', len(transformer.users)):
+        transformer.transform_users_and_interests()
+    with bench.stage('transform:ad_events_and_clicks', len(transformer.ad_events)):
+        transformer.transform_ad_events_and_clicks()
+
+
+def bench_mysql(bench, **import_options):
+    """Повний імпорт у MySQL з часом вставки по кожній таблиці (з метрик імпортера)"""
+    transformer = AdTechDataTransformer(config)
+    with bench.stage('mysql:run_full_import') as record:
+        transformer.run_full_import(clear_data=True, **import_options)
+        batches = transformer.metrics.summary()['batches']
+        record['rows'] = batches.get('ad_events', {}).get('rows')
+    for table, batch in batches.items():
+        bench.add(f'mysql:insert:{table}', batch['seconds'], batch['rows'])
+
+
+def bench_mongo(bench, write=False):
+    """Побудова документів MongoDB; запис в окрему базу adtech_benchmark - лише при write=True"""
+    with bench.stage('mongo:load_ad_events') as record:
+        campaigns = dataset.read_campaigns(columns=['CampaignID', 'CampaignName'])
+        users = dataset.read_users(columns=['UserID', 'Age', 'Gender', 'Location', 'Interests'])
+        ad_events = load_to_mongodb.load_ad_events(campaigns=campaigns)
+        record['rows'] = len(ad_events)
+    with bench.stage('mongo:build_documents') as record:
+        record['rows'] = sum(1 for _ in load_to_mongodb.iter_user_documents(ad_events, users))
+
+    if write:
+        db = load_to_mongodb.mongo_client["adtech_benchmark"]
+        with bench.stage('mongo:rebuild_engagement', len(ad_events)):
+            load_to_mongodb.rebuild_engagement(db, ad_events, users, {})
+
+
+def bench_reports(bench):
+    """Кожен звітний запит окремо, потім усі паралельно з записом xlsx; без кешу результатів"""
+    from homework2 import engine, params, queries
+    from report_runner import ReportRunner
+
+    for key, sql in queries.items():
+        with bench.stage(f'report:{key}') as record:
+            record['rows'] = len(pd.read_sql(text(sql), engine, params=params))
+
+    with bench.stage('report:runner') as record:
+        stats = ReportRunner(engine, queries, params).run('output/benchmark_report.xlsx')
+        record['rows'] = sum(stat['rows'] for stat in stats.values())
+
+
+def compare(current, baseline_path):
+    """Порівняння часу етапів з попереднім прогоном"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {s['stage']: s for s in json.load(f)['stages']}
+    print(f"📊 Порівняння з {baseline_path}:")
+    for stage in current['stages']:
+        old = baseline.get(stage['stage'])
+        if old and old['seconds'] and stage['seconds']:
+            print(f"   {stage['stage']}: {old['seconds']:.3f} с -> {stage['seconds']:.3f} с "
+                  f"(x{old['seconds'] / stage['seconds']:.2f})")
+
+
+def run(args):
+    bench = Benchmark()
+    started_at = datetime.now()
+
+    if args.generate:
+        from generate_data import generate
+        with bench.stage('generate', args.generate):
+            generate('data/raw', n_events=args.generate, seed=args.seed)
+
+    bench_parse(bench)
+    bench_transforms(bench)
+    if args.mysql:
+        bench_mysql(bench, stream=args.stream, bulk=args.bulk, workers=args.workers)
+    bench_mongo(bench, write=args.mongo)
+    if args.mysql:
+        bench_reports(bench)
+
+    return {
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': {key: value for key, value in vars(args).items() if key not in ('out', 'compare', 'workdir')},
+        'total_seconds': round(sum(s['seconds'] for s in bench.stages), 4),
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': bench.stages,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Наскрізний бенчмарк пайплайна AdTech")
+    parser.add_argument("--workdir", default=".", help="каталог з data/raw (відносні шляхи рахуються від нього)")
+    parser.add_argument("--generate", type=int, metavar="EVENTS",
+                        help="спершу згенерувати EVENTS подій у <workdir>/data/raw (файли перезаписуються; "
+                             "потрібен --workdir поза репозиторієм)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mysql", action="store_true", help="вставка в MySQL та звітні запити")
+    parser.add_argument("--mongo", action="store_true", help="запис документів у MongoDB (база adtech_benchmark)")
+    parser.add_argument("--stream", action="store_true", help="потоковий імпорт у MySQL")
+    parser.add_argument("--bulk", action="store_true", help="LOAD DATA LOCAL INFILE для подій і кліків")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--out", help="JSON з результатами (за замовчуванням output/benchmark_<час>.json)")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="порівняти з попереднім прогоном")
+    args = parser.parse_args()
+    # Згенеровані файли замінили б дані репозиторію в data/raw
+    if args.generate and os.path.realpath(args.workdir) == os.path.dirname(os.path.realpath(__file__)):
+        parser.error("--generate перезаписує <workdir>/data/raw: вкажіть окремий --workdir, напр. /tmp/adtech_bench")
+
+    out = os.path.abspath(args.out) if args.out else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    if args.generate:
+        os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    out = out or os.path.abspath(f"output/benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+
+    result = run(args)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"✅ Результати: {out} ({result['total_seconds']} с, пік RSS {result['peak_rss_mb']} МБ)")
+    if baseline:
+        compare(result, baseline)
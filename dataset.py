@@ -0,0 +1,228 @@
+import glob
+import hashlib
+import io
+import json
+import os
+from itertools import islice
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+AD_EVENTS_PATH = 'data/raw/ad_events.csv'
+CAMPAIGNS_PATH = 'data/raw/campaigns.csv'
+USERS_PATH = 'data/raw/users.csv'
+CACHE_DIR = 'data/processed/cache'
+
+# Розмір чанку при першому парсингі CSV у кеш: пам'ять обмежена одним чанком
+PARSE_CHUNKSIZE = 500_000
+# Байтів з початку та з кінця завантаженої частини файлу, що входять у її відбиток
+FINGERPRINT_BYTES = 1024
+
+AD_EVENTS_COLUMNS = [
+    'EventID', 'AdvertiserName', 'CampaignName', 'CampaignStartDate', 'CampaignEndDate',
+    'TargetingCriteria1', 'TargetingCriteria2', 'TargetingCriteria3',
+    'AdSlotSize', 'UserID', 'Device', 'Location', 'Timestamp',
+    'BidAmount', 'AdCost', 'WasClicked', 'ClickTimestamp',
+    'AdRevenue', 'Budget', 'RemainingBudget'
+]
+
+# Колонки з невеликою кількістю значень: у Parquet зберігаються словником,
+# у pandas читаються як category. Атрибути кампанії повторюються в кожній події,
+# тому в ad_events вони теж словникові (сотні значень на мільйони рядків)
+CATEGORICAL_COLUMNS = ['AdvertiserName', 'Device', 'Location', 'Gender',
+                       'CampaignName', 'CampaignStartDate', 'CampaignEndDate',
+                       'TargetingCriteria1', 'TargetingCriteria2', 'TargetingCriteria3', 'AdSlotSize']
+
+# Явні типи колонок: pandas не вгадує типи для кожного файлу чи чанку окремо
+AD_EVENTS_DTYPES = {
+    'EventID': 'object', 'AdvertiserName': 'object', 'CampaignName': 'object',
+    'CampaignStartDate': 'object', 'CampaignEndDate': 'object',
+    'TargetingCriteria1': 'object', 'TargetingCriteria2': 'object', 'TargetingCriteria3': 'object',
+    'AdSlotSize': 'object', 'UserID': 'int64', 'Device': 'object', 'Location': 'object',
+    'Timestamp': 'object', 'BidAmount': 'float64', 'AdCost': 'float64', 'WasClicked': 'bool',
+    'ClickTimestamp': 'object', 'AdRevenue': 'float64', 'Budget': 'float64', 'RemainingBudget': 'float64'
+}
+CAMPAIGNS_DTYPES = {
+    'CampaignID': 'int64', 'AdvertiserName': 'object', 'CampaignName': 'object',
+    'CampaignStartDate': 'object', 'CampaignEndDate': 'object', 'TargetingCriteria': 'object',
+    'AdSlotSize': 'object', 'Budget': 'float64', 'RemainingBudget': 'float64'
+}
+USERS_DTYPES = {
+    'UserID': 'int64', 'Age': 'Int64', 'Gender': 'object', 'Location': 'object',
+    'Interests': 'object', 'SignupDate': 'object'
+}
+
+# Типи колонок у Parquet-кеші (задані явно, щоб порожній чанк не дав тип null)
+ARROW_TYPES = {'object': pa.string(), 'int64': pa.int64(), 'Int64': pa.int64(),
+               'float64': pa.float64(), 'bool': pa.bool_()}
+
+# Параметри pd.read_csv для кожного сирого файлу
+AD_EVENTS_CSV = {'names': AD_EVENTS_COLUMNS, 'skiprows': 1, 'header': None, 'dtype': AD_EVENTS_DTYPES}
+CAMPAIGNS_CSV = {'dtype': CAMPAIGNS_DTYPES}
+USERS_CSV = {'dtype': USERS_DTYPES}
+# Рядки подій з середини файлу (дописані після попереднього читання): без заголовка
+AD_EVENTS_ROWS_CSV = {'names': AD_EVENTS_COLUMNS, 'header': None, 'dtype': AD_EVENTS_DTYPES}
+
+
+def merge_targeting_criteria(ad_events):
+    """Об'єднання трьох частин TargetingCriteria в один стовпець (category)"""
+    parts = ['TargetingCriteria1', 'TargetingCriteria2', 'TargetingCriteria3']
+    # Рядки склеюються лише для унікальних комбінацій частин (їх стільки ж, скільки кампаній),
+    # а не для кожної події
+    groups = ad_events.groupby(parts, sort=False, observed=True, dropna=False)
+    codes = groups.ngroup().to_numpy()
+    combinations = groups.size().index
+    # Порожні частини (NaN з CSV, None з Parquet-кешу) пропускаються, а не стають 'nan'/'None'
+    merged = pd.Index([', '.join(str(part).strip() for part in parts if pd.notna(part))
+                       for parts in combinations], dtype=object)
+    # Різні комбінації можуть дати однаковий рядок, тому категорії будуються з унікальних рядків
+    merged_codes, categories = pd.factorize(merged)
+    ad_events['TargetingCriteria'] = pd.Categorical.from_codes(merged_codes[codes], categories=categories)
+    return ad_events.drop(parts, axis=1)
+
+
+def cache_path(path, csv_options, cache_dir=CACHE_DIR):
+    """Шлях до кешу: <ім'я файлу>-<hash шляху й параметрів CSV>-<розмір>-<mtime_ns>.parquet
+
+    Параметри pd.read_csv (колонки, типи) входять у ключ: після їх зміни кеш будується заново.
+    """
+    stat = os.stat(path)
+    key = json.dumps([os.path.abspath(path), csv_options], sort_keys=True, default=str)
+    path_hash = hashlib.sha256(key.encode()).hexdigest()[:8]
+    prefix = f'{os.path.basename(path)}-{path_hash}'
+    return os.path.join(cache_dir, f'{prefix}-{stat.st_size}-{stat.st_mtime_ns}.parquet'), prefix
+
+
+def build_cache(path, csv_options, cache_dir=CACHE_DIR, chunksize=PARSE_CHUNKSIZE):
+    """Одноразовий парсинг CSV у Parquet; повертає шлях до актуального кешу.
+
+    Кеш прив'язаний до розміру та mtime файлу: змінений файл парситься заново,
+    застарілі кеші цього файлу видаляються.
+    """
+    target, prefix = cache_path(path, csv_options, cache_dir)
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = target + '.tmp'
+    dtypes = csv_options['dtype']
+    writer = None
+    try:
+        for chunk in pd.read_csv(path, chunksize=chunksize, **csv_options):
+            if writer is None:
+                schema = pa.schema([(column, ARROW_TYPES[dtypes[column]]) for column in chunk.columns])
+                writer = pq.ParquetWriter(tmp_path, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        # Файл лише із заголовком
+        pd.read_csv(path, **csv_options).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, target)
+
+    for stale in glob.glob(os.path.join(cache_dir, f'{glob.escape(prefix)}-*.parquet')):
+        if stale != target:
+            os.remove(stale)
+    return target
+
+
+def as_categorical(df):
+    """Категорії у лексичному порядку: сортування збігається з рядковими колонками"""
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].cat.set_categories(sorted(df[column].cat.categories))
+    return df
+
+
+def read_cached(path, csv_options, columns=None, cache_dir=CACHE_DIR):
+    """Читання сирого CSV через Parquet-кеш з проєкцією колонок та memory-map"""
+    cache = build_cache(path, csv_options, cache_dir)
+    categorical = [c for c in CATEGORICAL_COLUMNS if columns is None or c in columns]
+    df = pd.read_parquet(cache, columns=columns, memory_map=True, read_dictionary=categorical)
+    return as_categorical(df)
+
+
+def iter_cached(path, csv_options, chunksize=100_000, columns=None, cache_dir=CACHE_DIR):
+    """Читання сирого CSV через Parquet-кеш чанками по chunksize рядків"""
+    cache = build_cache(path, csv_options, cache_dir)
+    names = pq.read_schema(cache).names
+    categorical = [c for c in CATEGORICAL_COLUMNS if c in names and (columns is None or c in columns)]
+    parquet_file = pq.ParquetFile(cache, memory_map=True, read_dictionary=categorical)
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+        yield as_categorical(batch.to_pandas())
+
+
+def iter_csv_rows(path, offset=0, batch_rows=PARSE_CHUNKSIZE, settled=True, csv_options=AD_EVENTS_ROWS_CSV):
+    """Рядки CSV від байта offset пакетами по batch_rows: (DataFrame, початок, кінець).
+
+    Читаються лише байти від offset, без Parquet-кешу. При offset=0 пропускається заголовок.
+    Неповний останній рядок (файл ще пишеться) залишається до наступного читання,
+    якщо файл не settled. Поля з переносами рядків у лапках не підтримуються.
+    """
+    with open(path, 'rb') as f:
+        if offset == 0:
+            header = f.readline()
+            if not header.endswith(b'\n'):
+                return
+            offset = len(header)
+        else:
+            f.seek(offset)
+
+        while True:
+            lines = list(islice(f, batch_rows))
+            complete = len(lines) == batch_rows
+            if lines and not lines[-1].endswith(b'\n') and not settled:
+                lines.pop()
+                complete = False
+            if not lines:
+                return
+            data = b''.join(lines)
+            batch = pd.read_csv(io.BytesIO(data), on_bad_lines='warn', **csv_options)
+            yield batch, offset, offset + len(data)
+            offset += len(data)
+            if not complete:
+                return
+
+
+def prefix_fingerprint(path, size):
+    """Відбиток перших size байт файлу: sha256 розміру, першого та останнього КБ"""
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(min(size, FINGERPRINT_BYTES)))
+        f.seek(max(0, size - FINGERPRINT_BYTES))
+        digest.update(f.read(size - f.tell()))
+    return digest.hexdigest()
+
+
+def appended_offset(path, size, fingerprint):
+    """size, якщо файл після попереднього читання (size байт) лише дописано, інакше None.
+
+    Дописаним вважається файл, що став більшим, чий прочитаний префікс закінчується
+    повним рядком і має той самий відбиток (prefix_fingerprint), що й при завантаженні.
+    Переписаний файл (або завантаження без відбитку) читається заново повністю.
+    """
+    if not size or not fingerprint or os.path.getsize(path) <= size:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        if f.read(1) != b'\n':
+            return None
+    return size if prefix_fingerprint(path, size) == fingerprint else None
+
+
+def read_ad_events(path=AD_EVENTS_PATH, columns=None):
+    return read_cached(path, AD_EVENTS_CSV, columns)
+
+
+def iter_ad_events(path=AD_EVENTS_PATH, chunksize=100_000, columns=None):
+    return iter_cached(path, AD_EVENTS_CSV, chunksize, columns)
+
+
+def read_campaigns(path=CAMPAIGNS_PATH, columns=None):
+    return read_cached(path, CAMPAIGNS_CSV, columns)
+
+
+def read_users(path=USERS_PATH, columns=None):
+    return read_cached(path, USERS_CSV, columns)
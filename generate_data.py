@@ -0,0 +1,201 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Синтетичні дані у форматі data/raw: ad_events.csv (20 колонок, TargetingCriteria
+# розбитий на три поля без лапок), users.csv та campaigns.csv.
+# Однаковий seed дає однакові файли, тож прогони бенчмарку можна порівнювати.
+
+AD_EVENTS_HEADER = ('EventID,AdvertiserName,CampaignName,CampaignStartDate,CampaignEndDate,TargetingCriteria,'
+                    'AdSlotSize,UserID,Device,Location,Timestamp,BidAmount,AdCost,WasClicked,ClickTimestamp,'
+                    'AdRevenue,Budget,RemainingBudget')
+
+PERIOD_START = pd.Timestamp('2024-10-01')
+PERIOD_END = pd.Timestamp('2024-12-31 23:59:59')
+
+LOCATIONS = ['USA', 'UK', 'Germany', 'India', 'Canada', 'Australia', 'France', 'Brazil']
+LOCATION_WEIGHTS = [0.30, 0.15, 0.12, 0.15, 0.08, 0.06, 0.08, 0.06]
+DEVICES = ['Mobile', 'Desktop', 'Tablet']
+DEVICE_WEIGHTS = [0.55, 0.35, 0.10]
+# Відносний CTR пристрою
+DEVICE_CTR = np.array([1.0, 1.3, 0.8])
+INTERESTS = ['Gaming', 'Sports', 'Fashion', 'Technology', 'Travel', 'Food', 'Finance', 'Health',
+             'Music', 'Movies', 'Education', 'Automotive']
+AD_SLOT_SIZES = ['300x250', '728x90', '160x600', '320x50', '300x600']
+
+# Поведінка: середня кількість показів за сесію, пауза між показами в сесії
+# та пауза між кліком і показом (секунди)
+EVENTS_PER_SESSION = 4
+IN_SESSION_GAP = 90
+CLICK_DELAY = 20
+# Популярність кампаній і активність користувачів: Zipf-подібний розподіл
+CAMPAIGN_ZIPF = 1.1
+USER_ACTIVITY_SIGMA = 1.0
+
+
+def zipf_weights(n, exponent):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def random_dates(rng, n, start, end):
+    seconds = rng.integers(0, int((end - start).total_seconds()), n)
+    return start + pd.to_timedelta(seconds, unit='s')
+
+
+def uuid4_strings(rng, n):
+    """Детерміновані UUID v4 з генератора (uuid.uuid4 не залежить від seed)"""
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = raw[:, 6] & 0x0F | 0x40
+    raw[:, 8] = raw[:, 8] & 0x3F | 0x80
+    hexed = raw.tobytes().hex()
+    return [f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}'
+            for h in (hexed[i:i + 32] for i in range(0, len(hexed), 32))]
+
+
+def generate_campaigns(rng, n_campaigns, n_advertisers):
+    start = random_dates(rng, n_campaigns, PERIOD_START, PERIOD_END - pd.Timedelta(days=30)).normalize()
+    duration = pd.to_timedelta(rng.integers(14, 60, n_campaigns), unit='D')
+    age_from = rng.integers(18, 45, n_campaigns)
+    age_to = age_from + rng.integers(5, 25, n_campaigns)
+    budget = np.round(rng.uniform(10_000, 500_000, n_campaigns), 2)
+    return pd.DataFrame({
+        'CampaignID': np.arange(1, n_campaigns + 1),
+        'AdvertiserName': [f'Advertiser_{i}' for i in rng.integers(1, n_advertisers + 1, n_campaigns)],
+        'CampaignName': [f'Campaign_{i}' for i in range(1, n_campaigns + 1)],
+        'CampaignStartDate': start.strftime('%Y-%m-%d'),
+        'CampaignEndDate': (start + duration).strftime('%Y-%m-%d'),
+        'TargetingAge': [f'Age {a}-{b}' for a, b in zip(age_from, age_to)],
+        'TargetingInterest': rng.choice(INTERESTS, n_campaigns),
+        'TargetingLocation': rng.choice(LOCATIONS, n_campaigns, p=LOCATION_WEIGHTS),
+        'AdSlotSize': rng.choice(AD_SLOT_SIZES, n_campaigns),
+        'Budget': budget,
+        'RemainingBudget': np.round(budget * rng.beta(2, 3, n_campaigns), 2),
+        # Базовий CTR кампанії, в середньому ~2%
+        'ctr': rng.beta(2, 100, n_campaigns),
+    })
+
+
+def generate_users(rng, n_users):
+    n_interests = rng.integers(1, 4, n_users)
+    interests = [', '.join(rng.choice(INTERESTS, k, replace=False)) for k in n_interests]
+    return pd.DataFrame({
+        'UserID': np.arange(1, n_users + 1),
+        'Age': rng.integers(18, 70, n_users),
+        'Gender': rng.choice(['Male', 'Female', 'Non-Binary'], n_users, p=[0.48, 0.48, 0.04]),
+        'Location': rng.choice(LOCATIONS, n_users, p=LOCATION_WEIGHTS),
+        'Interests': interests,
+        'SignupDate': random_dates(rng, n_users, pd.Timestamp('2023-01-01'), PERIOD_START).strftime('%Y-%m-%d'),
+    })
+
+
+def generate_events_chunk(rng, n_events, campaigns, users, campaign_p, user_p):
+    """Один чанк подій, згрупованих у сесії (користувач, пристрій, щільні покази)"""
+    n_sessions = max(1, n_events // EVENTS_PER_SESSION)
+    sizes = rng.geometric(1 / EVENTS_PER_SESSION, n_sessions)
+    sizes = sizes[np.cumsum(sizes) <= n_events]
+    sizes = np.append(sizes, n_events - sizes.sum())
+    sizes = sizes[sizes > 0]
+
+    session_user = rng.choice(len(users), len(sizes), p=user_p)
+    session_device = rng.choice(len(DEVICES), len(sizes), p=DEVICE_WEIGHTS)
+    period = int((PERIOD_END - PERIOD_START).total_seconds())
+    session_start = rng.integers(0, period, len(sizes))
+
+    user_idx = np.repeat(session_user, sizes)
+    device_idx = np.repeat(session_device, sizes)
+    # Зсув показу в межах сесії: накопичена сума пауз, перший показ без паузи
+    gaps = rng.exponential(IN_SESSION_GAP, n_events)
+    first = np.r_[0, np.cumsum(sizes)[:-1]]
+    gaps[first] = 0
+    offsets = np.cumsum(gaps)
+    offsets -= np.repeat(offsets[first], sizes)
+    seconds = np.minimum(np.repeat(session_start, sizes) + offsets.astype(np.int64), period)
+    timestamps = PERIOD_START + pd.to_timedelta(seconds, unit='s')
+
+    campaign_idx = rng.choice(len(campaigns), n_events, p=campaign_p)
+    ctr = campaigns['ctr'].to_numpy()[campaign_idx] * DEVICE_CTR[device_idx]
+    clicked = rng.random(n_events) < ctr
+    click_timestamps = (timestamps + pd.to_timedelta(rng.exponential(CLICK_DELAY, n_events).astype(np.int64) + 1,
+                                                     unit='s')).where(clicked)
+
+    bid = np.round(rng.uniform(0.5, 5.0, n_events), 2)
+    cost = np.round(bid * rng.uniform(0.4, 1.0, n_events), 2)
+    revenue = np.where(clicked, np.round(cost * rng.uniform(1.0, 4.0, n_events), 2), 0.0)
+
+    campaign = campaigns.iloc[campaign_idx]
+    return pd.DataFrame({
+        'EventID': uuid4_strings(rng, n_events),
+        'AdvertiserName': campaign['AdvertiserName'].to_numpy(),
+        'CampaignName': campaign['CampaignName'].to_numpy(),
+        'CampaignStartDate': campaign['CampaignStartDate'].to_numpy(),
+        'CampaignEndDate': campaign['CampaignEndDate'].to_numpy(),
+        'TargetingCriteria1': campaign['TargetingAge'].to_numpy(),
+        'TargetingCriteria2': campaign['TargetingInterest'].to_numpy(),
+        'TargetingCriteria3': campaign['TargetingLocation'].to_numpy(),
+        'AdSlotSize': campaign['AdSlotSize'].to_numpy(),
+        'UserID': users['UserID'].to_numpy()[user_idx],
+        'Device': np.array(DEVICES)[device_idx],
+        'Location': users['Location'].to_numpy()[user_idx],
+        'Timestamp': timestamps,
+        'BidAmount': bid,
+        'AdCost': cost,
+        'WasClicked': clicked,
+        'ClickTimestamp': click_timestamps,
+        'AdRevenue': revenue,
+        'Budget': campaign['Budget'].to_numpy(),
+        'RemainingBudget': campaign['RemainingBudget'].to_numpy(),
+    })
+
+
+def generate(out_dir='data/synthetic', n_events=10_000, n_users=None, n_campaigns=1000, n_advertisers=100,
+             seed=42, chunksize=1_000_000):
+    """Генерація ad_events.csv, users.csv та campaigns.csv у out_dir.
+
+    Події пишуться чанками по chunksize рядків, тож пам'ять не залежить від n_events.
+    """
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(100, n_events // 20)
+    os.makedirs(out_dir, exist_ok=True)
+
+    campaigns = generate_campaigns(rng, n_campaigns, n_advertisers)
+    campaigns_csv = campaigns.assign(TargetingCriteria=campaigns['TargetingAge'] + ', '
+                                     + campaigns['TargetingInterest'] + ', ' + campaigns['TargetingLocation'])
+    campaigns_csv[['CampaignID', 'AdvertiserName', 'CampaignName', 'CampaignStartDate', 'CampaignEndDate',
+                   'TargetingCriteria', 'AdSlotSize', 'Budget', 'RemainingBudget']].to_csv(
+        os.path.join(out_dir, 'campaigns.csv'), index=False)
+
+    users = generate_users(rng, n_users)
+    users.to_csv(os.path.join(out_dir, 'users.csv'), index=False)
+
+    # Популярність кампаній у випадковому порядку, активність користувачів - логнормальна
+    campaign_p = zipf_weights(n_campaigns, CAMPAIGN_ZIPF)[rng.permutation(n_campaigns)]
+    user_p = rng.lognormal(0, USER_ACTIVITY_SIGMA, n_users)
+    user_p /= user_p.sum()
+
+    path = os.path.join(out_dir, 'ad_events.csv')
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(AD_EVENTS_HEADER + '\n')
+        for start in range(0, n_events, chunksize):
+            chunk = generate_events_chunk(rng, min(chunksize, n_events - start), campaigns, users,
+                                          campaign_p, user_p)
+            chunk.to_csv(f, header=False, index=False, date_format='%Y-%m-%d %H:%M:%S', lineterminator='\n')
+            print(f"📝 {start + len(chunk)} / {n_events} подій")
+
+    print(f"✅ Згенеровано: {n_events} подій, {n_users} користувачів, {n_campaigns} кампаній у {out_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерація синтетичних ad_events.csv, users.csv, campaigns.csv")
+    parser.add_argument("--events", type=int, default=10_000, help="кількість подій (10k ... 100M)")
+    parser.add_argument("--users", type=int, default=None, help="кількість користувачів (за замовчуванням events / 20)")
+    parser.add_argument("--campaigns", type=int, default=1000)
+    parser.add_argument("--advertisers", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    parser.add_argument("--out", default="data/synthetic", help="каталог для CSV (data/raw для запуску пайплайна)")
+    args = parser.parse_args()
+
+    generate(args.out, args.events, args.users, args.campaigns, args.advertisers, args.seed, args.chunksize)
@@ -0,0 +1,303 @@
+import argparse
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+from dataset import iter_csv_rows
+from metrics import ImportMetrics
+
+# Безперервний інгест: сервіс стежить за каталогом landing, читає нові файли подій
+# (формат ad_events.csv) мікропакетами і вантажить їх у MySQL та MongoDB.
+# Читач і кожен приймач працюють в окремих потоках, пов'язаних обмеженими чергами:
+# повільний приймач пригальмовує читання (backpressure), пам'ять обмежена глибиною черг.
+# Для кожного приймача в checkpoint зберігається зміщення (байт) у кожному файлі, до якого
+# пакети вже записані. Після перезапуску читання продовжується з мінімального зміщення,
+# а приймач пропускає пакети, які вже записав. Доставка at-least-once: повторно може прийти
+# пакет, що оброблявся в момент зупинки (або всі пакети, якщо checkpoint втрачено), зокрема
+# з іншою нарізкою на пакети (файл дописано, змінено --batch-rows). Обидва приймачі
+# відкидають уже завантажені події поштучно, тож повтор не дублює даних. MySQL: події
+# за event_id, кліки унікальні за event_id, rollup перераховується з ad_events і clicks
+# для днів пакету; змінюється лише лічильник rows_loaded в import_watermarks.
+# MongoDB: події, чиї покази вже є в ad_impressions; покази пишуться останніми, після
+# users_engagement і user_summaries. Виняток - зупинка під час самого запису пакета в MongoDB:
+# недописані події застосовуються повторно, і лічильники user_summaries захищені позначкою
+# завантаження лише від повтору з тією ж нарізкою (load_to_mongodb.apply_incremental).
+# Файли можна і дописувати - читаються лише нові рядки.
+
+LANDING_DIR = 'data/landing'
+CHECKPOINT_PATH = 'output/ingest_checkpoint.json'
+
+MICRO_BATCH_ROWS = 20_000
+QUEUE_DEPTH = 4
+POLL_INTERVAL = 5
+# Файл без змін стільки секунд вважається дописаним: останній рядок без '\n' теж читається
+SETTLE_SECONDS = 10
+
+
+class Checkpoint:
+    """Зміщення у файлах, до яких кожен приймач уже записав пакети: {приймач: {файл: байт}}"""
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.offsets = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.offsets = json.load(f)
+
+    def offset(self, sink, source_file):
+        with self.lock:
+            return self.offsets.get(sink, {}).get(source_file, 0)
+
+    def start_offset(self, source_file, sinks):
+        """Звідки читати файл: найменше зміщення серед приймачів"""
+        return min(self.offset(sink, source_file) for sink in sinks)
+
+    def ack(self, sink, source_file, offset):
+        """Фіксація пакету приймачем; файл checkpoint замінюється атомарно"""
+        with self.lock:
+            self.offsets.setdefault(sink, {})[source_file] = offset
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.offsets, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def read_micro_batches(path, offset, batch_rows=MICRO_BATCH_ROWS, settled=False):
+    """Нові рядки файлу від offset мікропакетами: (DataFrame, початок, кінець)"""
+    return iter_csv_rows(path, offset, batch_rows, settled)
+
+
+class MySQLSink:
+    """Пакети подій у MySQL через AdTechDataTransformer: події, кліки, rollup і import_watermarks.
+
+    Повтор пакета ідемпотентний: insert_events відкидає події, що вже є в ad_events,
+    refresh_rollup перераховує дні пакету з таблиць, а не додає дельти.
+    """
+
+    name = 'mysql'
+
+    def __init__(self, config):
+        from transforms_data import AdTechDataTransformer
+
+        self.transformer = AdTechDataTransformer(config)
+        self.cursor = None
+
+    def open(self):
+        transformer = self.transformer
+        transformer.connect_db()
+        if not transformer.connection:
+            raise RuntimeError("MySQL недоступний")
+        # Довідники оновлюються один раз на старті: кампанії (бюджети), користувачі, мапінги
+        transformer.load_csv_data(load_events=False)
+        self.cursor = transformer.connection.cursor()
+        transformer.insert_dimensions(self.cursor)
+
+    def write(self, batch, source_file, end):
+        transformer = self.transformer
+        transformer.loaded_rows, transformer.loaded_max_timestamp = 0, None
+        events_count, clicks_count = transformer.insert_events(self.cursor, batch)
+        transformer.refresh_rollup(self.cursor)
+        # Watermark файлу: звітний кеш (ReportCache) бачить нові дані
+        stat = os.stat(source_file)
+        transformer.record_watermark(self.cursor, (source_file, end, stat.st_mtime_ns))
+        return events_count
+
+    def close(self):
+        if self.cursor is not None:
+            self.cursor.close()
+        if self.transformer.connection:
+            self.transformer.connection.close()
+
+
+class MongoSink:
+    """Пакети подій у MongoDB: сесії users_engagement, ad_impressions та user_summaries"""
+
+    name = 'mongo'
+
+    def __init__(self):
+        self.users = None
+        self.campaigns = None
+
+    def open(self):
+        from dataset import read_campaigns, read_users
+
+        self.users = read_users(columns=['UserID', 'Age', 'Gender', 'Location', 'Interests'])
+        self.campaigns = read_campaigns(columns=['CampaignID', 'CampaignName'])
+
+    def write(self, batch, source_file, end):
+        import load_to_mongodb
+
+        ad_events = load_to_mongodb.prepare_ad_events(batch, self.campaigns)
+        load_to_mongodb.apply_incremental(load_to_mongodb.users_collection, ad_events, self.users,
+                                          impressions=load_to_mongodb.impressions_collection,
+                                          summaries=load_to_mongodb.summaries_collection)
+        return len(ad_events)
+
+    def close(self):
+        pass
+
+
+class IngestService:
+    """Опитування landing-каталогу та доставка мікропакетів у всі приймачі"""
+
+    def __init__(self, sinks, landing_dir=LANDING_DIR, checkpoint_path=CHECKPOINT_PATH,
+                 batch_rows=MICRO_BATCH_ROWS, poll_interval=POLL_INTERVAL, queue_depth=QUEUE_DEPTH,
+                 metrics_path=None):
+        self.sinks = sinks
+        self.landing_dir = landing_dir
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.batch_rows = batch_rows
+        self.poll_interval = poll_interval
+        self.queues = {sink.name: queue.Queue(maxsize=queue_depth) for sink in sinks}
+        self.metrics = ImportMetrics()
+        self.metrics_path = metrics_path
+        self.stopped = threading.Event()
+        self.errors = []
+        # Зміщення, до яких файли вже прочитані в черги (випереджає checkpoint)
+        self.read_offsets = {}
+
+    def next_offset(self, path):
+        """Звідки читати файл далі: після вже поставлених у черги пакетів або з checkpoint"""
+        return max(self.read_offsets.get(path, 0),
+                   self.checkpoint.start_offset(path, [sink.name for sink in self.sinks]))
+
+    def scan(self):
+        """Файли з непрочитаними байтами: [(шлях, settled)] у порядку появи"""
+        files = []
+        for path in glob.glob(os.path.join(self.landing_dir, '*.csv')):
+            stat = os.stat(path)
+            if stat.st_size > self.next_offset(path):
+                settled = time.time() - stat.st_mtime > SETTLE_SECONDS
+                files.append((stat.st_mtime_ns, path, settled))
+        return [(path, settled) for _, path, settled in sorted(files)]
+
+    def put(self, item):
+        """Пакет у черги всіх приймачів; блокується, доки найповільніший не звільнить місце"""
+        for sink_queue in self.queues.values():
+            while not self.stopped.is_set():
+                try:
+                    sink_queue.put(item, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    def read_loop(self, once=False):
+        """Потік читача: опитування каталогу та нарізка нових рядків на мікропакети"""
+        try:
+            while not self.stopped.is_set():
+                found = False
+                for path, settled in self.scan():
+                    for batch, start, end in read_micro_batches(path, self.next_offset(path),
+                                                                self.batch_rows, settled):
+                        found = True
+                        self.metrics.increment('batches')
+                        self.metrics.increment('rows_read', len(batch))
+                        self.put((path, start, end, batch))
+                        self.read_offsets[path] = end
+                        if self.stopped.is_set():
+                            return
+                if once and not found:
+                    return
+                if not found:
+                    self.stopped.wait(self.poll_interval)
+        except Exception as e:
+            self.fail('reader', e)
+        finally:
+            # Кінець потоку для приймачів (режим once або зупинка)
+            for sink_queue in self.queues.values():
+                while True:
+                    try:
+                        sink_queue.put(None, timeout=1)
+                        break
+                    except queue.Full:
+                        if self.stopped.is_set():
+                            break
+
+    def sink_loop(self, sink):
+        """Потік приймача: пакети по черзі, після кожного - фіксація зміщення в checkpoint"""
+        sink_queue = self.queues[sink.name]
+        try:
+            while not self.stopped.is_set():
+                try:
+                    item = sink_queue.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    return
+                path, start, end, batch = item
+                if end <= self.checkpoint.offset(sink.name, path):
+                    continue  # уже записаний до перезапуску
+                started = time.perf_counter()
+                rows = sink.write(batch, path, end)
+                self.metrics.record_batch(sink.name, time.perf_counter() - started, rows)
+                self.checkpoint.ack(sink.name, path, end)
+        except Exception as e:
+            self.fail(sink.name, e)
+
+    def fail(self, name, error):
+        print(f"❌ {name}: {error}")
+        self.errors.append((name, error))
+        self.stopped.set()
+
+    def run(self, once=False):
+        """Запуск до Ctrl+C (або до обробки всіх наявних файлів при once=True)"""
+        for sink in self.sinks:
+            sink.open()
+        threads = [threading.Thread(target=self.sink_loop, args=(sink,), name=sink.name) for sink in self.sinks]
+        threads.append(threading.Thread(target=self.read_loop, args=(once,), name='reader'))
+        for thread in threads:
+            thread.start()
+        print(f"👀 Інгест з {self.landing_dir}: {', '.join(sink.name for sink in self.sinks)}")
+        try:
+            while any(thread.is_alive() for thread in threads):
+                threads[-1].join(timeout=1)
+                if self.metrics_path:
+                    self.metrics.write(self.metrics_path)
+        except KeyboardInterrupt:
+            print("⏹ Зупинка: незафіксовані пакети будуть прочитані повторно після перезапуску")
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            for sink in self.sinks:
+                sink.close()
+            if self.metrics_path:
+                self.metrics.write(self.metrics_path)
+        if self.errors:
+            raise RuntimeError(f"Інгест зупинено через помилки: {', '.join(name for name, _ in self.errors)}")
+        batches = self.metrics.summary()['batches']
+        for name, batch in batches.items():
+            print(f"✅ {name}: {batch['rows']} подій у {batch['batches']} пакетах")
+
+
+if __name__ == "__main__":
+    from transforms_data import config
+
+    parser = argparse.ArgumentParser(description="Безперервний мікропакетний інгест нових файлів подій")
+    parser.add_argument("--landing", default=LANDING_DIR, help="каталог з новими *.csv у форматі ad_events.csv")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--batch-rows", type=int, default=MICRO_BATCH_ROWS)
+    parser.add_argument("--poll", type=float, default=POLL_INTERVAL, help="інтервал опитування, с")
+    parser.add_argument("--queue-depth", type=int, default=QUEUE_DEPTH)
+    parser.add_argument("--no-mysql", action="store_true")
+    parser.add_argument("--no-mongo", action="store_true")
+    parser.add_argument("--once", action="store_true", help="обробити наявні файли та завершитись")
+    parser.add_argument("--metrics", help="файл метрик (*.json або *.prom), оновлюється щосекунди")
+    args = parser.parse_args()
+
+    sinks = []
+    if not args.no_mysql:
+        sinks.append(MySQLSink(config))
+    if not args.no_mongo:
+        sinks.append(MongoSink())
+    if not sinks:
+        parser.error("потрібен хоча б один приймач")
+
+    service = IngestService(sinks, args.landing, args.checkpoint, args.batch_rows, args.poll,
+                            args.queue_depth, args.metrics)
+    service.run(once=args.once)
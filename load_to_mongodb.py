@@ -1,85 +1,638 @@
-import pandas as pd
-from pymongo import MongoClient
-import uuid
-from datetime import datetime
-
-# Connect to MongoDB
-mongo_client = MongoClient("mongodb://mongo:27017/")
-mongodb = mongo_client["adtech"]
-users_collection = mongodb["users_engagement"]
-
-# Load users, ad_events, and campaigns datasets
-users = pd.read_csv("data/raw/users.csv")
-
-columns = [
-    'EventID', 'AdvertiserName', 'CampaignName', 'CampaignStartDate', 'CampaignEndDate',
-    'TargetingCriteria1', 'TargetingCriteria2', 'TargetingCriteria3',
-    'AdSlotSize', 'UserID', 'Device', 'Location', 'Timestamp',
-    'BidAmount', 'AdCost', 'WasClicked', 'ClickTimestamp',
-    'AdRevenue', 'Budget', 'RemainingBudget'
-]
-ad_events = pd.read_csv('data/raw/ad_events.csv', names=columns, nrows=1000, skiprows=1)
-
-# Об'єднуємо три частини TargetingCriteria в один стовпець
-ad_events['TargetingCriteria'] = ad_events[['TargetingCriteria1', 'TargetingCriteria2', 'TargetingCriteria3']].apply(
-    lambda row: ', '.join(row.astype(str)).strip(), axis=1
-)
-
-# Видаляємо зайві колонки
-ad_events.drop(['TargetingCriteria1', 'TargetingCriteria2', 'TargetingCriteria3'], axis=1, inplace=True)
-
-campaigns = pd.read_csv("data/raw/campaigns.csv")
-
-# Preprocess ad events by user and session (simple approach: group by UserID, Device, every 30 minutes == new session)
-ad_events["Timestamp"] = pd.to_datetime(ad_events["Timestamp"])
-ad_events = ad_events.sort_values(["UserID", "Device", "Timestamp"])
-
-def sessionize(df, time_window="30min"):
-    df['session_marker'] = df['Timestamp'].diff().gt(pd.Timedelta(time_window)).cumsum()
-    return df
-
-result_docs = []
-for user_id, user_group in ad_events.groupby("UserID"):
-    user_row = users[users['UserID'] == user_id].iloc[0]
-    # Assign sessions
-    sessions = []
-    for device, device_group in user_group.groupby("Device"):
-        # Sessionize
-        device_group = sessionize(device_group)
-        for session_id, sess_df in device_group.groupby("session_marker"):
-            ad_impressions = []
-            for _, row in sess_df.iterrows():
-                impression = {
-                    "impression_id": str(uuid.uuid4()),
-                    "campaign_id": int(row["CampaignID"]) if "CampaignID" in row and not pd.isna(row["CampaignID"]) else None,
-                    "ad_id": str(row["EventID"]),
-                    "timestamp": row["Timestamp"].isoformat(),
-                    "ad_category": None,  # Optional: map from campaigns if needed
-                    "was_clicked": bool(row["WasClicked"]),
-                }
-                if impression["was_clicked"]:
-                    impression["click"] = {
-                        "click_timestamp": pd.to_datetime(row.get("ClickTimestamp")).isoformat() if pd.notna(row.get("ClickTimestamp")) else None
-                    }
-                ad_impressions.append(impression)
-            sessions.append({
-                "session_id": str(uuid.uuid4()),
-                "device": device,
-                "start_time": sess_df["Timestamp"].min().isoformat(),
-                "ad_impressions": ad_impressions
-            })
-
-    doc = {
-        "user_id": int(user_row.UserID),
-        "age": int(user_row.Age),
-        "gender": user_row.Gender,
-        "location": user_row.Location,
-        "interests": [i.strip() for i in str(user_row.Interests).split(",") if i and i != "nan"],
-        "ad_sessions": sessions
-    }
-    result_docs.append(doc)
-
-# Insert into MongoDB (erase collection first)
-users_collection.drop()
-users_collection.insert_many(result_docs)
-print(f"Inserted {len(result_docs)} user engagement docs into MongoDB")
\ No newline at end of file
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+import uuid
+from datetime import datetime
+
+from dataset import AD_EVENTS_PATH, read_ad_events, read_campaigns, read_users
+
+# Connect to MongoDB
+mongo_client = MongoClient("mongodb://mongo:27017/")
+mongodb = mongo_client["adtech"]
+users_collection = mongodb["users_engagement"]
+impressions_collection = mongodb["ad_impressions"]
+summaries_collection = mongodb["user_summaries"]
+
+# Flat one-document-per-impression collection used by the analyze_mongo aggregations
+IMPRESSION_INDEXES = [
+    [("campaign_id", 1), ("timestamp", 1)],
+    [("user_id", 1), ("ad_id", 1)],
+]
+# Optional time-series layout for ad_impressions (bucketed, columnar-compressed storage)
+IMPRESSION_TIMESERIES = {"timeField": "timestamp", "metaField": "campaign_id", "granularity": "hours"}
+
+# Per-user summaries for single-read lookups: last N session headers,
+# clicks per category and per-ad (campaign) counters with a fatigue flag
+SUMMARY_SESSIONS = 5
+FATIGUE_IMPRESSIONS = 5
+SUMMARY_INDEXES = [
+    ("user_id", {"unique": True}),
+    ("fatigued", {"partialFilterExpression": {"fatigued": True}}),
+]
+# Recompute the fatigue flag server-side after incremental counter updates
+FATIGUE_UPDATE = [
+    {"$set": {"fatigued_ads": {"$map": {
+        "input": {"$filter": {
+            # Users without any known campaign have no ad_stats yet
+            "input": {"$objectToArray": {"$ifNull": ["$ad_stats", {}]}},
+            "as": "ad",
+            "cond": {"$and": [{"$gte": ["$$ad.v.impressions", FATIGUE_IMPRESSIONS]},
+                              {"$eq": ["$$ad.v.clicks", 0]}]},
+        }},
+        "as": "ad",
+        "in": "$$ad.k",
+    }}}},
+    {"$set": {"fatigued": {"$gt": [{"$size": "$fatigued_ads"}, 0]}}},
+]
+
+# Last session end per (user, device), so incremental loads never read documents back
+SESSION_STATE_PATH = "output/session_state.json"
+
+# Session and impression ids are derived from event ids: replaying the same events
+# produces the same documents, so incremental writes can be made idempotent
+ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "adtech/users_engagement")
+# Incremental loads already folded into a user summary (last N markers per user)
+APPLIED_LOADS = 50
+DUPLICATE_KEY = 11000
+
+# Only the event columns used for sessions and impressions are read from the cache
+EVENT_COLUMNS = ['EventID', 'CampaignName', 'TargetingCriteria2', 'UserID', 'Device',
+                 'Timestamp', 'WasClicked', 'ClickTimestamp']
+
+
+def load_ad_events(path=AD_EVENTS_PATH, campaigns=None):
+    return prepare_ad_events(read_ad_events(path, columns=EVENT_COLUMNS), campaigns)
+
+
+def prepare_ad_events(ad_events, campaigns=None):
+    """Shape raw event rows (from the cache or a micro-batch) for sessionizing."""
+    if list(ad_events.columns) != EVENT_COLUMNS:
+        ad_events = ad_events[EVENT_COLUMNS].copy()
+
+    # Ad category is the interest part of the targeting criteria, e.g. "Gaming"
+    # Missing values come back as None from the Parquet cache and NaN from CSV batches
+    category = ad_events['TargetingCriteria2']
+    ad_events['AdCategory'] = category.astype(str).str.strip().astype(object).where(category.notna(), None)
+    if campaigns is not None:
+        ad_events['CampaignID'] = ad_events['CampaignName'].map(
+            dict(zip(campaigns['CampaignName'], campaigns['CampaignID']))
+        )
+
+    ad_events.drop(['TargetingCriteria2'], axis=1, inplace=True)
+    ad_events["Timestamp"] = pd.to_datetime(ad_events["Timestamp"])
+    return ad_events
+
+
+def sessionize(df, time_window="30min"):
+    """Assign session markers for all users and devices in one diff/cumsum pass.
+
+    df must be sorted by UserID, Device, Timestamp. A new session starts on a new
+    (user, device) pair or after a gap longer than time_window.
+    """
+    new_pair = df['UserID'].ne(df['UserID'].shift()) | df['Device'].ne(df['Device'].shift())
+    gap = df['Timestamp'].diff().gt(pd.Timedelta(time_window))
+    df['session_marker'] = (new_pair | gap).cumsum()
+    return df
+
+
+def user_attributes(users):
+    """Indexed user attribute lookup: UserID -> Age, Gender, Location, Interests."""
+    users = users.drop_duplicates("UserID").set_index("UserID")
+    interests = users["Interests"].map(
+        lambda value: [i.strip() for i in value.split(",") if i.strip()] if isinstance(value, str) else []
+    )
+    return users[["Age", "Gender", "Location"]].assign(Interests=interests).to_dict("index")
+
+
+def impression_id(event_id):
+    return str(uuid.uuid5(ID_NAMESPACE, event_id))
+
+
+def iter_sessions(ad_events, time_window="30min"):
+    """Yield (user_id, session, end_time) for every session, ordered by user, device and time."""
+    if ad_events.empty:
+        return
+    # Sort once, then sessionize every (user, device) pair in a single pass
+    ad_events = ad_events.sort_values(["UserID", "Device", "Timestamp"], kind="stable").reset_index(drop=True)
+    ad_events = sessionize(ad_events, time_window)
+
+    # Column arrays; no per-row pandas access below
+    user_ids = ad_events["UserID"].to_numpy()
+    devices = ad_events["Device"].tolist()
+    event_ids = ad_events["EventID"].astype(str).tolist()
+    # Native datetimes are stored as BSON dates
+    timestamps = list(ad_events["Timestamp"].dt.to_pydatetime())
+    was_clicked = ad_events["WasClicked"].astype(bool).tolist()
+    if "CampaignID" in ad_events:
+        campaign_ids = ad_events["CampaignID"].astype("Int64").astype(object).where(
+            ad_events["CampaignID"].notna(), None).tolist()
+    else:
+        campaign_ids = [None] * len(ad_events)
+    if "AdCategory" in ad_events:
+        categories = ad_events["AdCategory"].tolist()
+    else:
+        categories = [None] * len(ad_events)
+    click_timestamps = pd.to_datetime(ad_events["ClickTimestamp"])
+    click_timestamps = [ts.to_pydatetime() if pd.notna(ts) else None for ts in click_timestamps]
+
+    markers = ad_events["session_marker"].to_numpy()
+    session_starts = np.flatnonzero(np.r_[True, markers[1:] != markers[:-1]])
+    session_ends = np.r_[session_starts[1:], len(markers)]
+
+    for start, end in zip(session_starts.tolist(), session_ends.tolist()):
+        ad_impressions = []
+        for i in range(start, end):
+            impression = {
+                "impression_id": impression_id(event_ids[i]),
+                "campaign_id": campaign_ids[i],
+                "ad_id": event_ids[i],
+                "timestamp": timestamps[i],
+                "ad_category": categories[i],
+                "was_clicked": was_clicked[i],
+            }
+            if was_clicked[i]:
+                impression["click"] = {"click_timestamp": click_timestamps[i]}
+            ad_impressions.append(impression)
+        session = {
+            "session_id": str(uuid.uuid5(ID_NAMESPACE, f"session:{event_ids[start]}")),
+            "device": devices[start],
+            "start_time": timestamps[start],
+            "ad_impressions": ad_impressions
+        }
+        yield int(user_ids[start]), session, timestamps[end - 1]
+
+
+def iter_user_documents(ad_events, users, state=None):
+    """Yield one engagement document per user, built from grouped column arrays.
+
+    If state is given, it is filled with the last session of every (user, device)
+    for later incremental loads.
+    """
+    user_attrs = user_attributes(users)
+
+    current_user, sessions = None, []
+    for user_id, session, end_time in iter_sessions(ad_events):
+        if user_id != current_user:
+            if current_user in user_attrs:
+                yield make_user_document(current_user, user_attrs[current_user], sessions)
+            current_user, sessions = user_id, []
+        sessions.append(session)
+        if state is not None:
+            state.setdefault(str(user_id), {})[session["device"]] = {
+                "session_id": session["session_id"], "end_time": end_time.isoformat()
+            }
+
+    if current_user in user_attrs:
+        yield make_user_document(current_user, user_attrs[current_user], sessions)
+
+
+def make_user_document(user_id, attrs, sessions):
+    return {
+        "user_id": user_id,
+        "age": int(attrs["Age"]),
+        "gender": attrs["Gender"],
+        "location": attrs["Location"],
+        "interests": attrs["Interests"],
+        "ad_sessions": sessions
+    }
+
+
+def batched(iterable, size):
+    """Split an iterable into lists of at most size items without materializing it."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def ignore_duplicates(error):
+    """Re-raise a BulkWriteError unless every failed write was a duplicate key (an already applied write)."""
+    if any(write_error["code"] != DUPLICATE_KEY for write_error in error.details["writeErrors"]):
+        raise error
+
+
+def insert_batch(collection, batch):
+    try:
+        return len(collection.insert_many(batch, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        # Replayed impressions keep their _id, so they are skipped instead of duplicated
+        ignore_duplicates(e)
+        return e.details["nInserted"]
+
+
+class BatchWriter:
+    """Buffer documents and write them as unordered insert_many batches.
+
+    At most max_in_flight batches are being written at once, so memory is bounded by
+    (max_in_flight + 1) * batch_size documents regardless of the dataset size.
+    """
+
+    def __init__(self, collection, batch_size=1000, max_in_flight=4):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.batch = []
+        self.in_flight = set()
+        self.written = 0
+
+    def add(self, doc):
+        self.batch.append(doc)
+        if len(self.batch) >= self.batch_size:
+            self.submit()
+
+    def submit(self):
+        if len(self.in_flight) >= self.max_in_flight:
+            done, self.in_flight = wait(self.in_flight, return_when=FIRST_COMPLETED)
+            self.written += sum(future.result() for future in done)
+        self.in_flight.add(self.executor.submit(insert_batch, self.collection, self.batch))
+        self.batch = []
+
+    def close(self):
+        """Write the remaining batch, wait for all in-flight batches and return the total."""
+        if self.batch:
+            self.submit()
+        try:
+            self.written += sum(future.result() for future in self.in_flight)
+        finally:
+            self.in_flight = set()
+            self.executor.shutdown()
+        return self.written
+
+
+def write_documents(collection, docs, batch_size=1000, max_in_flight=4):
+    """Stream docs into collection as unordered insert_many batches."""
+    writer = BatchWriter(collection, batch_size, max_in_flight)
+    for doc in docs:
+        writer.add(doc)
+    return writer.close()
+
+
+def prepare_staging(db, name, indexes):
+    """Empty staging copy of a collection; created explicitly so that an empty rebuild can still be renamed."""
+    staging = db[f"{name}_staging"]
+    staging.drop()
+    db.create_collection(staging.name)
+    for keys, options in indexes:
+        staging.create_index(keys, **options)
+    return staging
+
+
+def rebuild_collection(db, docs, name="users_engagement", batch_size=1000, max_in_flight=4):
+    """Build the collection in a staging copy, then atomically rename it over the live one.
+
+    Readers keep seeing the previous users_engagement until the rebuild is complete.
+    """
+    staging = prepare_staging(db, name, [("user_id", {"unique": True})])
+    written = write_documents(staging, docs, batch_size, max_in_flight)
+    staging.rename(name, dropTarget=True)
+    return written
+
+
+def flatten_impressions(user_id, session_id, ad_impressions):
+    """Flat ad_impressions documents for one session."""
+    return [{
+        "_id": impression["impression_id"],
+        "user_id": user_id,
+        "session_id": session_id,
+        "campaign_id": impression["campaign_id"],
+        "ad_id": impression["ad_id"],
+        "timestamp": impression["timestamp"],
+        "was_clicked": impression["was_clicked"],
+        "category": impression["ad_category"],
+    } for impression in ad_impressions]
+
+
+def create_timeseries_impressions(db):
+    """Recreate ad_impressions as a time-series collection with the usual indexes."""
+    db["ad_impressions"].drop()
+    db.create_collection("ad_impressions", timeseries=IMPRESSION_TIMESERIES)
+    for keys in IMPRESSION_INDEXES:
+        db["ad_impressions"].create_index(keys)
+    return db["ad_impressions"]
+
+
+def session_header(session_id, session):
+    return {
+        "session_id": session_id,
+        "device": session["device"],
+        "start_time": session["start_time"],
+        "num_ads": len(session["ad_impressions"]),
+        "num_clicks": sum(1 for imp in session["ad_impressions"] if imp["was_clicked"]),
+    }
+
+
+def field_key(name):
+    """Summary subdocument key for a category or campaign: '.' and '$' are not allowed in update paths."""
+    return str(name).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def decode_field_key(key):
+    return key.replace("%2E", ".").replace("%24", "$").replace("%25", "%")
+
+
+def is_category(category):
+    """Missing categories arrive as None or as the strings 'nan'/'None' and are not counted."""
+    return isinstance(category, str) and category.strip() not in ("", "nan", "None")
+
+
+def make_user_summary(doc, last_n=SUMMARY_SESSIONS):
+    """Summary document for one user built from the full engagement document."""
+    headers = sorted((session_header(s["session_id"], s) for s in doc["ad_sessions"]),
+                     key=lambda header: header["start_time"])
+    category_clicks = Counter()
+    ad_stats = {}
+    for session in doc["ad_sessions"]:
+        for imp in session["ad_impressions"]:
+            # Counters per campaign: ad_id is the event id and never repeats
+            if imp["campaign_id"] is not None:
+                stats = ad_stats.setdefault(field_key(imp["campaign_id"]), {"impressions": 0, "clicks": 0})
+                stats["impressions"] += 1
+                stats["clicks"] += bool(imp["was_clicked"])
+            if imp["was_clicked"] and is_category(imp["ad_category"]):
+                category_clicks[field_key(imp["ad_category"])] += 1
+    fatigued_ads = [ad_id for ad_id, stats in ad_stats.items()
+                    if stats["impressions"] >= FATIGUE_IMPRESSIONS and stats["clicks"] == 0]
+    return {
+        "user_id": doc["user_id"],
+        "last_sessions": headers[-last_n:],
+        "category_clicks": dict(category_clicks),
+        "ad_stats": ad_stats,
+        "fatigued_ads": fatigued_ads,
+        "fatigued": bool(fatigued_ads),
+    }
+
+
+class SummaryDeltas:
+    """Per-user summary changes collected during an incremental load."""
+
+    def __init__(self):
+        self.users = {}
+
+    def add(self, user_id, session_id, session, extended):
+        delta = self.users.setdefault(user_id, {
+            "sessions": [], "extended": {}, "categories": Counter(), "ads": {}
+        })
+        header = session_header(session_id, session)
+        if extended:
+            counts = delta["extended"].setdefault(session_id, [0, 0])
+            counts[0] += header["num_ads"]
+            counts[1] += header["num_clicks"]
+        else:
+            delta["sessions"].append(header)
+        for imp in session["ad_impressions"]:
+            if imp["campaign_id"] is not None:
+                stats = delta["ads"].setdefault(field_key(imp["campaign_id"]), [0, 0])
+                stats[0] += 1
+                stats[1] += bool(imp["was_clicked"])
+            if imp["was_clicked"] and is_category(imp["ad_category"]):
+                delta["categories"][field_key(imp["ad_category"])] += 1
+
+    def operations(self, load_id, last_n=SUMMARY_SESSIONS):
+        """Counter and session header updates per user, each applied at most once per load_id.
+
+        Every update records its marker in applied_loads and only matches while the marker
+        is absent. A replayed upsert of an existing user fails with a duplicate key error,
+        which the caller ignores. The fatigue flag is recomputed by fatigue_operations.
+        """
+        def applied(marker):
+            return {"applied_loads": {"$each": [marker], "$slice": -APPLIED_LOADS}}
+
+        for user_id, delta in self.users.items():
+            for session_id, (num_ads, num_clicks) in delta["extended"].items():
+                marker = f"{load_id}:{session_id}"
+                yield UpdateOne(
+                    {"user_id": user_id, "applied_loads": {"$ne": marker}},
+                    {"$inc": {"last_sessions.$[s].num_ads": num_ads, "last_sessions.$[s].num_clicks": num_clicks},
+                     "$push": applied(marker)},
+                    array_filters=[{"s.session_id": session_id}]
+                )
+            inc = {f"category_clicks.{category}": clicks for category, clicks in delta["categories"].items()}
+            for ad_id, (impressions, clicks) in delta["ads"].items():
+                inc[f"ad_stats.{ad_id}.impressions"] = impressions
+                inc[f"ad_stats.{ad_id}.clicks"] = clicks
+            update = {"$push": applied(load_id)}
+            if inc:
+                update["$inc"] = inc
+            if delta["sessions"]:
+                update["$push"]["last_sessions"] = {
+                    "$each": delta["sessions"], "$sort": {"start_time": 1}, "$slice": -last_n
+                }
+            yield UpdateOne({"user_id": user_id, "applied_loads": {"$ne": load_id}}, update, upsert=True)
+
+    def fatigue_operations(self):
+        for user_id in self.users:
+            yield UpdateOne({"user_id": user_id}, FATIGUE_UPDATE)
+
+
+def rebuild_engagement(db, ad_events, users, state=None, batch_size=1000, max_in_flight=4, timeseries=False):
+    """Build users_engagement, ad_impressions and user_summaries in one pass, then swap them in.
+
+    Time-series collections cannot be renamed, so with timeseries=True ad_impressions
+    is recreated in place instead of going through a staging copy.
+    """
+    users_writer = BatchWriter(
+        prepare_staging(db, "users_engagement", [("user_id", {"unique": True})]), batch_size, max_in_flight
+    )
+    if timeseries:
+        impressions_target = create_timeseries_impressions(db)
+    else:
+        impressions_target = prepare_staging(db, "ad_impressions", [(keys, {}) for keys in IMPRESSION_INDEXES])
+    impressions_writer = BatchWriter(impressions_target, batch_size, max_in_flight)
+    summaries_writer = BatchWriter(prepare_staging(db, "user_summaries", SUMMARY_INDEXES), batch_size, max_in_flight)
+    try:
+        for doc in iter_user_documents(ad_events, users, state):
+            for session in doc["ad_sessions"]:
+                for impression in flatten_impressions(doc["user_id"], session["session_id"],
+                                                      session["ad_impressions"]):
+                    impressions_writer.add(impression)
+            summaries_writer.add(make_user_summary(doc))
+            users_writer.add(doc)
+    finally:
+        written = users_writer.close(), impressions_writer.close(), summaries_writer.close()
+
+    db["users_engagement_staging"].rename("users_engagement", dropTarget=True)
+    db["user_summaries_staging"].rename("user_summaries", dropTarget=True)
+    if not timeseries:
+        db["ad_impressions_staging"].rename("ad_impressions", dropTarget=True)
+    return written
+
+
+def load_session_state(path=SESSION_STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf8") as f:
+        return json.load(f)
+
+
+def save_session_state(state, path=SESSION_STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def iter_session_updates(ad_events, users, state, time_window="30min", new_impressions=None,
+                         summary_deltas=None):
+    """Yield bulk update operations that fold new events into users_engagement.
+
+    A session that starts no earlier than the end of the cached last session on the
+    same device and within time_window of it extends that session. Other sessions,
+    including late events older than the cached session, are appended to ad_sessions
+    on their own, and users seen
+    for the first time are upserted. Both use $addToSet, so replaying the same events
+    does not duplicate sessions or impressions. state is updated in place.
+    Flat impressions are appended to the new_impressions list and summary changes go to
+    summary_deltas when they are given.
+    """
+    user_attrs = user_attributes(users)
+    window = pd.Timedelta(time_window)
+
+    def append_sessions(user_id, sessions):
+        # $addToSet: a replayed session (same ids and impressions) is not added twice
+        update = {"$addToSet": {"ad_sessions": {"$each": sessions}}}
+        attrs = user_attrs.get(user_id)
+        if attrs is not None:
+            document = make_user_document(user_id, attrs, [])
+            del document["ad_sessions"]
+            update["$setOnInsert"] = document
+        return UpdateOne({"user_id": user_id}, update, upsert=True)
+
+    current_user, new_sessions = None, []
+    for user_id, session, end_time in iter_sessions(ad_events, time_window):
+        if user_id != current_user:
+            if new_sessions:
+                yield append_sessions(current_user, new_sessions)
+            current_user, new_sessions = user_id, []
+
+        user_state = state.get(str(user_id), {})
+        last = user_state.get(session["device"])
+        gap = pd.Timestamp(session["start_time"]) - pd.Timestamp(last["end_time"]) if last else None
+        # A replayed last session has its own session_id and is not folded into itself
+        if last and last["session_id"] != session["session_id"] and pd.Timedelta(0) <= gap <= window:
+            if new_impressions is not None:
+                new_impressions.extend(flatten_impressions(user_id, last["session_id"], session["ad_impressions"]))
+            if summary_deltas is not None:
+                summary_deltas.add(user_id, last["session_id"], session, extended=True)
+            yield UpdateOne(
+                {"user_id": user_id},
+                {"$addToSet": {"ad_sessions.$[s].ad_impressions": {"$each": session["ad_impressions"]}}},
+                array_filters=[{"s.session_id": last["session_id"]}]
+            )
+            last["end_time"] = max(last["end_time"], end_time.isoformat())
+        elif user_state or user_id in user_attrs:
+            if new_impressions is not None:
+                new_impressions.extend(flatten_impressions(user_id, session["session_id"], session["ad_impressions"]))
+            if summary_deltas is not None:
+                summary_deltas.add(user_id, session["session_id"], session, extended=False)
+            new_sessions.append(session)
+            # A late session is stored on its own and does not replace the cached last one
+            if not last or end_time > pd.Timestamp(last["end_time"]):
+                state.setdefault(str(user_id), {})[session["device"]] = {
+                    "session_id": session["session_id"], "end_time": end_time.isoformat()
+                }
+
+    if new_sessions:
+        yield append_sessions(current_user, new_sessions)
+
+
+def drop_loaded_events(impressions, ad_events, chunk_size=1000):
+    """Drop events whose flat impression is already in the impressions collection."""
+    impression_ids = ad_events["EventID"].astype(str).map(impression_id)
+    ids = impression_ids.unique().tolist()
+    loaded = set()
+    for i in range(0, len(ids), chunk_size):
+        loaded.update(doc["_id"] for doc in impressions.find({"_id": {"$in": ids[i:i + chunk_size]}}, {"_id": 1}))
+    if not loaded:
+        return ad_events
+    return ad_events[~impression_ids.isin(loaded)]
+
+
+def apply_incremental(collection, ad_events, users, state_path=SESSION_STATE_PATH, batch_size=1000,
+                      impressions=None, summaries=None):
+    """Upsert sessions for new events; only users active in ad_events are touched.
+
+    New impressions are also appended to the impressions collection and the
+    summaries collection is updated when they are given.
+
+    With an impressions collection, replays are deduplicated per event: flat impressions
+    are written last, after users_engagement and the summaries, so an event whose
+    impression is already there has been fully applied and is dropped. This holds for
+    any batch cut of the same rows. If the process stops before the impressions are
+    written, the unfinished events are applied again: sessions and impressions are added
+    with $addToSet, and summary counters are applied once per load, identified by the
+    set of new event ids. A replay of exactly those rows is therefore safe, while one
+    with a different cut can count them twice in user_summaries.
+    The session state is saved only after all writes.
+    """
+    state = load_session_state(state_path)
+    if impressions is not None:
+        ad_events = drop_loaded_events(impressions, ad_events)
+    load_id = f"{int(pd.util.hash_pandas_object(ad_events['EventID'], index=False).sum()) % 2 ** 64:016x}"
+    new_impressions = [] if impressions is not None else None
+    summary_deltas = SummaryDeltas() if summaries is not None else None
+    updated = 0
+    updates = iter_session_updates(ad_events, users, state, new_impressions=new_impressions,
+                                   summary_deltas=summary_deltas)
+    for ops in batched(updates, batch_size):
+        collection.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    if summary_deltas is not None:
+        # The unique user_id index turns a replayed upsert into a duplicate key error instead of a second summary
+        for keys, options in SUMMARY_INDEXES:
+            summaries.create_index(keys, **options)
+        for ops in batched(summary_deltas.operations(load_id), batch_size):
+            try:
+                summaries.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                ignore_duplicates(e)
+        # The fatigue flag is recomputed after all counters are updated
+        for ops in batched(summary_deltas.fatigue_operations(), batch_size):
+            summaries.bulk_write(ops, ordered=False)
+    if new_impressions:
+        # Last write: from here on the events count as loaded
+        impressions_writer = BatchWriter(impressions, batch_size)
+        try:
+            for impression in new_impressions:
+                impressions_writer.add(impression)
+        finally:
+            impressions_writer.close()
+    save_session_state(state, state_path)
+    return updated
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load user engagement documents into MongoDB")
+    parser.add_argument("--incremental", metavar="EVENTS_CSV",
+                        help="upsert sessions for new events instead of rebuilding the collection")
+    parser.add_argument("--timeseries", action="store_true",
+                        help="store ad_impressions as a MongoDB time-series collection")
+    args = parser.parse_args()
+
+    # Load users, ad_events, and campaigns datasets
+    users = read_users(columns=["UserID", "Age", "Gender", "Location", "Interests"])
+    campaigns = read_campaigns(columns=["CampaignID", "CampaignName"])
+
+    if args.incremental:
+        ad_events = load_ad_events(args.incremental, campaigns)
+        updated = apply_incremental(users_collection, ad_events, users,
+                                    impressions=impressions_collection, summaries=summaries_collection)
+        print(f"Applied {updated} session updates to users_engagement")
+        raise SystemExit
+
+    ad_events = load_ad_events(campaigns=campaigns)
+
+    # Stream documents into staging collections and swap them in when complete
+    state = {}
+    inserted, impressions, _ = rebuild_engagement(mongodb, ad_events, users, state, timeseries=args.timeseries)
+    save_session_state(state)
+    print(f"Inserted {inserted} user engagement docs and {impressions} ad impressions into MongoDB")
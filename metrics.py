@@ -0,0 +1,294 @@
+import cProfile
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+PROFILE_DIR = 'output/profiles'
+PERCENTILES = (50, 95, 99)
+STATUS_PATH = '/proc/self/status'
+CLEAR_REFS_PATH = '/proc/self/clear_refs'
+# Період заміру RSS фоновим потоком, поки триває хоча б один етап
+RSS_SAMPLE_SECONDS = 0.05
+
+# Найбільший VmHWM перед скиданнями: після clear_refs ru_maxrss теж рахується від нуля
+_peak_before_reset_kb = 0
+
+
+def read_rss_kb():
+    """Поточний (VmRSS) і піковий (VmHWM) RSS процесу в КБ або None, якщо /proc недоступний"""
+    try:
+        with open(STATUS_PATH, encoding='ascii') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(fields['VmRSS'].split()[0]), int(fields['VmHWM'].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def reset_peak_rss(hwm_kb):
+    """Скидання VmHWM до поточного RSS (запис '5' у clear_refs); False, якщо ядро не дозволяє"""
+    global _peak_before_reset_kb
+    _peak_before_reset_kb = max(_peak_before_reset_kb, hwm_kb)
+    try:
+        with open(CLEAR_REFS_PATH, 'w', encoding='ascii') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Піковий RSS процесу з початку роботи (ru_maxrss у КБ на Linux, з урахуванням скидань VmHWM)"""
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, _peak_before_reset_kb)
+    return round(peak_kb / 1024, 1)
+
+
+class RssMonitor:
+    """Піковий RSS окремих етапів, зокрема вкладених і паралельних.
+
+    На початку і в кінці кожного етапу та кожні interval секунд між ними знімається замір:
+    VmHWM з подальшим скиданням через clear_refs, тобто точний пік з попереднього заміру.
+    Пік етапу - максимум замірів, знятих, поки він триває. Якщо скидання недоступне,
+    заміром є поточний VmRSS, і короткі сплески між замірами не враховуються.
+    Один екземпляр на процес (RSS_MONITOR): VmHWM спільний для всіх потоків.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.active = {}
+        self.next_token = 0
+        self.resettable = None
+        self.thread = None
+
+    def sample(self):
+        """Замір під self.lock: оновлює пік усіх активних етапів"""
+        rss = read_rss_kb()
+        if rss is None:
+            return None
+        current, hwm = rss
+        if self.resettable is None:
+            # Перший замір: пік до нього належить не етапам, а всьому процесу
+            self.resettable = reset_peak_rss(hwm)
+            peak = current
+        elif self.resettable:
+            self.resettable = reset_peak_rss(hwm)
+            peak = hwm
+        else:
+            peak = current
+        for token, stage_peak in self.active.items():
+            self.active[token] = max(stage_peak, peak)
+        return current
+
+    def begin(self):
+        """Початок етапу; повертає токен для end()"""
+        with self.lock:
+            current = self.sample()
+            self.next_token += 1
+            self.active[self.next_token] = current
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='rss-monitor', daemon=True)
+                self.thread.start()
+            return self.next_token
+
+    def end(self, token):
+        """Кінець етапу: пік RSS за час етапу в МБ або None без /proc"""
+        with self.lock:
+            self.sample()
+            peak = self.active.pop(token)
+        return round(peak / 1024, 1) if peak is not None else None
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.active:
+                    self.thread = None
+                    return
+                self.sample()
+
+
+RSS_MONITOR = RssMonitor()
+
+
+class ImportMetrics:
+    """Метрики імпорту: час і рядки по етапах, латентність пакетів по таблицях, лічильники.
+
+    profile задає профілювання окремих етапів: {'назва етапу': 'cprofile' | 'tracemalloc'}.
+    cProfile і tracemalloc глобальні для процесу, тому одночасно профілюється лише один етап
+    і лише в головному потоці: вкладені етапи входять у профіль зовнішнього, а виклики етапу
+    з потоків пулу не профілюються (лічильник profile_skipped у звіті етапу).
+    peak_rss_mb етапу - пік RSS процесу, поки етап тривав (див. RssMonitor); паралельні етапи
+    бачать спільну пам'ять процесу. Загальний peak_rss_mb - пік за весь час роботи.
+    Звіт пишеться у JSON або у текстовому форматі Prometheus (файл *.prom).
+    Методи потокобезпечні: пакети вставляються і з кількох потоків пулу.
+    """
+
+    def __init__(self, profile=None, profile_dir=PROFILE_DIR):
+        self.profile = profile or {}
+        self.profile_dir = profile_dir
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = defaultdict(lambda: {'calls': 0, 'seconds': 0.0, 'rows': 0})
+        self.batches = defaultdict(list)
+        self.batch_rows = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+        # Етап, що зараз профілюється (профайлери глобальні, активний лише один)
+        self.profiling = None
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Замір етапу; кількість рядків можна задати після виконання через record['rows']"""
+        record = {'rows': rows}
+        rss_token = RSS_MONITOR.begin()
+        profiler = self.start_profiler(name)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            extra = self.stop_profiler(profiler)
+            peak_rss = RSS_MONITOR.end(rss_token)
+            with self.lock:
+                stage = self.stages[name]
+                stage['calls'] += 1
+                stage['seconds'] += seconds
+                stage['rows'] += record['rows'] or 0
+                if peak_rss is not None:
+                    stage['peak_rss_mb'] = max(stage.get('peak_rss_mb', 0), peak_rss)
+                if name in self.profile and profiler is None:
+                    stage['profile_skipped'] = stage.get('profile_skipped', 0) + 1
+                stage.update(extra)
+
+    def record_batch(self, table, seconds, rows):
+        with self.lock:
+            self.batches[table].append(seconds)
+            self.batch_rows[table] += rows
+
+    def increment(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] += value
+
+    def start_profiler(self, name):
+        """Початок профілювання етапу: (назва, режим, профайлер) або None, якщо етап не профілюється"""
+        mode = self.profile.get(name)
+        if not mode or threading.current_thread() is not threading.main_thread():
+            return None
+        with self.lock:
+            if self.profiling is not None:
+                return None
+            self.profiling = name
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return name, mode, profiler
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        return name, mode, started
+
+    def stop_profiler(self, profiler):
+        """Зупинка профілювання етапу; повертає додаткові поля для звіту"""
+        if profiler is None:
+            return {}
+        name, mode, state = profiler
+        try:
+            if mode == 'cprofile':
+                state.disable()
+                os.makedirs(self.profile_dir, exist_ok=True)
+                path = os.path.join(self.profile_dir, f'{name}.prof')
+                state.dump_stats(path)
+                return {'cprofile': path}
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+            if state:
+                tracemalloc.stop()
+            return {'tracemalloc_peak_mb': round(peak / 2 ** 20, 1),
+                    'tracemalloc_top': [str(stat) for stat in top]}
+        finally:
+            with self.lock:
+                self.profiling = None
+
+    def summary(self):
+        with self.lock:
+            stages = {}
+            for name, stage in self.stages.items():
+                stages[name] = dict(stage, seconds=round(stage['seconds'], 4),
+                                    rows_per_sec=round(stage['rows'] / stage['seconds'])
+                                    if stage['rows'] and stage['seconds'] > 0 else None)
+            batches = {}
+            for table, latencies in self.batches.items():
+                latencies = np.asarray(latencies)
+                seconds = float(latencies.sum())
+                batches[table] = {
+                    'batches': len(latencies),
+                    'rows': self.batch_rows[table],
+                    'seconds': round(seconds, 4),
+                    'rows_per_sec': round(self.batch_rows[table] / seconds) if seconds > 0 else None,
+                    **{f'p{p}_ms': round(float(np.percentile(latencies, p)) * 1000, 2) for p in PERCENTILES},
+                    'max_ms': round(float(latencies.max()) * 1000, 2),
+                }
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'total_seconds': round(time.perf_counter() - self.start, 4),
+                'peak_rss_mb': peak_rss_mb(),
+                'counters': dict(self.counters),
+                'stages': stages,
+                'batches': batches,
+            }
+
+    def to_prometheus(self):
+        """Звіт у текстовому форматі Prometheus (для node_exporter textfile collector)"""
+        summary = self.summary()
+        lines = [
+            '# HELP adtech_import_seconds Wall time of the whole import',
+            '# TYPE adtech_import_seconds gauge',
+            f"adtech_import_seconds {summary['total_seconds']}",
+            '# HELP adtech_import_peak_rss_bytes Peak resident set size of the import process',
+            '# TYPE adtech_import_peak_rss_bytes gauge',
+            f"adtech_import_peak_rss_bytes {int(summary['peak_rss_mb'] * 2 ** 20)}",
+            '# HELP adtech_import_stage_seconds Wall time per import stage',
+            '# TYPE adtech_import_stage_seconds gauge',
+        ]
+        lines += [f'adtech_import_stage_seconds{{stage="{name}"}} {stage["seconds"]}'
+                  for name, stage in summary['stages'].items()]
+        lines += ['# HELP adtech_import_stage_rows Rows processed per import stage',
+                  '# TYPE adtech_import_stage_rows gauge']
+        lines += [f'adtech_import_stage_rows{{stage="{name}"}} {stage["rows"]}'
+                  for name, stage in summary['stages'].items()]
+        lines += ['# HELP adtech_import_stage_peak_rss_bytes Peak resident set size while the stage ran',
+                  '# TYPE adtech_import_stage_peak_rss_bytes gauge']
+        lines += [f'adtech_import_stage_peak_rss_bytes{{stage="{name}"}} {int(stage["peak_rss_mb"] * 2 ** 20)}'
+                  for name, stage in summary['stages'].items() if 'peak_rss_mb' in stage]
+        lines += ['# HELP adtech_import_batch_seconds Insert batch latency per table',
+                  '# TYPE adtech_import_batch_seconds summary']
+        for table, batch in summary['batches'].items():
+            lines += [f'adtech_import_batch_seconds{{table="{table}",quantile="{p / 100}"}} '
+                      f'{round(batch[f"p{p}_ms"] / 1000, 6)}' for p in PERCENTILES]
+            lines += [f'adtech_import_batch_seconds_sum{{table="{table}"}} {batch["seconds"]}',
+                      f'adtech_import_batch_seconds_count{{table="{table}"}} {batch["batches"]}']
+        lines += ['# HELP adtech_import_table_rows Rows sent to the database per table',
+                  '# TYPE adtech_import_table_rows counter']
+        lines += [f'adtech_import_table_rows{{table="{table}"}} {batch["rows"]}'
+                  for table, batch in summary['batches'].items()]
+        for counter, value in summary['counters'].items():
+            lines += [f'# TYPE adtech_import_{counter}_total counter', f'adtech_import_{counter}_total {value}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Запис звіту: *.prom - формат Prometheus, інакше JSON"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith('.prom'):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+from sqlalchemy import text
+
+CACHE_DIR = 'output/report_cache'
+
+# Watermark інгесту: максимальний timestamp подій, лічильник завантажень (накопичувальна
+# сума rows_loaded - змінюється з кожним завантаженням, але не є кількістю рядків у ad_events)
+# та версія даних, яку імпортер збільшує при записі довідників і rollup.
+# Береться з контрольних таблиць імпортера, а не з ad_events, щоб не сканувати події.
+WATERMARK_SQL = '''
+    SELECT (SELECT MAX(max_timestamp) FROM import_watermarks),
+           (SELECT SUM(rows_loaded) FROM import_watermarks),
+           (SELECT MAX(version) FROM data_version)
+'''
+
+
+class ReportCache:
+    """Кеш результатів звітних запитів у Parquet, прив'язаний до watermark інгесту.
+
+    Ключ запису: текст запиту, параметри та watermark. Коли watermark змінюється,
+    старі записи видаляються; кількість записів обмежена max_entries (LRU).
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=64):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def current_watermark(self, engine):
+        """Поточний watermark інгесту як рядок"""
+        with engine.connect() as conn:
+            max_timestamp, loads, version = conn.execute(text(WATERMARK_SQL)).one()
+        return f'{max_timestamp}|{loads}|{version}'
+
+    def entry_path(self, sql, params, watermark):
+        """Шлях до файлу кешу: <hash watermark>-<hash запиту й параметрів>.parquet"""
+        watermark_hash = hashlib.sha256(watermark.encode()).hexdigest()[:16]
+        query_key = json.dumps([str(sql), params], sort_keys=True, default=str)
+        query_hash = hashlib.sha256(query_key.encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f'{watermark_hash}-{query_hash}.parquet')
+
+    def expire(self, watermark):
+        """Видалення записів, створених для іншого watermark"""
+        prefix = os.path.basename(self.entry_path('', None, watermark)).split('-')[0]
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.parquet') and not name.startswith(prefix):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def evict(self):
+        """Обмеження розміру кешу: видаляються найдавніше використані записи"""
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                   if name.endswith('.parquet')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - self.max_entries]:
+            os.remove(path)
+
+    def read_sql(self, sql, engine, params=None, watermark=None):
+        """pd.read_sql з кешем: повторний запуск без нових даних читає лише Parquet-файл"""
+        if watermark is None:
+            watermark = self.current_watermark(engine)
+        self.expire(watermark)
+
+        path = self.entry_path(sql, params, watermark)
+        if os.path.exists(path):
+            os.utime(path)  # позначка останнього використання для LRU
+            return pd.read_parquet(path)
+
+        df = pd.read_sql(sql, engine, params=params)
+        tmp_path = path + '.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        self.evict()
+        return df
@@ -0,0 +1,203 @@
+import argparse
+import datetime
+import re
+
+import duckdb
+import pandas as pd
+
+import dataset
+
+# Вбудований рушій звітів: ті самі queries з homework2.py виконуються в DuckDB
+# над сирими CSV або Parquet-кешем, без сервера MySQL. Таблиці схеми відтворюються
+# як view з тими ж назвами та колонками, що й після імпорту transforms_data.py.
+
+PARAM_PATTERN = re.compile(r'(?<!:):(\w+)')
+
+# Сирі джерела: Parquet-кеш dataset.py або CSV напряму через read_csv DuckDB
+SOURCES = {
+    'parquet': {
+        'ad_events': lambda: f"read_parquet('{dataset.build_cache(dataset.AD_EVENTS_PATH, dataset.AD_EVENTS_CSV)}')",
+        'campaigns': lambda: f"read_parquet('{dataset.build_cache(dataset.CAMPAIGNS_PATH, dataset.CAMPAIGNS_CSV)}')",
+        'users': lambda: f"read_parquet('{dataset.build_cache(dataset.USERS_PATH, dataset.USERS_CSV)}')",
+    },
+    'csv': {
+        'ad_events': lambda: (f"read_csv('{dataset.AD_EVENTS_PATH}', header=false, skip=1, "
+                              f"columns={duckdb_columns(dataset.AD_EVENTS_DTYPES)})"),
+        'campaigns': lambda: (f"read_csv('{dataset.CAMPAIGNS_PATH}', header=true, "
+                              f"columns={duckdb_columns(dataset.CAMPAIGNS_DTYPES)})"),
+        'users': lambda: (f"read_csv('{dataset.USERS_PATH}', header=true, "
+                          f"columns={duckdb_columns(dataset.USERS_DTYPES)})"),
+    },
+}
+
+# Схема як після імпорту: кампанії без рекламодавця або з порожніми полями відкидаються
+# (dropna у transform_campaigns), події - без відомої кампанії або з EventID не у форматі UUID
+# (transform_ad_events_and_clicks), з дублікатів event_id лишається перша подія (INSERT IGNORE),
+# ID рекламодавців - у порядку першої появи в campaigns.csv. Кілька кампаній з однією назвою:
+# події отримують найбільший campaign_id, як мапінг fetch_name_mapping у MySQL.
+# Користувачі та події без Location не імпортуються (location_id NOT NULL), тому JOIN locations внутрішній.
+# event_id - 16-байтний BLOB, як BINARY(16) у MySQL; location_id - з довідника locations
+SCHEMA_VIEWS = '''
+CREATE OR REPLACE VIEW advertisers AS
+SELECT ROW_NUMBER() OVER (ORDER BY first_row) AS advertiser_id, advertiser_name
+FROM (SELECT AdvertiserName AS advertiser_name, MIN(row_no) AS first_row
+      FROM (SELECT *, ROW_NUMBER() OVER () AS row_no FROM raw_campaigns)
+      WHERE AdvertiserName IS NOT NULL
+      GROUP BY AdvertiserName);
+
+CREATE OR REPLACE VIEW campaigns AS
+SELECT c.CampaignID AS campaign_id, a.advertiser_id, c.CampaignName AS campaign_name,
+       CAST(c.CampaignStartDate AS DATE) AS start_date, CAST(c.CampaignEndDate AS DATE) AS end_date,
+       c.TargetingCriteria AS targeting_criteria, c.AdSlotSize AS ad_slot_size,
+       c.Budget AS budget, c.RemainingBudget AS remaining_budget
+FROM raw_campaigns c
+JOIN advertisers a ON a.advertiser_name = c.AdvertiserName
+WHERE c.CampaignID IS NOT NULL AND c.CampaignName IS NOT NULL
+  AND c.CampaignStartDate IS NOT NULL AND c.CampaignEndDate IS NOT NULL
+  AND c.TargetingCriteria IS NOT NULL AND c.AdSlotSize IS NOT NULL
+  AND c.Budget IS NOT NULL AND c.RemainingBudget IS NOT NULL;
+
+CREATE OR REPLACE VIEW locations AS
+SELECT ROW_NUMBER() OVER (ORDER BY location_name) AS location_id, location_name
+FROM (SELECT Location AS location_name FROM raw_users
+      UNION
+      SELECT Location FROM raw_ad_events)
+WHERE location_name IS NOT NULL;
+
+CREATE OR REPLACE VIEW users AS
+SELECT u.UserID AS user_id, u.Age AS age, u.Gender AS gender, l.location_id,
+       CAST(u.SignupDate AS DATE) AS signup_date
+FROM raw_users u
+JOIN locations l ON l.location_name = u.Location
+QUALIFY ROW_NUMBER() OVER (PARTITION BY u.UserID) = 1;
+
+CREATE OR REPLACE VIEW events_deduplicated AS
+SELECT e.*, c.campaign_id, l.location_id
+FROM (SELECT *, ROW_NUMBER() OVER () AS row_no FROM raw_ad_events) e
+JOIN (SELECT campaign_name, MAX(campaign_id) AS campaign_id FROM campaigns GROUP BY campaign_name) c
+  ON c.campaign_name = e.CampaignName
+JOIN locations l ON l.location_name = e.Location
+WHERE regexp_full_match(e.EventID, '[0-9a-fA-F]{8}(-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}')
+QUALIFY ROW_NUMBER() OVER (PARTITION BY lower(e.EventID) ORDER BY e.row_no) = 1;
+
+CREATE OR REPLACE VIEW ad_events AS
+SELECT unhex(replace(e.EventID, '-', '')) AS event_id, e.campaign_id, e.UserID AS user_id, e.Device AS device,
+       e.location_id, CAST(e.Timestamp AS TIMESTAMP) AS timestamp, e.BidAmount AS bid_amount,
+       e.AdCost AS ad_cost, e.AdRevenue AS ad_revenue
+FROM events_deduplicated e;
+
+CREATE OR REPLACE VIEW clicks AS
+SELECT ROW_NUMBER() OVER () AS click_id, unhex(replace(EventID, '-', '')) AS event_id,
+       CAST(ClickTimestamp AS TIMESTAMP) AS click_timestamp
+FROM events_deduplicated
+WHERE WasClicked AND ClickTimestamp IS NOT NULL;
+
+CREATE OR REPLACE VIEW ad_events_daily_rollup AS
+SELECT ae.campaign_id, CAST(ae.timestamp AS DATE) AS day, ae.device, ae.location_id,
+       COUNT(*) AS impressions, COUNT(cl.event_id) AS clicks,
+       ROUND(SUM(ae.ad_cost), 2) AS cost_sum, ROUND(SUM(ae.ad_revenue), 2) AS revenue_sum
+FROM ad_events ae
+LEFT JOIN (SELECT DISTINCT event_id FROM clicks) cl ON ae.event_id = cl.event_id
+GROUP BY ae.campaign_id, CAST(ae.timestamp AS DATE), ae.device, ae.location_id;
+'''
+
+
+DUCKDB_TYPES = {'object': 'VARCHAR', 'int64': 'BIGINT', 'Int64': 'BIGINT', 'float64': 'DOUBLE', 'bool': 'BOOLEAN'}
+
+
+def duckdb_columns(dtypes):
+    """Явні типи колонок для read_csv з тих самих dtypes, що й у dataset.py"""
+    return '{' + ', '.join(f"'{name}': '{DUCKDB_TYPES[dtype]}'" for name, dtype in dtypes.items()) + '}'
+
+
+def to_duckdb_sql(sql):
+    """Іменовані параметри SQLAlchemy (:name) -> DuckDB ($name)"""
+    return PARAM_PATTERN.sub(r'$\1', sql)
+
+
+def to_duckdb_params(params):
+    """Дати з рядків 'YYYY-MM-DD' передаються як DATE, щоб порівняння з DATE/TIMESTAMP були типізовані"""
+    converted = {}
+    for key, value in params.items():
+        try:
+            converted[key] = datetime.date.fromisoformat(value)
+        except (TypeError, ValueError):
+            converted[key] = value
+    return converted
+
+
+class EmbeddedReportEngine:
+    """DuckDB над сирими файлами: багатопотокові колонкові скани на одній машині"""
+
+    def __init__(self, source='parquet', threads=None, database=':memory:'):
+        self.connection = duckdb.connect(database)
+        if threads:
+            self.connection.execute(f'SET threads = {int(threads)}')
+        for table, relation in SOURCES[source].items():
+            self.connection.execute(f'CREATE OR REPLACE VIEW raw_{table} AS SELECT * FROM {relation()}')
+        self.connection.execute(SCHEMA_VIEWS)
+
+    def read_sql(self, sql, params=None):
+        """Аналог pd.read_sql для запитів з homework2.queries"""
+        sql = to_duckdb_sql(str(sql))
+        used = set(re.findall(r'\$(\w+)', sql))
+        params = {key: value for key, value in to_duckdb_params(params or {}).items() if key in used}
+        return self.connection.execute(sql, params).df()
+
+    def run(self, queries, params):
+        return {key: self.read_sql(sql, params) for key, sql in queries.items()}
+
+    def close(self):
+        self.connection.close()
+
+
+def frames_equal(expected, actual, rtol=1e-4):
+    """Порівняння звітів без урахування типів (Decimal з MySQL проти float з DuckDB)"""
+    expected = expected.apply(pd.to_numeric, errors='ignore')
+    actual = actual.apply(pd.to_numeric, errors='ignore')
+    try:
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual.reset_index(drop=True),
+                                      check_dtype=False, check_exact=False, rtol=rtol)
+    except AssertionError:
+        return False
+    return True
+
+
+def check_parity(report, sql_engine, queries, params):
+    """Звіти вбудованого рушія проти тих самих запитів у MySQL; повертає назви розбіжних звітів"""
+    from sqlalchemy import text
+
+    mismatched = []
+    for key, sql in queries.items():
+        expected = pd.read_sql(text(sql), sql_engine, params=params)
+        if frames_equal(expected, report[key]):
+            print(f"✅ {key}: збігається з MySQL ({len(expected)} рядків)")
+        else:
+            mismatched.append(key)
+            print(f"❌ {key}: розбіжність з MySQL\n--- MySQL ---\n{expected}\n--- DuckDB ---\n{report[key]}")
+    return mismatched
+
+
+if __name__ == "__main__":
+    from homework2 import params, queries
+
+    parser = argparse.ArgumentParser(description="Звіт homework2 без MySQL: DuckDB над CSV або Parquet-кешем")
+    parser.add_argument("--source", choices=sorted(SOURCES), default="parquet")
+    parser.add_argument("--threads", type=int, default=None, help="потоки DuckDB (за замовчуванням усі ядра)")
+    parser.add_argument("--out", default="output/report_embedded.xlsx")
+    parser.add_argument("--parity", action="store_true", help="порівняти кожен звіт з MySQL")
+    args = parser.parse_args()
+
+    engine = EmbeddedReportEngine(args.source, args.threads)
+    report = engine.run(queries, params)
+    engine.close()
+
+    with pd.ExcelWriter(args.out) as writer:
+        for key, df in report.items():
+            df.to_excel(writer, sheet_name=key[:30], index=False)
+    print(f"✅ Звіт записано: {args.out}")
+
+    if args.parity:
+        from homework2 import engine as mysql_engine
+        mismatched = check_parity(report, mysql_engine, queries, params)
+        raise SystemExit(1 if mismatched else 0)
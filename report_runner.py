@@ -0,0 +1,336 @@
+import argparse
+import csv
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+from sqlalchemy import text
+
+# Паралельний запуск звітних запитів: кожен запит читається окремим з'єднанням пулу
+# через серверний курсор (stream_results) чанками по chunksize рядків. Чанки з усіх
+# запитів проходять через обмежену чергу до одного потоку запису, який за один прохід
+# пише аркуші xlsx (openpyxl write-only) та, за потреби, CSV і Parquet.
+# Пам'ять обмежена чергою, а не розміром результатів; час звіту ~ найдовший запит.
+
+# Чанків у черзі між запитами та записом: повільний запис пригальмовує читання
+QUEUE_DEPTH = 8
+# Ліміт рядків аркуша Excel (разом із заголовком); далі результат продовжується на новому аркуші
+EXCEL_MAX_ROWS = 1_048_576
+# Рядків, які ParquetSink накопичує, доки в колонці лише NULL і її тип невідомий;
+# далі такі колонки пишуться рядками (string)
+SCHEMA_SAMPLE_ROWS = 100_000
+
+
+def resolve_schema(tables, unknown=None):
+    """Схема результату за накопиченими чанками: тип колонки - з першого чанку, де вона не NULL.
+
+    Колонки без жодного значення отримують тип unknown; якщо unknown=None, повертається None
+    (схема ще невідома). DECIMAL розширюється до precision 38, щоб вмістити значення всіх чанків.
+    """
+    fields = []
+    for i, name in enumerate(tables[0].column_names):
+        types = [table.schema.field(i).type for table in tables
+                 if table.num_rows and not pa.types.is_null(table.schema.field(i).type)]
+        if types:
+            field_type = types[0]
+            if pa.types.is_decimal(field_type):
+                field_type = pa.decimal128(38, field_type.scale)
+        elif unknown is not None:
+            field_type = unknown
+        else:
+            return None
+        fields.append(pa.field(name, field_type))
+    return pa.schema(fields)
+
+
+def chunk_rows(chunk):
+    """Рядки чанку для openpyxl: NaN/NaT -> порожня клітинка"""
+    return chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+class WorkbookSink:
+    """Аркуші xlsx у write-only режимі openpyxl: рядки пишуться у файл одразу, а не тримаються в пам'яті"""
+
+    def __init__(self, path, keys):
+        self.path = path
+        # Книга пишеться поруч і замінює звіт лише повністю записаною
+        self.tmp_path = path + '.tmp'
+        self.workbook = Workbook(write_only=True)
+        # Аркуші створюються наперед, щоб їхній порядок не залежав від того, який запит завершився першим
+        self.sheets = {key: {'sheet': self.workbook.create_sheet(key[:30]), 'rows': 0, 'parts': 1} for key in keys}
+
+    def write(self, key, chunk):
+        state = self.sheets[key]
+        if state['rows'] == 0:
+            state['sheet'].append(list(chunk.columns))
+            state['rows'] = 1
+        for row in chunk_rows(chunk):
+            if state['rows'] == EXCEL_MAX_ROWS:
+                state['parts'] += 1
+                state['sheet'] = self.workbook.create_sheet(f"{key[:26]}_{state['parts']}")
+                state['sheet'].append(list(chunk.columns))
+                state['rows'] = 1
+            state['sheet'].append(row)
+            state['rows'] += 1
+
+    def finish(self, key, failed=False):
+        pass
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        try:
+            self.workbook.save(self.tmp_path)
+        finally:
+            self.workbook.close()
+
+    def close(self):
+        self.save()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        """Звіт без збереження. Тимчасові файли аркушів openpyxl видаляє лише під час save,
+        тому книга записується у тимчасовий файл, який потім видаляється"""
+        try:
+            self.save()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+class CsvSink:
+    """CSV на кожен запит: заголовок з першого чанку, далі дописування"""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.files = {}
+        os.makedirs(out_dir, exist_ok=True)
+
+    def write(self, key, chunk):
+        if key not in self.files:
+            f = open(os.path.join(self.out_dir, f'{key}.csv'), 'w', encoding='utf-8', newline='')
+            self.files[key] = f
+            csv.writer(f).writerow(chunk.columns)
+        chunk.to_csv(self.files[key], header=False, index=False)
+
+    def finish(self, key, failed=False):
+        f = self.files.pop(key, None)
+        if f:
+            f.close()
+
+    def close(self):
+        for key in list(self.files):
+            self.finish(key)
+
+
+class ParquetSink:
+    """Parquet на кожен запит (один row group на чанк); файл з'являється лише після останнього чанку.
+
+    Тип колонки береться з першого чанку, де вона не NULL (колонка лише з NULL у першому чанку
+    або int, що в наступному чанку став float через NULL, не ламають запис): поки тип невідомий,
+    чанки накопичуються, далі кожен чанк приводиться до схеми файлу.
+    Порожній результат теж дає файл, щоб кеш і Parquet-вихід були й для нього.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.writers = {}
+        self.pending = {}
+
+    def open(self, key, schema):
+        os.makedirs(os.path.dirname(self.paths[key]) or '.', exist_ok=True)
+        writer = self.writers[key] = pq.ParquetWriter(self.paths[key] + '.tmp', schema)
+        for table in self.pending.pop(key, []):
+            writer.write_table(table.cast(schema))
+
+    def write(self, key, chunk):
+        if key not in self.paths:
+            return
+        table = pa.Table.from_pandas(chunk, preserve_index=False).replace_schema_metadata()
+        writer = self.writers.get(key)
+        if writer is not None:
+            writer.write_table(table.cast(writer.schema))
+            return
+        pending = self.pending.setdefault(key, [])
+        pending.append(table)
+        sampled = sum(table.num_rows for table in pending) >= SCHEMA_SAMPLE_ROWS
+        schema = resolve_schema(pending, pa.string() if sampled else None)
+        if schema is not None:
+            self.open(key, schema)
+
+    def finish(self, key, failed=False):
+        if key in self.paths and key not in self.writers and not failed:
+            pending = self.pending.get(key)
+            self.open(key, resolve_schema(pending, pa.null()) if pending else pa.schema([]))
+        self.pending.pop(key, None)
+        writer = self.writers.pop(key, None)
+        if writer is None:
+            return
+        writer.close()
+        if failed:
+            os.remove(self.paths[key] + '.tmp')
+        else:
+            os.replace(self.paths[key] + '.tmp', self.paths[key])
+
+    def close(self):
+        for key in list(self.writers) + list(self.pending):
+            self.finish(key, failed=True)
+
+
+class ReportRunner:
+    """Паралельне виконання незалежних звітних запитів із потоковим записом результатів.
+
+    engine має підтримувати серверні курсори (mysql+pymysql): інакше stream_results
+    ігнорується і результат буферизується цілком. cache - ReportCache: закешовані
+    результати читаються з Parquet, нові - записуються в кеш у тому ж проході.
+    """
+
+    def __init__(self, engine, queries, params, workers=None, chunksize=50_000, cache=None):
+        self.engine = engine
+        self.queries = queries
+        self.params = params
+        self.workers = workers or len(queries)
+        self.chunksize = chunksize
+        self.cache = cache
+
+    def iter_query(self, sql):
+        """Результат запиту чанками через серверний курсор"""
+        with self.engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True, max_row_buffer=self.chunksize)
+            yield from pd.read_sql(text(sql), conn, params=self.params, chunksize=self.chunksize)
+
+    def iter_cached(self, path):
+        parquet_file = pq.ParquetFile(path)
+        if parquet_file.metadata.num_rows == 0:
+            # Закешований порожній результат: лише колонки
+            yield parquet_file.schema_arrow.empty_table().to_pandas()
+            return
+        for batch in parquet_file.iter_batches(batch_size=self.chunksize):
+            yield batch.to_pandas()
+
+    def produce(self, key, chunks, results, cancelled):
+        """Читання одного запиту в чергу; кінець позначається None, помилка - винятком"""
+        try:
+            for chunk in chunks:
+                if not self.put(results, (key, chunk), cancelled):
+                    return
+            self.put(results, (key, None), cancelled)
+        except Exception as e:
+            self.put(results, (key, e), cancelled)
+        finally:
+            chunks.close()  # закриває курсор і повертає з'єднання в пул
+
+    @staticmethod
+    def put(results, item, cancelled):
+        """Блокуючий put, що переривається, коли запис звіту зупинено"""
+        while not cancelled.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def consume(self, results, sinks, stats, errors, start):
+        """Запис чанків з черги в усі виходи, доки не завершаться всі запити"""
+        pending = len(stats)
+        while pending:
+            key, chunk = results.get()
+            if isinstance(chunk, pd.DataFrame):
+                for sink in sinks:
+                    sink.write(key, chunk)
+                stats[key]['rows'] += len(chunk)
+                continue
+
+            pending -= 1
+            stats[key]['seconds'] = round(time.perf_counter() - start, 4)
+            if chunk is not None:
+                errors[key] = chunk
+                print(f"❌ {key}: {chunk}")
+            for sink in sinks:
+                sink.finish(key, failed=key in errors)
+
+    def run(self, xlsx_path, csv_dir=None, parquet_dir=None):
+        """Виконання всіх запитів; повертає статистику {запит: рядки, секунди, джерело}"""
+        start = time.perf_counter()
+        sources, cache_paths = {}, {}
+        watermark = self.cache.current_watermark(self.engine) if self.cache else None
+        if self.cache:
+            self.cache.expire(watermark)
+        for key, sql in self.queries.items():
+            path = self.cache.entry_path(sql, self.params, watermark) if self.cache else None
+            if path and os.path.exists(path):
+                os.utime(path)  # позначка останнього використання для LRU
+                sources[key] = ('cache', self.iter_cached(path))
+            else:
+                sources[key] = ('mysql', self.iter_query(sql))
+                if path:
+                    cache_paths[key] = path
+
+        sinks = [WorkbookSink(xlsx_path, self.queries)]
+        if csv_dir:
+            sinks.append(CsvSink(csv_dir))
+        if parquet_dir:
+            sinks.append(ParquetSink({key: os.path.join(parquet_dir, f'{key}.parquet') for key in self.queries}))
+        if cache_paths:
+            sinks.append(ParquetSink(cache_paths))
+
+        stats = {key: {'rows': 0, 'seconds': None, 'source': source} for key, (source, _) in sources.items()}
+        results = queue.Queue(maxsize=QUEUE_DEPTH)
+        cancelled = threading.Event()
+        errors = {}
+        saved = False
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for key, (_, chunks) in sources.items():
+                    executor.submit(self.produce, key, chunks, results, cancelled)
+                try:
+                    self.consume(results, sinks, stats, errors, start)
+                except BaseException:
+                    # Зупинка читання, щоб потоки не чекали на повну чергу
+                    cancelled.set()
+                    raise
+            # xlsx з частиною аркушів не зберігається: попередній звіт лишається без змін
+            if not errors:
+                sinks[0].close()
+                saved = True
+        finally:
+            # Також після збою запису чи запиту: інакше лишаються тимчасові файли аркушів
+            if not saved:
+                sinks[0].discard()
+            for sink in sinks[1:]:
+                sink.close()
+
+        if cache_paths:
+            self.cache.evict()
+        total = time.perf_counter() - start
+        for key, stat in stats.items():
+            print(f"⏱ {key}: {stat['rows']} рядків, {stat['seconds']} с ({stat['source']})")
+        slowest = max((stat['seconds'] or 0 for stat in stats.values()), default=0)
+        if errors:
+            raise RuntimeError(f"Звіти з помилками: {', '.join(errors)} ({xlsx_path} не записано)")
+        print(f"✅ Звіт {xlsx_path}: {total:.3f} с (найдовший запит {slowest:.3f} с)")
+        return stats
+
+
+if __name__ == "__main__":
+    from homework2 import engine, params, queries
+    from report_cache import ReportCache
+
+    parser = argparse.ArgumentParser(description="Паралельний звіт homework2 з потоковим записом xlsx/CSV/Parquet")
+    parser.add_argument("--workers", type=int, default=None, help="паралельних запитів (за замовчуванням усі)")
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    parser.add_argument("--out", default="output/report.xlsx")
+    parser.add_argument("--csv-dir", help="також записати CSV на кожен запит у цей каталог")
+    parser.add_argument("--parquet-dir", help="також записати Parquet на кожен запит у цей каталог")
+    parser.add_argument("--no-cache", action="store_true", help="не використовувати кеш результатів")
+    args = parser.parse_args()
+
+    runner = ReportRunner(engine, queries, params, args.workers, args.chunksize,
+                          cache=None if args.no_cache else ReportCache())
+    runner.run(args.out, args.csv_dir, args.parquet_dir)
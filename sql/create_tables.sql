@@ -1,73 +1,136 @@
--- Скрипт створення всіх таблиць AdTech DB
-USE adtech_db;
-
--- Створення таблиць у правильному порядку (з урахуванням залежностей)
-
-CREATE TABLE advertisers (
-    advertiser_id INT AUTO_INCREMENT PRIMARY KEY,
-    advertiser_name VARCHAR(100) UNIQUE NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    INDEX idx_advertiser_name (advertiser_name)
-);
-
-CREATE TABLE campaigns (
-    campaign_id INT AUTO_INCREMENT PRIMARY KEY,
-    advertiser_id INT NOT NULL,
-    campaign_name VARCHAR(200) NOT NULL,
-    start_date DATE NOT NULL,
-    end_date DATE NOT NULL,
-    targeting_criteria TEXT,
-    ad_slot_size VARCHAR(20),
-    budget DECIMAL(12,2) NOT NULL,
-    remaining_budget DECIMAL(12,2) NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (advertiser_id) REFERENCES advertisers(advertiser_id),
-    INDEX idx_advertiser_campaign (advertiser_id, campaign_name),
-    INDEX idx_dates (start_date, end_date),
-    INDEX idx_budget (budget, remaining_budget)
-);
-
-CREATE TABLE users (
-    user_id BIGINT PRIMARY KEY,
-    age INT NOT NULL,
-    gender ENUM('Male', 'Female', 'Non-Binary') NOT NULL,
-    location VARCHAR(50) NOT NULL,
-    signup_date DATE NOT NULL,
-    INDEX idx_demographics (age, gender, location),
-    INDEX idx_signup_date (signup_date)
-);
-
-CREATE TABLE user_interests (
-    user_id BIGINT,
-    interest VARCHAR(50),
-    PRIMARY KEY (user_id, interest),
-    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-);
-
-CREATE TABLE ad_events (
-    event_id VARCHAR(36) PRIMARY KEY,
-    campaign_id INT NOT NULL,
-    user_id BIGINT NOT NULL,
-    device ENUM('Mobile', 'Desktop', 'Tablet') NOT NULL,
-    location VARCHAR(50) NOT NULL,
-    timestamp DATETIME NOT NULL,
-    bid_amount DECIMAL(8,2) NOT NULL,
-    ad_cost DECIMAL(8,2) NOT NULL,
-    ad_revenue DECIMAL(8,2) DEFAULT 0.00,
-    FOREIGN KEY (campaign_id) REFERENCES campaigns(campaign_id),
-    FOREIGN KEY (user_id) REFERENCES users(user_id),
-    INDEX idx_campaign_timestamp (campaign_id, timestamp),
-    INDEX idx_user_device (user_id, device),
-    INDEX idx_location_timestamp (location, timestamp),
-    INDEX idx_costs (bid_amount, ad_cost)
-);
-
-CREATE TABLE clicks (
-    click_id BIGINT AUTO_INCREMENT PRIMARY KEY,
-    event_id VARCHAR(36) NOT NULL,
-    click_timestamp DATETIME NOT NULL,
-    FOREIGN KEY (event_id) REFERENCES ad_events(event_id) ON DELETE CASCADE,
-    INDEX idx_event_timestamp (event_id, click_timestamp)
-);
-
+-- Скрипт створення всіх таблиць AdTech DB
+USE adtech_db;
+
+-- Створення таблиць у правильному порядку (з урахуванням залежностей)
+
+CREATE TABLE advertisers (
+    advertiser_id INT AUTO_INCREMENT PRIMARY KEY,
+    advertiser_name VARCHAR(100) UNIQUE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_advertiser_name (advertiser_name)
+);
+
+CREATE TABLE campaigns (
+    campaign_id INT AUTO_INCREMENT PRIMARY KEY,
+    advertiser_id INT NOT NULL,
+    campaign_name VARCHAR(200) NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    targeting_criteria TEXT,
+    ad_slot_size VARCHAR(20),
+    budget DECIMAL(12,2) NOT NULL,
+    remaining_budget DECIMAL(12,2) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (advertiser_id) REFERENCES advertisers(advertiser_id),
+    INDEX idx_advertiser_campaign (advertiser_id, campaign_name),
+    INDEX idx_dates (start_date, end_date),
+    INDEX idx_budget (budget, remaining_budget)
+);
+
+-- Довідник локацій: у users, ad_events та rollup зберігається 2-байтний location_id
+CREATE TABLE locations (
+    location_id SMALLINT AUTO_INCREMENT PRIMARY KEY,
+    location_name VARCHAR(50) UNIQUE NOT NULL
+);
+
+CREATE TABLE users (
+    user_id BIGINT PRIMARY KEY,
+    age INT NOT NULL,
+    gender ENUM('Male', 'Female', 'Non-Binary') NOT NULL,
+    location_id SMALLINT NOT NULL,
+    signup_date DATE NOT NULL,
+    FOREIGN KEY (location_id) REFERENCES locations(location_id),
+    INDEX idx_demographics (age, gender, location_id),
+    INDEX idx_signup_date (signup_date)
+);
+
+CREATE TABLE user_interests (
+    user_id BIGINT,
+    interest VARCHAR(50),
+    PRIMARY KEY (user_id, interest),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+-- ad_events партиціонована по місяцях timestamp, щоб віконні звіти читали лише потрібні партиції.
+-- Обмеження MySQL: первинний ключ має містити колонку партиціонування, а зовнішні ключі
+-- на/з партиціонованої таблиці не підтримуються (цілісність забезпечує імпортер).
+-- Нові місяці додаються так:
+--   ALTER TABLE ad_events REORGANIZE PARTITION p_future INTO (
+--       PARTITION p2025_01 VALUES LESS THAN (TO_DAYS('2025-02-01')),
+--       PARTITION p_future VALUES LESS THAN MAXVALUE);
+-- event_id - UUID у BINARY(16) (UNHEX без дефісів) замість VARCHAR(36): первинний ключ
+-- копіюється в кожен вторинний індекс, тож вужчий ключ зменшує всі індекси та join з clicks.
+-- Читабельний вигляд: SELECT LOWER(HEX(event_id)) ...
+CREATE TABLE ad_events (
+    event_id BINARY(16) NOT NULL,
+    campaign_id INT NOT NULL,
+    user_id BIGINT NOT NULL,
+    device ENUM('Mobile', 'Desktop', 'Tablet') NOT NULL,
+    location_id SMALLINT NOT NULL,
+    timestamp DATETIME NOT NULL,
+    bid_amount DECIMAL(8,2) NOT NULL,
+    ad_cost DECIMAL(8,2) NOT NULL,
+    ad_revenue DECIMAL(8,2) DEFAULT 0.00,
+    PRIMARY KEY (event_id, timestamp),
+    INDEX idx_campaign_timestamp (campaign_id, timestamp),
+    INDEX idx_user_device (user_id, device),
+    INDEX idx_location_timestamp (location_id, timestamp),
+    INDEX idx_costs (bid_amount, ad_cost)
+)
+PARTITION BY RANGE (TO_DAYS(timestamp)) (
+    PARTITION p_history VALUES LESS THAN (TO_DAYS('2024-10-01')),
+    PARTITION p2024_10 VALUES LESS THAN (TO_DAYS('2024-11-01')),
+    PARTITION p2024_11 VALUES LESS THAN (TO_DAYS('2024-12-01')),
+    PARTITION p2024_12 VALUES LESS THAN (TO_DAYS('2025-01-01')),
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+
+-- Один клік на подію: повторне завантаження тих самих подій (INSERT IGNORE) не дублює кліки
+CREATE TABLE clicks (
+    click_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    event_id BINARY(16) NOT NULL,
+    click_timestamp DATETIME NOT NULL,
+    UNIQUE KEY uq_event_id (event_id),
+    INDEX idx_event_timestamp (event_id, click_timestamp)
+);
+
+-- Попередньо агреговані події для звітів: імпортер перераховує з ad_events і clicks дні кампаній кожного завантаження
+CREATE TABLE ad_events_daily_rollup (
+    campaign_id INT NOT NULL,
+    day DATE NOT NULL,
+    device ENUM('Mobile', 'Desktop', 'Tablet') NOT NULL,
+    location_id SMALLINT NOT NULL,
+    impressions BIGINT NOT NULL DEFAULT 0,
+    clicks BIGINT NOT NULL DEFAULT 0,
+    cost_sum DECIMAL(16,2) NOT NULL DEFAULT 0.00,
+    revenue_sum DECIMAL(16,2) NOT NULL DEFAULT 0.00,
+    PRIMARY KEY (campaign_id, day, device, location_id),
+    FOREIGN KEY (campaign_id) REFERENCES campaigns(campaign_id),
+    FOREIGN KEY (location_id) REFERENCES locations(location_id),
+    INDEX idx_day (day)
+);
+
+-- Контрольна таблиця інкрементального імпорту (high-water mark по файлах подій).
+-- prefix_fingerprint - відбиток перших file_size байт: дописаний файл читається з file_size,
+-- лише якщо ця частина не змінилась. Для існуючої бази:
+--   ALTER TABLE import_watermarks ADD COLUMN prefix_fingerprint CHAR(64) AFTER file_mtime_ns;
+CREATE TABLE import_watermarks (
+    source_file VARCHAR(255) PRIMARY KEY,
+    file_size BIGINT NOT NULL,
+    file_mtime_ns BIGINT NOT NULL,
+    prefix_fingerprint CHAR(64),
+    max_timestamp DATETIME,
+    rows_loaded BIGINT NOT NULL DEFAULT 0,
+    ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Версія даних для звітного кешу: імпортер збільшує її при кожному записі довідників
+-- (бюджети кампаній, користувачі), перерахунку rollup та очищенні таблиць
+CREATE TABLE data_version (
+    id TINYINT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+INSERT INTO data_version (id, version) VALUES (1, 0);
+
 SELECT 'Всі таблиці створені успішно!' as status;
\ No newline at end of file
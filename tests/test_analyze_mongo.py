@@ -0,0 +1,45 @@
+import json
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+import analyze_mongo
+
+
+def interaction(clicked):
+    ts = datetime(2024, 12, 1, 10)
+    record = {"session_id": "s1", "device": "Mobile", "impression_id": "i1", "ad_id": "e1",
+              "campaign_id": 1 if clicked else None, "timestamp": ts, "was_clicked": clicked}
+    if clicked:
+        record["click"] = {"click_timestamp": ts}
+    return record
+
+
+def test_dump_to_parquet_null_first_chunk(tmp_path):
+    path = str(tmp_path / "interactions.parquet")
+    records = [interaction(False)] * 3 + [interaction(True)]
+
+    assert analyze_mongo.dump_to_parquet(iter(records), path, analyze_mongo.INTERACTIONS_SCHEMA, chunk_rows=2) == 4
+
+    table = pq.read_table(path)
+    assert table.schema == analyze_mongo.INTERACTIONS_SCHEMA
+    assert table.column("campaign_id").to_pylist() == [None, None, None, 1]
+    assert table.column("click").null_count == 3
+
+
+def test_dump_to_parquet_empty_result(tmp_path):
+    path = str(tmp_path / "fatigued.parquet")
+
+    assert analyze_mongo.export(iter([]), path, analyze_mongo.FATIGUED_USERS_SCHEMA) == 0
+    assert pq.read_table(path).num_rows == 0
+
+
+def test_dump_to_json_matches_json_dump(tmp_path):
+    records = [{"user_id": 1, "ad_ids": [3, 4]}, {"user_id": 2, "ad_ids": []}]
+    streamed, dumped = tmp_path / "streamed.json", tmp_path / "dumped.json"
+
+    analyze_mongo.dump_to_json(iter(records), str(streamed))
+    with open(dumped, "w", encoding="utf8") as f:
+        json.dump(records, f, ensure_ascii=False, indent=2, default=str)
+
+    assert streamed.read_text(encoding="utf8") == dumped.read_text(encoding="utf8")
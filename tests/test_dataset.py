@@ -0,0 +1,58 @@
+import pandas as pd
+
+import dataset
+
+USERS_CSV_TEXT = """UserID,Age,Gender,Location,Interests,SignupDate
+1,30,Male,UK,"Gaming, Sports",2024-01-01
+2,41,Female,USA,,2024-01-02
+"""
+
+
+def test_cache_keeps_missing_values_as_nulls(tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text(USERS_CSV_TEXT)
+
+    users = dataset.read_cached(str(path), dataset.USERS_CSV, cache_dir=str(tmp_path / "cache"))
+
+    assert users["Interests"].tolist() == ["Gaming, Sports", None]
+
+
+def test_cache_key_covers_csv_options(tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text(USERS_CSV_TEXT)
+    cache_dir = str(tmp_path / "cache")
+
+    default = dataset.read_cached(str(path), dataset.USERS_CSV, cache_dir=cache_dir)
+    as_text = dataset.read_cached(str(path), {"dtype": {**dataset.USERS_DTYPES, "UserID": "object"}},
+                                  cache_dir=cache_dir)
+
+    assert default["UserID"].tolist() == [1, 2]
+    assert as_text["UserID"].tolist() == ["1", "2"]
+
+
+def test_merge_targeting_criteria_skips_missing_parts():
+    ad_events = pd.DataFrame({
+        "TargetingCriteria1": ["Age 18-24", "Age 25-34", None],
+        "TargetingCriteria2": ["Gaming", None, None],
+        "TargetingCriteria3": ["UK", "USA", None],
+    })
+
+    merged = dataset.merge_targeting_criteria(ad_events)
+
+    assert merged["TargetingCriteria"].tolist() == ["Age 18-24, Gaming, UK", "Age 25-34, USA", ""]
+
+
+def test_appended_offset_requires_unchanged_prefix(tmp_path):
+    path = tmp_path / "ad_events.csv"
+    path.write_bytes(b"header\na,1\nb,2\n")
+    size = path.stat().st_size
+    fingerprint = dataset.prefix_fingerprint(str(path), size)
+
+    with open(path, "ab") as f:
+        f.write(b"c,3\n")
+    assert dataset.appended_offset(str(path), size, fingerprint) == size
+    assert dataset.appended_offset(str(path), size, None) is None
+
+    # Переписаний файл більшого розміру з '\n' на тій самій позиції
+    path.write_bytes(b"header\nx,9\ny,8\nz,7\n")
+    assert dataset.appended_offset(str(path), size, fingerprint) is None
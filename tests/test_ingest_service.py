@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import mongomock
+
+import ingest_service
+import load_to_mongodb
+from generate_data import generate
+
+
+def snapshot(db):
+    return {name: sorted(db[name].find({}, {"_id": 0}), key=lambda doc: (doc["user_id"], str(doc)))
+            for name in ("users_engagement", "ad_impressions", "user_summaries")}
+
+
+def test_mongo_replay_of_unacked_batch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generate('data/raw', n_events=3000, n_campaigns=30, n_advertisers=5, seed=3)
+    os.makedirs('data/landing')
+    shutil.copy('data/raw/ad_events.csv', 'data/landing/events.csv')
+    db = mongomock.MongoClient()['adtech_test']
+    monkeypatch.setattr(load_to_mongodb, 'users_collection', db['users_engagement'])
+    monkeypatch.setattr(load_to_mongodb, 'impressions_collection', db['ad_impressions'])
+    monkeypatch.setattr(load_to_mongodb, 'summaries_collection', db['user_summaries'])
+
+    def ingest(batch_rows=5000):
+        service = ingest_service.IngestService([ingest_service.MongoSink()], 'data/landing',
+                                               'output/checkpoint.json', batch_rows=batch_rows)
+        service.run(once=True)
+
+    ingest()
+    once = snapshot(db)
+    # Збій після запису, до фіксації пакета в checkpoint і стані сесій: пакет приходить повторно.
+    # (Продовження сесій з попереднього пакета використовує arrayFilters, яких mongomock не має)
+    os.remove('output/checkpoint.json')
+    os.remove(load_to_mongodb.SESSION_STATE_PATH)
+    ingest()
+
+    assert snapshot(db) == once
+    assert len(once['ad_impressions']) == 3000
+
+
+def test_mongo_replay_with_different_batch_cut(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generate('data/raw', n_events=3000, n_campaigns=30, n_advertisers=5, seed=3)
+    os.makedirs('data/landing')
+    shutil.copy('data/raw/ad_events.csv', 'data/landing/events.csv')
+    db = mongomock.MongoClient()['adtech_test']
+    monkeypatch.setattr(load_to_mongodb, 'users_collection', db['users_engagement'])
+    monkeypatch.setattr(load_to_mongodb, 'impressions_collection', db['ad_impressions'])
+    monkeypatch.setattr(load_to_mongodb, 'summaries_collection', db['user_summaries'])
+
+    def ingest(batch_rows):
+        service = ingest_service.IngestService([ingest_service.MongoSink()], 'data/landing',
+                                               'output/checkpoint.json', batch_rows=batch_rows)
+        service.run(once=True)
+
+    ingest(5000)
+    once = snapshot(db)
+    # Checkpoint втрачено, а ті самі рядки нарізаються на інші пакети
+    os.remove('output/checkpoint.json')
+    ingest(700)
+
+    assert snapshot(db) == once
+    assert len(once['ad_impressions']) == 3000
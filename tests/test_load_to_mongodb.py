@@ -0,0 +1,225 @@
+import os
+
+import mongomock
+import pandas as pd
+import pytest
+
+import load_to_mongodb
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["adtech_test"]
+
+
+def user_docs(user_ids):
+    return ({"user_id": user_id, "ad_sessions": []} for user_id in user_ids)
+
+
+def test_rebuild_collection_swaps_in_staging(db):
+    db["users_engagement"].insert_one({"user_id": 0, "stale": True})
+
+    written = load_to_mongodb.rebuild_collection(db, user_docs(range(1, 301)), batch_size=40)
+
+    assert written == 300
+    assert db["users_engagement"].count_documents({}) == 300
+    assert db["users_engagement"].count_documents({"stale": True}) == 0
+    assert "users_engagement_staging" not in db.list_collection_names()
+    index = db["users_engagement"].index_information()["user_id_1"]
+    assert index["key"] == [("user_id", 1)] and index["unique"]
+
+
+def test_rebuild_collection_empty_stream(db):
+    db["users_engagement"].insert_one({"user_id": 0, "stale": True})
+
+    assert load_to_mongodb.rebuild_collection(db, iter([])) == 0
+    assert "users_engagement" in db.list_collection_names()
+    assert db["users_engagement"].count_documents({}) == 0
+
+
+def test_prepare_staging_without_indexes_can_be_renamed(db):
+    staging = load_to_mongodb.prepare_staging(db, "ad_impressions", [])
+    staging.rename("ad_impressions", dropTarget=True)
+
+    assert "ad_impressions" in db.list_collection_names()
+
+
+def test_rebuild_collection_failure_keeps_live_collection(db):
+    db["users_engagement"].insert_one({"user_id": 0, "stale": True})
+
+    def failing_docs():
+        yield from user_docs(range(1, 11))
+        raise RuntimeError("source failed")
+
+    with pytest.raises(RuntimeError):
+        load_to_mongodb.rebuild_collection(db, failing_docs(), batch_size=4)
+
+    assert list(db["users_engagement"].find({}, {"_id": 0})) == [{"user_id": 0, "stale": True}]
+
+
+def make_events():
+    ad_events = pd.DataFrame({
+        "EventID": [f"00000000-0000-4000-8000-{i:012d}" for i in range(6)],
+        "CampaignName": ["Campaign_1", "Campaign_1", "Campaign_2", "Campaign_2", "Campaign_1", "Campaign_2"],
+        "TargetingCriteria2": ["Gaming", "Gaming", "Food", "Food", "Gaming", "Food"],
+        "UserID": [1, 1, 1, 2, 2, 2],
+        "Device": ["Mobile", "Mobile", "Mobile", "Desktop", "Desktop", "Desktop"],
+        "Timestamp": ["2024-12-01 10:00:00", "2024-12-01 10:05:00", "2024-12-01 12:00:00",
+                      "2024-12-01 09:00:00", "2024-12-01 09:10:00", "2024-12-02 09:00:00"],
+        "WasClicked": [True, False, False, False, True, False],
+        "ClickTimestamp": ["2024-12-01 10:00:05", None, None, None, "2024-12-01 09:10:07", None],
+    })
+    campaigns = pd.DataFrame({"CampaignID": [1, 2], "CampaignName": ["Campaign_1", "Campaign_2"]})
+    return load_to_mongodb.prepare_ad_events(ad_events, campaigns)
+
+
+def make_users():
+    return pd.DataFrame({"UserID": [1, 2], "Age": [30, 41], "Gender": ["Male", "Female"],
+                         "Location": ["Kyiv", "Lviv"], "Interests": ["Gaming,Food", "Food"]})
+
+
+def snapshot(db):
+    return {name: sorted(db[name].find({}, {"_id": 0}), key=lambda doc: (doc["user_id"], str(doc)))
+            for name in ("users_engagement", "ad_impressions", "user_summaries")}
+
+
+def test_apply_incremental_replay_is_idempotent(db, tmp_path):
+    state_path = str(tmp_path / "session_state.json")
+
+    def apply():
+        return load_to_mongodb.apply_incremental(db["users_engagement"], make_events(), make_users(), state_path,
+                                                 impressions=db["ad_impressions"], summaries=db["user_summaries"])
+
+    apply()
+    once = snapshot(db)
+    # The process stopped after the writes but before the session state was saved
+    os.remove(state_path)
+    apply()
+
+    assert snapshot(db) == once
+    assert [len(doc["ad_sessions"]) for doc in once["users_engagement"]] == [2, 2]
+    assert len(once["ad_impressions"]) == 6
+    assert [doc["last_sessions"][-1]["num_ads"] for doc in once["user_summaries"]] == [1, 1]
+
+
+def test_replay_with_different_batch_cut_applies_each_event_once(db, tmp_path):
+    events = make_events()
+
+    def apply(target, ad_events, state_path):
+        load_to_mongodb.apply_incremental(target["users_engagement"], ad_events, make_users(), state_path,
+                                          impressions=target["ad_impressions"], summaries=target["user_summaries"])
+
+    # Partial batch from a file that was appended to later, then the whole file again
+    apply(db, events.iloc[:2], str(tmp_path / "state.json"))
+    apply(db, events, str(tmp_path / "state.json"))
+    single = mongomock.MongoClient()["adtech_single"]
+    apply(single, events, str(tmp_path / "single_state.json"))
+
+    # Load markers differ, everything else matches a single load of all events
+    for target in (db, single):
+        target["user_summaries"].update_many({}, {"$unset": {"applied_loads": ""}})
+    assert snapshot(db) == snapshot(single)
+    summary = db["user_summaries"].find_one({"user_id": 1})
+    assert summary["ad_stats"] == {"1": {"impressions": 2, "clicks": 1}, "2": {"impressions": 1, "clicks": 0}}
+    assert [header["num_ads"] for header in summary["last_sessions"]] == [2, 1]
+
+
+def session_events(event_ids, timestamps, campaign="Campaign_1"):
+    ad_events = pd.DataFrame({
+        "EventID": [f"00000000-0000-4000-8000-{i:012d}" for i in event_ids],
+        "CampaignName": [campaign] * len(event_ids),
+        "TargetingCriteria2": ["Gaming"] * len(event_ids),
+        "UserID": [1] * len(event_ids),
+        "Device": ["Mobile"] * len(event_ids),
+        "Timestamp": timestamps,
+        "WasClicked": [False] * len(event_ids),
+        "ClickTimestamp": [None] * len(event_ids),
+    })
+    campaigns = pd.DataFrame({"CampaignID": [1], "CampaignName": ["Campaign_1"]})
+    return load_to_mongodb.prepare_ad_events(ad_events, campaigns)
+
+
+def test_late_and_out_of_order_events_are_not_folded_into_last_session():
+    state = {}
+    list(load_to_mongodb.iter_user_documents(session_events([0], ["2024-12-01 12:00:00"]), make_users(), state))
+    cached = dict(state["1"]["Mobile"])
+
+    # 10:00 is older than the cached session, 12:10 continues it, 11:00 comes out of order
+    late = session_events([1, 2, 3], ["2024-12-01 10:00:00", "2024-12-01 12:10:00", "2024-12-01 11:00:00"])
+    deltas = load_to_mongodb.SummaryDeltas()
+    list(load_to_mongodb.iter_session_updates(late, make_users(), state, summary_deltas=deltas))
+
+    delta = deltas.users[1]
+    assert delta["extended"] == {cached["session_id"]: [1, 0]}
+    assert sorted(header["start_time"].hour for header in delta["sessions"]) == [10, 11]
+    assert state["1"]["Mobile"] == {"session_id": cached["session_id"], "end_time": "2024-12-01T12:10:00"}
+
+
+def test_replay_with_saved_state_does_not_extend_sessions():
+    events = session_events([0, 1, 2], ["2024-12-01 10:00:00", "2024-12-01 10:05:00", "2024-12-01 12:00:00"])
+    state = {}
+    list(load_to_mongodb.iter_session_updates(events, make_users(), state))
+    saved = {user: dict(devices) for user, devices in state.items()}
+
+    # The state was saved but the checkpoint was not acknowledged, so the batch comes again
+    deltas = load_to_mongodb.SummaryDeltas()
+    list(load_to_mongodb.iter_session_updates(events, make_users(), state, summary_deltas=deltas))
+
+    assert deltas.users[1]["extended"] == {}
+    assert [header["num_ads"] for header in deltas.users[1]["sessions"]] == [2, 1]
+    assert state == saved
+
+
+def test_summary_counts_campaigns_and_encodes_categories(db, tmp_path):
+    ad_events = pd.DataFrame({
+        "EventID": [f"00000000-0000-4000-8000-{i:012d}" for i in range(9)],
+        "CampaignName": ["Campaign_1"] * 5 + ["Campaign_2"] * 4,
+        "TargetingCriteria2": ["Home.Garden"] * 5 + ["$Luxury", None, "nan", "Home.Garden"],
+        "UserID": [1] * 9,
+        "Device": ["Mobile"] * 9,
+        "Timestamp": [f"2024-12-01 10:{minute:02d}:00" for minute in range(9)],
+        "WasClicked": [False] * 5 + [True] * 4,
+        "ClickTimestamp": [None] * 5 + ["2024-12-01 10:05:05", "2024-12-01 10:06:05", "2024-12-01 10:07:05",
+                           "2024-12-01 10:08:05"],
+    })
+    campaigns = pd.DataFrame({"CampaignID": [1, 2], "CampaignName": ["Campaign_1", "Campaign_2"]})
+    events = load_to_mongodb.prepare_ad_events(ad_events, campaigns)
+    load_to_mongodb.apply_incremental(db["users_engagement"], events, make_users(), str(tmp_path / "state.json"),
+                                      impressions=db["ad_impressions"], summaries=db["user_summaries"])
+
+    summary = db["user_summaries"].find_one({"user_id": 1}, {"_id": 0, "last_sessions": 0})
+    assert summary["ad_stats"] == {"1": {"impressions": 5, "clicks": 0}, "2": {"impressions": 4, "clicks": 4}}
+    assert summary["fatigued_ads"] == ["1"] and summary["fatigued"]
+    assert {load_to_mongodb.decode_field_key(key): clicks
+            for key, clicks in summary["category_clicks"].items()} == {"$Luxury": 1, "Home.Garden": 1}
+
+    full = load_to_mongodb.make_user_summary(db["users_engagement"].find_one({"user_id": 1}))
+    assert full["ad_stats"] == summary["ad_stats"]
+    assert full["category_clicks"] == summary["category_clicks"]
+
+
+def test_new_user_with_unknown_campaigns_gets_summary(db, tmp_path):
+    # Neither event's campaign is in the campaigns table
+    events = session_events([0, 1], ["2024-12-01 10:00:00", "2024-12-01 10:05:00"], campaign="Campaign_9")
+
+    load_to_mongodb.apply_incremental(db["users_engagement"], events, make_users(), str(tmp_path / "state.json"),
+                                      impressions=db["ad_impressions"], summaries=db["user_summaries"])
+
+    summary = db["user_summaries"].find_one({"user_id": 1}, {"_id": 0})
+    assert "ad_stats" not in summary
+    assert summary["fatigued_ads"] == [] and not summary["fatigued"]
+    assert summary["last_sessions"][-1]["num_ads"] == 2
+
+
+def test_missing_categories_and_interests_are_not_strings():
+    campaigns = pd.DataFrame({"CampaignID": [1, 2], "CampaignName": ["Campaign_1", "Campaign_2"]})
+    raw = pd.DataFrame({
+        "EventID": ["e1", "e2"], "CampaignName": ["Campaign_1", "Campaign_2"], "TargetingCriteria2": [None, " Food "],
+        "UserID": [1, 2], "Device": ["Mobile", "Mobile"], "Timestamp": ["2024-12-01 10:00:00"] * 2,
+        "WasClicked": [False, False], "ClickTimestamp": [None, None],
+    })
+    users = make_users().assign(Interests=["Gaming, Food", None])
+
+    assert load_to_mongodb.prepare_ad_events(raw, campaigns)["AdCategory"].tolist() == [None, "Food"]
+    attributes = load_to_mongodb.user_attributes(users)
+    assert attributes[1]["Interests"] == ["Gaming", "Food"] and attributes[2]["Interests"] == []
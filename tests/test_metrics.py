@@ -0,0 +1,58 @@
+import threading
+
+import numpy as np
+
+from metrics import ImportMetrics, read_rss_kb
+
+
+def test_nested_stage_is_part_of_outer_profile(tmp_path):
+    metrics = ImportMetrics({'insert': 'cprofile', 'transform': 'tracemalloc'}, profile_dir=str(tmp_path))
+
+    with metrics.stage('insert'):
+        with metrics.stage('transform', rows=10):
+            sum(range(1000))
+
+    stages = metrics.summary()['stages']
+    assert stages['insert']['cprofile'].endswith('insert.prof')
+    assert 'tracemalloc_peak_mb' not in stages['transform']
+    assert stages['transform']['profile_skipped'] == 1
+    assert metrics.profiling is None
+
+
+def test_stage_in_worker_thread_is_not_profiled(tmp_path):
+    metrics = ImportMetrics({'transform': 'cprofile'}, profile_dir=str(tmp_path))
+
+    def work():
+        with metrics.stage('transform', rows=5):
+            pass
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    with metrics.stage('transform', rows=5):
+        pass
+
+    stage = metrics.summary()['stages']['transform']
+    assert stage['calls'] == 2 and stage['rows'] == 10
+    assert stage['profile_skipped'] == 1 and 'cprofile' in stage
+    assert stage['peak_rss_mb'] > 0
+
+
+def test_stage_peak_rss_is_measured_per_stage():
+    metrics = ImportMetrics()
+    base_mb = read_rss_kb()[0] / 1024
+
+    with metrics.stage('outer'):
+        with metrics.stage('allocate'):
+            block = np.ones(2 ** 24)
+            del block
+    with metrics.stage('after'):
+        pass
+
+    summary = metrics.summary()
+    stages = summary['stages']
+    # 128 МБ живуть лише всередині 'allocate', після неї пам'ять звільнена
+    assert stages['allocate']['peak_rss_mb'] >= base_mb + 100
+    assert stages['outer']['peak_rss_mb'] >= stages['allocate']['peak_rss_mb']
+    assert stages['after']['peak_rss_mb'] < stages['allocate']['peak_rss_mb'] - 100
+    assert summary['peak_rss_mb'] >= stages['allocate']['peak_rss_mb']
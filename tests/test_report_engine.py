@@ -0,0 +1,120 @@
+import re
+
+import duckdb
+import pandas as pd
+import pytest
+
+from dataset import AD_EVENTS_COLUMNS
+from generate_data import generate
+from homework2 import params, queries
+from report_engine import EmbeddedReportEngine, frames_equal, to_duckdb_params, to_duckdb_sql
+from transforms_data import AdTechDataTransformer
+
+# Без LIMIT: порівнюються повні результати, а не перші рядки з довільним порядком однакових значень
+FULL_QUERIES = {key: re.sub(r'LIMIT\s+\d+', '', sql) for key, sql in queries.items()}
+
+
+@pytest.fixture
+def raw_data(tmp_path, monkeypatch):
+    """Синтетичні data/raw з кампаніями, які імпорт обробляє окремо"""
+    monkeypatch.chdir(tmp_path)
+    generate('data/raw', n_events=20_000, n_campaigns=60, n_advertisers=10, seed=7)
+    campaigns = pd.read_csv('data/raw/campaigns.csv')
+    # Дві кампанії з однією назвою: події отримують найбільший campaign_id
+    campaigns.loc[1, 'CampaignName'] = campaigns.loc[0, 'CampaignName']
+    # Кампанія з порожнім полем не імпортується (dropna), разом з її подіями
+    campaigns.loc[2, 'TargetingCriteria'] = None
+    campaigns.to_csv('data/raw/campaigns.csv', index=False)
+    # Користувач і події з порожнім Location не імпортуються (location_id NOT NULL)
+    users = pd.read_csv('data/raw/users.csv')
+    users.loc[0, 'Location'] = None
+    users.to_csv('data/raw/users.csv', index=False)
+    # Заголовок ad_events.csv не збігається з рядками (TargetingCriteria - три поля), тож правимо текст
+    with open('data/raw/ad_events.csv', encoding='utf-8') as f:
+        header, *rows = [line.rstrip('\n').split(',') for line in f]
+    location, timestamp, name = (AD_EVENTS_COLUMNS.index(column)
+                                 for column in ('Location', 'Timestamp', 'CampaignName'))
+    # Події, що потрапляють у звіти: у періоді звітів і з імпортованої кампанії
+    reported = [i for i, fields in enumerate(rows) if fields[name] != campaigns.loc[2, 'CampaignName']
+                and params['date_from'] <= fields[timestamp][:10] <= params['date_to']]
+    rows[reported[0]][location] = ''
+    # Дублікат події з порожнім Location перед оригіналом: лишається подія з локацією
+    rows.insert(0, rows[reported[1]][:location] + [''] + rows[reported[1]][location + 1:])
+    with open('data/raw/ad_events.csv', 'w', encoding='utf-8') as f:
+        f.writelines(','.join(fields) + '\n' for fields in [header, *rows])
+    return tmp_path
+
+
+def imported_tables():
+    """Таблиці MySQL після імпорту, відтворені трансформаціями transforms_data без бази"""
+    transformer = AdTechDataTransformer({})
+    transformer.load_csv_data()
+
+    advertiser_names = pd.unique(transformer.campaigns['AdvertiserName'].dropna())
+    advertiser_mapping = {name: i for i, name in enumerate(advertiser_names, 1)}
+    campaigns = transformer.transform_campaigns(advertiser_mapping).sort_values('CampaignID')
+    # fetch_name_mapping: SELECT ... ORDER BY campaign_id, останній ID перезаписує попередні
+    transformer.campaign_mapping = dict(zip(campaigns['CampaignName'], campaigns['CampaignID']))
+    location_names = pd.unique(pd.concat([transformer.users['Location'].dropna().astype(str),
+                                          transformer.ad_events['Location'].dropna().astype(str)]))
+    transformer.location_mapping = {name: i for i, name in enumerate(location_names, 1)}
+
+    users, _ = transformer.transform_users_and_interests()
+    events, clicks = transformer.transform_ad_events_and_clicks()
+    clicks = clicks.drop_duplicates('event_key')
+    events = events.assign(timestamp=pd.to_datetime(events['Timestamp']), device=events['Device'].astype(str))
+
+    rollup = (events.assign(day=events['timestamp'].dt.date, clicked=events['event_key'].isin(clicks['event_key']))
+              .groupby(['campaign_id', 'day', 'device', 'location_id'], observed=True)
+              .agg(impressions=('event_key', 'size'), clicks=('clicked', 'sum'),
+                   cost_sum=('AdCost', 'sum'), revenue_sum=('AdRevenue', 'sum'))
+              .reset_index())
+    return {
+        'advertisers': pd.DataFrame({'advertiser_id': list(advertiser_mapping.values()),
+                                     'advertiser_name': list(advertiser_mapping)}),
+        'campaigns': pd.DataFrame({
+            'campaign_id': campaigns['CampaignID'], 'advertiser_id': campaigns['advertiser_id'],
+            'campaign_name': campaigns['CampaignName'].astype(str),
+            'start_date': pd.to_datetime(campaigns['CampaignStartDate'].astype(str)).dt.date,
+            'end_date': pd.to_datetime(campaigns['CampaignEndDate'].astype(str)).dt.date,
+            'budget': campaigns['Budget'], 'remaining_budget': campaigns['RemainingBudget']}),
+        'locations': pd.DataFrame({'location_id': list(transformer.location_mapping.values()),
+                                   'location_name': list(transformer.location_mapping)}),
+        'users': pd.DataFrame({'user_id': users['UserID'], 'age': users['Age'],
+                               'gender': users['Gender'].astype(str),
+                               'location_id': users['location_id']}).drop_duplicates('user_id'),
+        'ad_events': pd.DataFrame({'event_id': events['event_key'], 'campaign_id': events['campaign_id'],
+                                   'user_id': events['UserID'], 'timestamp': events['timestamp']}),
+        'clicks': pd.DataFrame({'click_id': range(1, len(clicks) + 1), 'event_id': clicks['event_key']}),
+        'ad_events_daily_rollup': rollup,
+    }
+
+
+def run_reference(tables):
+    connection = duckdb.connect()
+    for name, df in tables.items():
+        connection.register(f'{name}_df', df)
+        connection.execute(f'CREATE TABLE {name} AS SELECT * FROM {name}_df')
+    reports = {}
+    for key, sql in FULL_QUERIES.items():
+        sql = to_duckdb_sql(sql)
+        used = {key: value for key, value in to_duckdb_params(params).items() if f'${key}' in sql}
+        reports[key] = connection.execute(sql, used).df()
+    connection.close()
+    return reports
+
+
+def ordered(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('source', ['parquet', 'csv'])
+def test_embedded_reports_match_import(raw_data, source):
+    engine = EmbeddedReportEngine(source)
+    report = engine.run(FULL_QUERIES, params)
+    engine.close()
+    expected = run_reference(imported_tables())
+
+    for key in FULL_QUERIES:
+        assert len(expected[key]) > 0, key
+        assert frames_equal(ordered(expected[key]), ordered(report[key])), key
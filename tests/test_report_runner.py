@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+import pyarrow.parquet as pq
+import pytest
+from openpyxl import load_workbook
+from sqlalchemy import create_engine, text
+
+from report_cache import ReportCache
+from report_runner import ReportRunner
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'reports.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE import_watermarks (max_timestamp TEXT, rows_loaded INTEGER)'))
+        conn.execute(text('CREATE TABLE data_version (version INTEGER)'))
+        conn.execute(text('CREATE TABLE facts (id INTEGER, label TEXT, amount INTEGER)'))
+        # Перший чанк (2 рядки): label лише NULL, amount - цілі; далі NULL в amount
+        conn.execute(text("INSERT INTO facts VALUES (1, NULL, 10), (2, NULL, 20), (3, 'x', NULL), (4, 'y', 40)"))
+    return engine
+
+
+QUERIES = {
+    'facts': 'SELECT id, label, amount FROM facts WHERE id >= :min_id ORDER BY id',
+    'empty': 'SELECT id, label FROM facts WHERE id < :min_id',
+}
+
+
+def test_parquet_schema_from_later_chunks_and_empty_results(engine, tmp_path):
+    cache = ReportCache(str(tmp_path / 'cache'))
+    runner = ReportRunner(engine, QUERIES, {'min_id': 1}, chunksize=2, cache=cache)
+
+    stats = runner.run(str(tmp_path / 'report.xlsx'), parquet_dir=str(tmp_path / 'parquet'))
+
+    assert stats['facts']['rows'] == 4 and stats['empty']['rows'] == 0
+    facts = pq.read_table(tmp_path / 'parquet' / 'facts.parquet').to_pydict()
+    assert facts == {'id': [1, 2, 3, 4], 'label': [None, None, 'x', 'y'], 'amount': [10, 20, None, 40]}
+    assert pq.read_table(tmp_path / 'parquet' / 'empty.parquet').num_rows == 0
+    assert len([name for name in os.listdir(cache.cache_dir) if name.endswith('.parquet')]) == 2
+
+    # Повторний запуск читає обидва результати з кешу, порожній - з колонками
+    stats = runner.run(str(tmp_path / 'cached.xlsx'))
+    assert {stat['source'] for stat in stats.values()} == {'cache'}
+    sheet = load_workbook(tmp_path / 'cached.xlsx')['empty']
+    assert list(sheet.values) == [('id', 'label')]
+
+
+@pytest.fixture
+def sheet_temp_dir(tmp_path, monkeypatch):
+    """Каталог для тимчасових файлів аркушів openpyxl (tempfile.gettempdir)"""
+    temp_dir = tmp_path / 'temp'
+    temp_dir.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(temp_dir))
+    return temp_dir
+
+
+def test_failed_query_does_not_save_workbook(engine, tmp_path, sheet_temp_dir):
+    queries = dict(QUERIES, broken='SELECT * FROM missing_table')
+    runner = ReportRunner(engine, queries, {'min_id': 1}, chunksize=2)
+
+    with pytest.raises(RuntimeError):
+        runner.run(str(tmp_path / 'report.xlsx'), parquet_dir=str(tmp_path / 'parquet'))
+
+    assert not (tmp_path / 'report.xlsx').exists() and not (tmp_path / 'report.xlsx.tmp').exists()
+    assert sorted(os.listdir(tmp_path / 'parquet')) == ['empty.parquet', 'facts.parquet']
+    assert os.listdir(sheet_temp_dir) == []
+
+
+def test_failed_sink_write_discards_workbook(engine, tmp_path, sheet_temp_dir, monkeypatch):
+    runner = ReportRunner(engine, QUERIES, {'min_id': 1}, chunksize=2)
+
+    def failing_write(self, key, chunk):
+        raise OSError('disk full')
+
+    monkeypatch.setattr('report_runner.CsvSink.write', failing_write)
+    with pytest.raises(OSError):
+        runner.run(str(tmp_path / 'report.xlsx'), csv_dir=str(tmp_path / 'csv'))
+
+    assert not (tmp_path / 'report.xlsx').exists() and not (tmp_path / 'report.xlsx.tmp').exists()
+    assert os.listdir(sheet_temp_dir) == []
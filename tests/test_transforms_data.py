@@ -0,0 +1,63 @@
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+import transforms_data
+from transforms_data import AdTechDataTransformer
+
+
+def test_invalid_event_ids_go_to_dead_letter(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    transformer = AdTechDataTransformer({})
+    transformer.campaigns = pd.DataFrame({'CampaignID': [1], 'CampaignName': ['Campaign_1']})
+    transformer.location_mapping = {'UK': 1}
+    ad_events = pd.DataFrame({
+        'EventID': ['5a72f7e3-5e36-41ac-aa11-b4a467e42ee4', 'not-a-uuid', None],
+        'CampaignName': ['Campaign_1'] * 3, 'UserID': [1, 2, 3], 'Device': ['Mobile'] * 3,
+        'Location': ['UK'] * 3, 'Timestamp': ['2024-10-11 10:04:10'] * 3,
+        'BidAmount': [1.0] * 3, 'AdCost': [0.5] * 3, 'AdRevenue': [0.0] * 3,
+        'WasClicked': [False, True, False], 'ClickTimestamp': [None, '2024-10-11 10:04:12', None],
+    })
+
+    events, clicks = transformer.transform_ad_events_and_clicks(ad_events)
+
+    assert len(events) == 1 and clicks.empty
+    with open(transforms_data.DEAD_LETTER_PATH, encoding='utf-8') as f:
+        rejected = [json.loads(line) for line in f]
+    assert [(record['table'], record['row'][0], record['row'][2]) for record in rejected] == \
+        [('ad_events', 'not-a-uuid', 2), ('ad_events', None, 3)]
+    assert 'not-a-uuid' in rejected[0]['error']
+    assert transformer.rejected_rows == 2
+    assert transformer.metrics.summary()['counters']['rejected_rows'] == 2
+
+
+def test_prefetch_stops_reader_when_consumer_stops():
+    closed = threading.Event()
+
+    def chunks():
+        try:
+            for i in range(100):
+                yield i
+        finally:
+            closed.set()
+
+    items = transforms_data.prefetch(chunks())
+    assert next(items) == 0
+    items.close()
+
+    assert closed.is_set()
+    assert not [thread for thread in threading.enumerate() if thread.daemon and thread.is_alive()
+                and thread is not threading.current_thread() and 'producer' in thread.name]
+
+
+def test_prefetch_reraises_reader_error():
+    def chunks():
+        yield 1
+        raise ValueError('bad chunk')
+
+    items = transforms_data.prefetch(chunks())
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
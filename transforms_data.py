@@ -1,294 +1,972 @@
-import pandas as pd
-import mysql.connector
-from mysql.connector import Error
-
-
-class AdTechDataTransformer:
-    def __init__(self, connection_config):
-        self.config = connection_config
-        self.connection = None
-
-    def connect_db(self):
-        """Підключення до MySQL"""
-        try:
-            self.connection = mysql.connector.connect(**self.config)
-            print("✅ Підключення до MySQL успішне")
-        except Error as e:
-            print(f"❌ Помилка підключення: {e}")
-
-    def load_csv_data(self):
-        """Завантаження CSV файлів"""
-        print("📂 Завантаження CSV файлів...")
-        # self.ad_events = pd.read_csv('data/raw/ad_events.csv')
-        columns = [
-            'EventID', 'AdvertiserName', 'CampaignName', 'CampaignStartDate', 'CampaignEndDate',
-            'TargetingCriteria1', 'TargetingCriteria2', 'TargetingCriteria3',
-            'AdSlotSize', 'UserID', 'Device', 'Location', 'Timestamp',
-            'BidAmount', 'AdCost', 'WasClicked', 'ClickTimestamp',
-            'AdRevenue', 'Budget', 'RemainingBudget'
-        ]
-
-        # Зчитуємо CSV без заголовків
-        ad_events = pd.read_csv('data/raw/ad_events.csv', names=columns, skiprows=1, header=None)
-
-        # Об'єднуємо три частини TargetingCriteria в один стовпець
-        ad_events['TargetingCriteria'] = ad_events[
-            ['TargetingCriteria1', 'TargetingCriteria2', 'TargetingCriteria3']].apply(
-            lambda row: ', '.join(row.astype(str)).strip(), axis=1
-        )
-
-        # Видаляємо зайві колонки
-        self.ad_events = ad_events.drop(['TargetingCriteria1', 'TargetingCriteria2', 'TargetingCriteria3'], axis=1)
-        self.campaigns = pd.read_csv('data/raw/campaigns.csv')
-        self.users = pd.read_csv('data/raw/users.csv')
-        print(
-            f"✅ Завантажено: {len(self.ad_events)} подій, {len(self.campaigns)} кампаній, {len(self.users)} користувачів")
-
-    def clear_existing_data(self):
-        """Очищення існуючих даних (опціонально)"""
-        cursor = self.connection.cursor()
-        try:
-            # Видаляємо в правильному порядку (зворотно до залежностей)
-            cursor.execute("DELETE FROM clicks")
-            cursor.execute("DELETE FROM ad_events")
-            cursor.execute("DELETE FROM user_interests")
-            cursor.execute("DELETE FROM users")
-            cursor.execute("DELETE FROM campaigns")
-            cursor.execute("DELETE FROM advertisers")
-
-            # Скидаємо AUTO_INCREMENT
-            cursor.execute("ALTER TABLE advertisers AUTO_INCREMENT = 1")
-            cursor.execute("ALTER TABLE campaigns AUTO_INCREMENT = 1")
-            cursor.execute("ALTER TABLE clicks AUTO_INCREMENT = 1")
-
-            self.connection.commit()
-            print("🧹 Існуючі дані очищено")
-        except Error as e:
-            print(f"⚠️ Помилка при очищенні: {e}")
-            self.connection.rollback()
-        finally:
-            cursor.close()
-
-    def get_or_create_advertiser_mapping(self):
-        """Отримання або створення мапінгу рекламодавців"""
-        cursor = self.connection.cursor()
-        advertiser_mapping = {}
-
-        try:
-            # Отримуємо існуючих рекламодавців
-            cursor.execute("SELECT advertiser_id, advertiser_name FROM advertisers")
-            existing_advertisers = cursor.fetchall()
-
-            for adv_id, adv_name in existing_advertisers:
-                advertiser_mapping[adv_name] = adv_id
-
-            # Додаємо нових рекламодавців
-            unique_advertisers = self.campaigns['AdvertiserName'].unique()
-
-            for advertiser_name in unique_advertisers:
-                if advertiser_name not in advertiser_mapping:
-                    try:
-                        cursor.execute(
-                            "INSERT INTO advertisers (advertiser_name) VALUES (%s)",
-                            (advertiser_name,)
-                        )
-                        advertiser_mapping[advertiser_name] = cursor.lastrowid
-                    except Error as e:
-                        if e.errno == 1062:  # Duplicate entry
-                            # Якщо дублікат, отримуємо існуючий ID
-                            cursor.execute(
-                                "SELECT advertiser_id FROM advertisers WHERE advertiser_name = %s",
-                                (advertiser_name,)
-                            )
-                            result = cursor.fetchone()
-                            if result:
-                                advertiser_mapping[advertiser_name] = result[0]
-                        else:
-                            raise e
-
-            self.connection.commit()
-            print(f"✅ Оброблено {len(advertiser_mapping)} рекламодавців")
-            return advertiser_mapping
-
-        except Error as e:
-            print(f"❌ Помилка при роботі з рекламодавцями: {e}")
-            self.connection.rollback()
-            return {}
-        finally:
-            cursor.close()
-
-    def transform_campaigns(self, advertiser_mapping):
-        """Трансформація кампаній з ID рекламодавців"""
-        campaigns_transformed = self.campaigns.copy()
-        campaigns_transformed['advertiser_id'] = campaigns_transformed['AdvertiserName'].map(advertiser_mapping)
-
-        # Перевіряємо, чи всі рекламодавці знайдені
-        missing_advertisers = campaigns_transformed[campaigns_transformed['advertiser_id'].isna()]
-        if not missing_advertisers.empty:
-            print(f"⚠️ Не знайдено advertiser_id для: {missing_advertisers['AdvertiserName'].unique()}")
-
-        return campaigns_transformed[['CampaignID', 'advertiser_id', 'CampaignName',
-                                      'CampaignStartDate', 'CampaignEndDate',
-                                      'TargetingCriteria', 'AdSlotSize', 'Budget', 'RemainingBudget']].dropna()
-
-    def transform_users_and_interests(self):
-        """Трансформація користувачів та їх інтересів"""
-        users_clean = self.users[['UserID', 'Age', 'Gender', 'Location', 'SignupDate']].copy()
-
-        # Обробка інтересів
-        interests_data = []
-        for _, row in self.users.iterrows():
-            user_id = row['UserID']
-            interests = str(row['Interests']).split(',')
-            for interest in interests:
-                interest = interest.strip()
-                if interest and interest != 'nan':
-                    interests_data.append({'user_id': user_id, 'interest': interest})
-
-        interests_df = pd.DataFrame(interests_data)
-        return users_clean, interests_df
-
-    def transform_ad_events_and_clicks(self):
-        """Трансформація подій та кліків"""
-        # Створюємо мапінг назв кампаній до ID
-        campaign_mapping = dict(zip(self.campaigns['CampaignName'], self.campaigns['CampaignID']))
-
-        events_clean = self.ad_events.copy()
-        events_clean['campaign_id'] = events_clean['CampaignName'].map(campaign_mapping)
-
-        # Видаляємо події без campaign_id
-        events_clean = events_clean.dropna(subset=['campaign_id'])
-
-        # Розділяємо на події та кліки
-        ad_events_final = events_clean[['EventID', 'campaign_id', 'UserID', 'Device',
-                                        'Location', 'Timestamp', 'BidAmount', 'AdCost', 'AdRevenue']].copy()
-
-        # Тільки кліки
-        clicks_data = events_clean[events_clean['WasClicked'] == True][['EventID', 'ClickTimestamp']].copy()
-        clicks_data = clicks_data.dropna(subset=['ClickTimestamp'])
-
-        return ad_events_final, clicks_data
-
-    def insert_data_batch(self, cursor, query, data, batch_size=1000):
-        """Пакетна вставка даних"""
-        for i in range(0, len(data), batch_size):
-            batch = data[i:i + batch_size]
-            try:
-                cursor.executemany(query, batch)
-                self.connection.commit()
-            except Error as e:
-                print(f"❌ Помилка в пакеті {i // batch_size + 1}: {e}")
-                self.connection.rollback()
-                # Спробуємо вставити по одному запису
-                for row in batch:
-                    try:
-                        cursor.execute(query, row)
-                        self.connection.commit()
-                    except Error as row_error:
-                        print(f"⚠️ Пропускаємо запис: {row_error}")
-                        self.connection.rollback()
-                        continue
-
-    def insert_data_to_db(self):
-        """Вставка даних до бази"""
-        cursor = self.connection.cursor()
-
-        try:
-            # 1. Рекламодавці (з перевіркою дублікатів)
-            advertiser_mapping = self.get_or_create_advertiser_mapping()
-
-            # 2. Кампанії
-            campaigns_transformed = self.transform_campaigns(advertiser_mapping)
-            campaign_data = [tuple(row) for _, row in campaigns_transformed.iterrows()]
-
-            self.insert_data_batch(cursor, """
-                INSERT IGNORE INTO campaigns (campaign_id, advertiser_id, campaign_name, 
-                                     start_date, end_date, targeting_criteria, 
-                                     ad_slot_size, budget, remaining_budget)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, campaign_data)
-            print(f"✅ Вставлено {len(campaigns_transformed)} кампаній")
-
-            # 3. Користувачі
-            users_clean, interests_df = self.transform_users_and_interests()
-            user_data = [tuple(row) for _, row in users_clean.iterrows()]
-
-            self.insert_data_batch(cursor, """
-                INSERT IGNORE INTO users (user_id, age, gender, location, signup_date)
-                VALUES (%s, %s, %s, %s, %s)
-            """, user_data)
-            print(f"✅ Вставлено {len(users_clean)} користувачів")
-
-            # 4. Інтереси користувачів
-            if not interests_df.empty:
-                interest_data = [(row['user_id'], row['interest']) for _, row in interests_df.iterrows()]
-                self.insert_data_batch(cursor, """
-                    INSERT IGNORE INTO user_interests (user_id, interest) VALUES (%s, %s)
-                """, interest_data)
-                print(f"✅ Вставлено {len(interests_df)} інтересів")
-
-            # 5. Рекламні події
-            ad_events_final, clicks_data = self.transform_ad_events_and_clicks()
-            event_data = [tuple(row) for _, row in ad_events_final.iterrows()]
-
-            self.insert_data_batch(cursor, """
-                INSERT IGNORE INTO ad_events (event_id, campaign_id, user_id, device, 
-                                     location, timestamp, bid_amount, ad_cost, ad_revenue)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, event_data)
-            print(f"✅ Вставлено {len(ad_events_final)} рекламних подій")
-
-            # 6. Кліки
-            if not clicks_data.empty:
-                click_data = [(row['EventID'], row['ClickTimestamp']) for _, row in clicks_data.iterrows()]
-                self.insert_data_batch(cursor, """
-                    INSERT IGNORE INTO clicks (event_id, click_timestamp) VALUES (%s, %s)
-                """, click_data)
-                print(f"✅ Вставлено {len(clicks_data)} кліків")
-
-            print("🎉 Всі дані успішно перенесені!")
-
-        except Error as e:
-            print(f"❌ Загальна помилка при вставці: {e}")
-            self.connection.rollback()
-        finally:
-            cursor.close()
-
-    def run_full_import(self, clear_data=False):
-        """Повний імпорт даних"""
-        try:
-            self.connect_db()
-            if not self.connection:
-                return
-
-            self.load_csv_data()
-
-            if clear_data:
-                self.clear_existing_data()
-
-            self.insert_data_to_db()
-
-        finally:
-            if self.connection:
-                self.connection.close()
-                print("🔌 З'єднання закрито")
-
-
-# Конфігурація підключення
-config = {
-    'host': 'mysql',
-    'port': 3306,
-    'database': 'adtech_db',
-    'user': 'adtech_user',
-    'password': 'adtech_pass'
-}
-
-# # Використання
-# if __name__ == "__main__":
-transformer = AdTechDataTransformer(config)
-
-# Запуск з очищенням даних (якщо потрібно)
-transformer.run_full_import(clear_data=True)  # True для очищення існуючих даних
-
-# Або без очищення (дані додадуться до існуючих)
-# transformer.run_full_import(clear_data=False)
\ No newline at end of file
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import mysql.connector
+from mysql.connector import Error, pooling
+
+from dataset import (AD_EVENTS_PATH, appended_offset, iter_ad_events, iter_csv_rows, merge_targeting_criteria,
+                     prefix_fingerprint, read_ad_events, read_campaigns, read_users)
+from metrics import ImportMetrics
+
+STAGING_DIR = 'data/processed'
+DEAD_LETTER_PATH = 'output/rejected_rows.jsonl'
+
+# Коди помилок MySQL, коли LOAD DATA LOCAL INFILE заборонено на сервері або клієнті
+LOCAL_INFILE_DISABLED_ERRORS = (1148, 2068, 3948)
+
+# EventID (UUID 8-4-4-4-12) зберігається як BINARY(16): позиції дефісів і hex-цифр у рядку
+UUID_DASHES = [8, 13, 18, 23]
+UUID_HEX_DIGITS = [i for i in range(36) if i not in UUID_DASHES]
+# Байт ASCII -> значення hex-цифри; 255 - не hex-цифра
+HEX_VALUES = np.full(256, 255, dtype=np.uint8)
+HEX_VALUES[np.frombuffer(b'0123456789abcdef', dtype=np.uint8)] = np.arange(16)
+HEX_VALUES[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10, 16)
+
+def to_rows(df):
+    """Перетворення DataFrame на список кортежів для executemany (NaN -> None)"""
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def event_keys(event_ids):
+    """UUID-рядки EventID -> 16-байтні ключі для BINARY(16); некоректні ID -> None.
+
+    Розбір векторний (матриця байтів рядків), без uuid.UUID на кожен рядок.
+    """
+    try:
+        # Ширина 37: рядок, довший за UUID, не обрізається до валідного
+        chars = event_ids.to_numpy(dtype=object).astype('S37')
+    except UnicodeEncodeError:
+        chars = event_ids.astype(str).str.encode('ascii', 'replace').to_numpy(dtype=object).astype('S37')
+    chars = chars.view(np.uint8).reshape(len(event_ids), 37)
+    digits = HEX_VALUES[chars[:, UUID_HEX_DIGITS]]
+    valid = ((digits != 255).all(axis=1) & (chars[:, UUID_DASHES] == ord('-')).all(axis=1)
+             & (chars[:, 36] == 0))
+    packed = np.ascontiguousarray((digits[:, 0::2] << 4) | digits[:, 1::2])
+    keys = packed.view('V16').ravel().astype(object)
+    keys[~valid] = None
+    return pd.Series(keys, index=event_ids.index)
+
+
+def escape_backslashes(series):
+    """Подвоєння '\\' у рядкових значеннях: LOAD DATA трактує '\\' як escape-символ (ESCAPED BY)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.rename_categories(
+            lambda value: value.replace('\\', '\\\\') if isinstance(value, str) else value)
+    if series.dtype != object:
+        return series
+    escaped = series.str.contains('\\', regex=False, na=False)
+    if not escaped.any():
+        return series
+    series = series.copy()
+    series[escaped] = series[escaped].str.replace('\\', '\\\\', regex=False)
+    return series
+
+
+def table_name(query):
+    """Назва таблиці з INSERT ... INTO <table>"""
+    match = re.search(r'INTO\s+(\w+)', query, re.IGNORECASE)
+    return match.group(1) if match else None
+
+
+def prefetch(iterator, depth=1):
+    """Читання наступних елементів у фоновому потоці, поки поточний обробляється.
+
+    Одночасно живуть не більше depth + 2 елементів: depth у буфері, один, що його читач
+    щойно отримав, і один у споживача. Якщо споживач зупинився (виняток, break, close),
+    читач завершується і закриває джерело (файл CSV/Parquet) у своєму потоці.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            put(done)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+class AdTechDataTransformer:
+    def __init__(self, connection_config):
+        self.config = connection_config
+        self.connection = None
+        self.bulk = False
+        self.workers = 1
+        self.pool = None
+        # Стан інкрементального імпорту
+        self.watermark = None
+        self.ingested_files = set()
+        self.skip_events = False
+        # Байт, з якого файл подій дописано після попереднього імпорту (читаються лише нові рядки)
+        self.resume_offset = None
+        self.loaded_max_timestamp = None
+        self.loaded_rows = 0
+        # Перевірка event_id проти вже завантажених подій (не потрібна після clear_existing_data)
+        self.check_loaded = True
+        # (campaign_id, day) завантажених подій, для яких rollup ще не перераховано
+        self.rollup_keys = set()
+        self.campaign_mapping = None
+        # Довідник locations: назва -> location_id, доповнюється для кожного пакету
+        self.location_mapping = {}
+        # Відхилені записи (dead-letter)
+        self.rejected_rows = 0
+        self.dead_letter_lock = threading.Lock()
+        # Час, рядки та латентність пакетів по етапах і таблицях
+        self.metrics = ImportMetrics()
+
+    def connect_db(self):
+        """Підключення до MySQL"""
+        try:
+            self.connection = mysql.connector.connect(allow_local_infile=self.bulk, **self.config)
+            print("✅ Підключення до MySQL успішне")
+        except Error as e:
+            print(f"❌ Помилка підключення: {e}")
+
+    def load_csv_data(self, load_events=True):
+        """Завантаження CSV файлів
+
+        При load_events=False ad_events не читаються цілком (потоковий режим).
+        """
+        print("📂 Завантаження CSV файлів...")
+        with self.metrics.stage('load_csv_data') as stage:
+            if load_events and self.resume_offset:
+                # Дописаний файл: парсяться лише нові рядки, без повного перечитування CSV
+                batches = [batch for batch, _, _ in iter_csv_rows(AD_EVENTS_PATH, self.resume_offset)]
+                self.ad_events = merge_targeting_criteria(pd.concat(batches, ignore_index=True))
+            elif load_events:
+                # CSV парситься лише при першому запуску, далі читається Parquet-кеш
+                self.ad_events = merge_targeting_criteria(read_ad_events(AD_EVENTS_PATH))
+            else:
+                self.ad_events = None
+            self.campaigns = read_campaigns()
+            self.users = read_users()
+            events_rows = len(self.ad_events) if self.ad_events is not None else 0
+            stage['rows'] = events_rows + len(self.campaigns) + len(self.users)
+        events_count = len(self.ad_events) if self.ad_events is not None else 'потік'
+        print(
+            f"✅ Завантажено: {events_count} подій, {len(self.campaigns)} кампаній, {len(self.users)} користувачів")
+
+    def iter_ad_events_chunks(self, chunksize=100_000):
+        """Читання ad_events чанками фіксованого розміру з Parquet-кешу (або лише дописаних рядків)"""
+        if self.resume_offset:
+            chunks = (batch for batch, _, _ in iter_csv_rows(AD_EVENTS_PATH, self.resume_offset, chunksize))
+        else:
+            chunks = iter_ad_events(AD_EVENTS_PATH, chunksize)
+        while True:
+            with self.metrics.stage('read_ad_events_chunk') as stage:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    chunk = merge_targeting_criteria(chunk)
+                    stage['rows'] = len(chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+    def clear_existing_data(self):
+        """Очищення існуючих даних (опціонально)"""
+        cursor = self.connection.cursor()
+        try:
+            # Видаляємо в правильному порядку (зворотно до залежностей)
+            cursor.execute("DELETE FROM ad_events_daily_rollup")
+            cursor.execute("DELETE FROM clicks")
+            cursor.execute("DELETE FROM ad_events")
+            cursor.execute("DELETE FROM user_interests")
+            cursor.execute("DELETE FROM users")
+            cursor.execute("DELETE FROM locations")
+            cursor.execute("DELETE FROM campaigns")
+            cursor.execute("DELETE FROM advertisers")
+            cursor.execute("DELETE FROM import_watermarks")
+
+            # Скидаємо AUTO_INCREMENT
+            cursor.execute("ALTER TABLE advertisers AUTO_INCREMENT = 1")
+            cursor.execute("ALTER TABLE campaigns AUTO_INCREMENT = 1")
+            cursor.execute("ALTER TABLE clicks AUTO_INCREMENT = 1")
+            cursor.execute("ALTER TABLE locations AUTO_INCREMENT = 1")
+            self.location_mapping = {}
+            self.bump_data_version(cursor)
+
+            self.connection.commit()
+            print("🧹 Існуючі дані очищено")
+        except Error as e:
+            print(f"⚠️ Помилка при очищенні: {e}")
+            self.connection.rollback()
+        finally:
+            cursor.close()
+
+    def bump_data_version(self, cursor):
+        """Нова версія даних для звітного кешу; комміт - разом із записом, що її змінив"""
+        cursor.execute("""
+            INSERT INTO data_version (id, version) VALUES (1, 1)
+            ON DUPLICATE KEY UPDATE version = version + 1
+        """)
+
+    def source_signature(self):
+        """Ідентифікатор файлу подій: шлях, розмір та час зміни"""
+        stat = os.stat(AD_EVENTS_PATH)
+        return AD_EVENTS_PATH, stat.st_size, stat.st_mtime_ns
+
+    def read_watermark(self):
+        """Читання high-water mark: максимальний Timestamp та вже завантажені файли"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT source_file, file_size, file_mtime_ns, max_timestamp, prefix_fingerprint "
+                           "FROM import_watermarks")
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        self.ingested_files = {(source_file, size, mtime) for source_file, size, mtime, *_ in rows}
+        timestamps = [max_timestamp for _, _, _, max_timestamp, _ in rows if max_timestamp is not None]
+        self.watermark = pd.Timestamp(max(timestamps)) if timestamps else None
+        print(f"🔖 Watermark: {self.watermark}, завантажених файлів: {len(self.ingested_files)}")
+
+        loaded_size, fingerprint = next(((size, fingerprint) for source_file, size, _, _, fingerprint in rows
+                                         if source_file == AD_EVENTS_PATH), (None, None))
+        self.resume_offset = appended_offset(AD_EVENTS_PATH, loaded_size, fingerprint)
+        if self.resume_offset:
+            print(f"📎 Файл подій дописано: читаються лише рядки після байта {self.resume_offset}")
+
+    def filter_new_events(self, ad_events):
+        """Відбір подій, не старіших за watermark.
+
+        Нестроге порівняння: події з тією ж секундою, що й watermark, можуть прийти в наступному
+        файлі. Вже завантажені з них відкидає drop_loaded_events, а rollup перераховується
+        з таблиць, тож повторне читання межі нічого не подвоює.
+        """
+        return ad_events[pd.to_datetime(ad_events['Timestamp']) >= self.watermark].copy()
+
+    def track_watermark(self, ad_events_final):
+        """Оновлення максимального Timestamp і кількості завантажених подій"""
+        if ad_events_final.empty:
+            return
+        max_timestamp = pd.to_datetime(ad_events_final['Timestamp']).max()
+        if self.loaded_max_timestamp is None or max_timestamp > self.loaded_max_timestamp:
+            self.loaded_max_timestamp = max_timestamp
+        self.loaded_rows += len(ad_events_final)
+
+    def record_watermark(self, cursor, source=None):
+        """Запис нового watermark для файлу подій у контрольну таблицю.
+
+        source - (файл, розмір, mtime_ns); за замовчуванням файл AD_EVENTS_PATH.
+        """
+        if self.skip_events:
+            return
+        source_file, size, mtime = source or self.source_signature()
+        max_timestamp = self.loaded_max_timestamp.to_pydatetime() if self.loaded_max_timestamp is not None else None
+        # Відбиток завантаженої частини: наступний імпорт продовжить з size, лише якщо вона не змінилась
+        fingerprint = prefix_fingerprint(source_file, size)
+        cursor.execute("""
+            INSERT INTO import_watermarks (source_file, file_size, file_mtime_ns, prefix_fingerprint,
+                                           max_timestamp, rows_loaded)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                file_size = VALUES(file_size),
+                file_mtime_ns = VALUES(file_mtime_ns),
+                prefix_fingerprint = VALUES(prefix_fingerprint),
+                max_timestamp = GREATEST(COALESCE(max_timestamp, VALUES(max_timestamp)),
+                                         COALESCE(VALUES(max_timestamp), max_timestamp)),
+                rows_loaded = rows_loaded + VALUES(rows_loaded)
+        """, (source_file, size, mtime, fingerprint, max_timestamp, self.loaded_rows))
+        self.connection.commit()
+        print(f"🔖 Новий watermark: {self.loaded_max_timestamp} ({self.loaded_rows} подій)")
+
+    def fetch_name_mapping(self, cursor, table, id_column, name_column, names, chunk_size=1000):
+        """Мапінг назва -> ID одним SELECT ... WHERE name IN (...) на кожні chunk_size назв.
+
+        Якщо назва не унікальна (кампанії), у мапінгу лишається найбільший ID.
+        """
+        mapping = {}
+        for i in range(0, len(names), chunk_size):
+            chunk = names[i:i + chunk_size]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f"SELECT {name_column}, {id_column} FROM {table} WHERE {name_column} IN ({placeholders}) "
+                f"ORDER BY {id_column}",
+                chunk
+            )
+            mapping.update(cursor.fetchall())
+        return mapping
+
+    def upsert_name_mapping(self, cursor, table, id_column, name_column, names, chunk_size=1000):
+        """Set-based отримання або створення мапінгу назва -> ID.
+
+        Відсутні назви вставляються одним multi-row INSERT ... ON DUPLICATE KEY UPDATE,
+        тож кількість запитів не залежить від кількості назв (лише від chunk_size).
+        """
+        names = [name for name in pd.unique(pd.Series(names).dropna())]
+        mapping = self.fetch_name_mapping(cursor, table, id_column, name_column, names, chunk_size)
+
+        missing = [name for name in names if name not in mapping]
+        for i in range(0, len(missing), chunk_size):
+            chunk = missing[i:i + chunk_size]
+            placeholders = ', '.join(['(%s)'] * len(chunk))
+            cursor.execute(
+                f"INSERT INTO {table} ({name_column}) VALUES {placeholders} "
+                f"ON DUPLICATE KEY UPDATE {name_column} = {name_column}",
+                chunk
+            )
+        if missing:
+            mapping.update(self.fetch_name_mapping(cursor, table, id_column, name_column, missing, chunk_size))
+        return mapping
+
+    def get_or_create_advertiser_mapping(self):
+        """Отримання або створення мапінгу рекламодавців"""
+        cursor = self.connection.cursor()
+
+        try:
+            advertiser_mapping = self.upsert_name_mapping(
+                cursor, 'advertisers', 'advertiser_id', 'advertiser_name', self.campaigns['AdvertiserName']
+            )
+
+            self.connection.commit()
+            print(f"✅ Оброблено {len(advertiser_mapping)} рекламодавців")
+            return advertiser_mapping
+
+        except Error as e:
+            print(f"❌ Помилка при роботі з рекламодавцями: {e}")
+            self.connection.rollback()
+            return {}
+        finally:
+            cursor.close()
+
+    def upsert_locations(self, cursor, locations):
+        """Доповнення мапінгу локацій новими назвами з довідника locations"""
+        missing = [name for name in pd.unique(pd.Series(locations).dropna()) if name not in self.location_mapping]
+        if missing:
+            self.location_mapping.update(
+                self.upsert_name_mapping(cursor, 'locations', 'location_id', 'location_name', missing)
+            )
+            # Комміт до вставки: події вставляються й іншими з'єднаннями пулу
+            self.connection.commit()
+        return self.location_mapping
+
+    def transform_campaigns(self, advertiser_mapping):
+        """Трансформація кампаній з ID рекламодавців"""
+        campaigns_transformed = self.campaigns.copy()
+        campaigns_transformed['advertiser_id'] = campaigns_transformed['AdvertiserName'].map(advertiser_mapping)
+
+        # Перевіряємо, чи всі рекламодавці знайдені
+        missing_advertisers = campaigns_transformed[campaigns_transformed['advertiser_id'].isna()]
+        if not missing_advertisers.empty:
+            print(f"⚠️ Не знайдено advertiser_id для: {missing_advertisers['AdvertiserName'].unique()}")
+
+        return campaigns_transformed[['CampaignID', 'advertiser_id', 'CampaignName',
+                                      'CampaignStartDate', 'CampaignEndDate',
+                                      'TargetingCriteria', 'AdSlotSize', 'Budget', 'RemainingBudget']].dropna()
+
+    def transform_users_and_interests(self):
+        """Трансформація користувачів та їх інтересів (локація - ID з self.location_mapping).
+
+        location_id у users NOT NULL: користувачі без Location не імпортуються, разом з інтересами.
+        """
+        users_clean = self.users[['UserID', 'Age', 'Gender', 'SignupDate']].copy()
+        users_clean.insert(3, 'location_id', self.users['Location'].map(self.location_mapping).astype('Int16'))
+        has_location = users_clean['location_id'].notna()
+        if not has_location.all():
+            print(f"⚠️ Пропущено {(~has_location).sum()} користувачів без Location")
+            users_clean = users_clean[has_location]
+
+        # Обробка інтересів: str.split + explode замість iterrows
+        # Користувачі без інтересів відкидаються до split: astype(str) зробив би з None рядок 'None'
+        interests_df = self.users.loc[has_location, ['UserID', 'Interests']].dropna(subset=['Interests'])
+        interests_df = interests_df.rename(columns={'UserID': 'user_id'})
+        interests_df = interests_df.assign(interest=interests_df['Interests'].str.split(','))
+        interests_df = interests_df.explode('interest')
+        interests_df['interest'] = interests_df['interest'].str.strip()
+        interests_df = interests_df[(interests_df['interest'] != '') & (interests_df['interest'] != 'nan')]
+        interests_df = interests_df[['user_id', 'interest']].reset_index(drop=True)
+        return users_clean, interests_df
+
+    def transform_ad_events_and_clicks(self, ad_events=None):
+        """Трансформація подій та кліків (усіх або одного чанку)
+
+        EventID перетворюється на 16-байтний event_key, Location - на location_id
+        з self.location_mapping (заповнює upsert_locations). Події без Location
+        не імпортуються: location_id у ad_events NOT NULL.
+        """
+        # Мапінг назв кампаній до ID: з бази (після вставки кампаній) або з CSV
+        campaign_mapping = self.campaign_mapping
+        if not campaign_mapping:
+            campaigns = self.campaigns.sort_values('CampaignID')
+            campaign_mapping = dict(zip(campaigns['CampaignName'], campaigns['CampaignID']))
+
+        if ad_events is None:
+            events_clean = self.ad_events.copy()
+        else:
+            # Чанк належить лише цьому виклику, копія не потрібна
+            events_clean = ad_events
+        raw_columns = list(events_clean.columns)
+        # CampaignName та Location - category: map рахується лише для словника значень
+        events_clean['campaign_id'] = events_clean['CampaignName'].map(campaign_mapping)
+        events_clean['location_id'] = events_clean['Location'].map(self.location_mapping).astype('Int16')
+        events_clean['event_key'] = event_keys(events_clean['EventID'])
+
+        invalid_ids = events_clean['event_key'].isna()
+        if invalid_ids.any():
+            # Події з некоректним EventID не вставляються, а йдуть у dead-letter файл з вихідними полями
+            invalid = events_clean.loc[invalid_ids, raw_columns]
+            self.write_dead_letters('ad_events', [
+                (row, ValueError(f"EventID не у форматі UUID: {event_id!r}"))
+                for row, event_id in zip(invalid.itertuples(index=False, name=None), invalid['EventID'])
+            ])
+            print(f"⚠️ Пропущено {invalid_ids.sum()} подій з EventID не у форматі UUID (див. {DEAD_LETTER_PATH})")
+
+        # Видаляємо події без campaign_id, локації або ключа події; дублікати EventID - лише перша подія
+        events_clean = events_clean.dropna(subset=['campaign_id', 'location_id', 'event_key'])
+        events_clean = events_clean.drop_duplicates(subset=['event_key'])
+        events_clean['campaign_id'] = events_clean['campaign_id'].astype('int64')
+
+        # Розділяємо на події та кліки
+        ad_events_final = events_clean[['event_key', 'campaign_id', 'UserID', 'Device',
+                                        'location_id', 'Timestamp', 'BidAmount', 'AdCost', 'AdRevenue']].copy()
+
+        # Тільки кліки
+        clicks_data = events_clean[events_clean['WasClicked'] == True][['event_key', 'ClickTimestamp']].copy()
+        clicks_data = clicks_data.dropna(subset=['ClickTimestamp'])
+
+        return ad_events_final, clicks_data
+
+    def insert_data_batch(self, cursor, query, data, batch_size=1000, connection=None):
+        """Пакетна вставка даних"""
+        connection = connection or self.connection
+        table = table_name(query)
+        for i in range(0, len(data), batch_size):
+            batch = data[i:i + batch_size]
+            start = time.perf_counter()
+            try:
+                cursor.executemany(query, batch)
+                connection.commit()
+            except Error as e:
+                print(f"❌ Помилка в пакеті {i // batch_size + 1}: {e}")
+                connection.rollback()
+                self.metrics.increment('failed_batches')
+                if len(batch) == 1:
+                    self.write_dead_letter(query, batch[0], e)
+                else:
+                    # Ділимо пакет навпіл, доки не ізолюємо погані записи
+                    rejected = self.bisect_batch(cursor, query, batch, connection)
+                    print(f"⚠️ Пропущено записів: {rejected} (див. {DEAD_LETTER_PATH})")
+            # Латентність пакету разом із відновленням після помилки
+            self.metrics.record_batch(table, time.perf_counter() - start, len(batch))
+
+    def bisect_batch(self, cursor, query, batch, connection):
+        """Рекурсивна вставка половин пакету, що впав; повертає кількість відхилених записів.
+
+        Вартість відновлення ~ (кількість поганих записів) * log(розмір пакету), а не розмір пакету.
+        """
+        rejected = 0
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            self.metrics.increment('retries')
+            try:
+                cursor.executemany(query, half)
+                connection.commit()
+            except Error as e:
+                connection.rollback()
+                if len(half) == 1:
+                    self.write_dead_letter(query, half[0], e)
+                    rejected += 1
+                else:
+                    rejected += self.bisect_batch(cursor, query, half, connection)
+        return rejected
+
+    def write_dead_letter(self, query, row, error):
+        """Запис відхиленого рядка з кодом помилки у dead-letter файл (JSON Lines)"""
+        self.write_dead_letters(table_name(query), [(row, error)])
+
+    def write_dead_letters(self, table, rejected):
+        """Запис відхилених рядків [(рядок, помилка)] таблиці table у dead-letter файл"""
+        records = [{
+            'table': table,
+            'errno': getattr(error, 'errno', None),
+            'error': str(error),
+            'row': list(row),
+        } for row, error in rejected]
+        if not records:
+            return
+        with self.dead_letter_lock:
+            os.makedirs(os.path.dirname(DEAD_LETTER_PATH), exist_ok=True)
+            with open(DEAD_LETTER_PATH, 'a', encoding='utf-8') as f:
+                for record in records:
+                    # Ключі подій (BINARY(16)) пишуться у hex
+                    f.write(json.dumps(record, ensure_ascii=False,
+                                       default=lambda value: value.hex() if isinstance(value, bytes) else str(value)) + '\n')
+            self.rejected_rows += len(records)
+        self.metrics.increment('rejected_rows', len(records))
+
+    def local_infile_enabled(self, cursor):
+        """Перевірка, чи сервер дозволяє LOAD DATA LOCAL INFILE"""
+        cursor.execute("SHOW GLOBAL VARIABLES LIKE 'local_infile'")
+        result = cursor.fetchone()
+        return bool(result) and str(result[1]).upper() == 'ON'
+
+    def load_data_infile(self, cursor, table, columns, df, fallback_query, connection=None, binary_columns=(),
+                         unique_checks=False):
+        """Масове завантаження таблиці через staged TSV та LOAD DATA LOCAL INFILE.
+
+        Уся таблиця вантажиться в одній транзакції з вимкненими foreign key checks; unique checks
+        вимикаються лише для таблиць без вторинних UNIQUE (інакше дублікати не відсікаються).
+        Якщо сервер не дозволяє local infile, використовується звичайна пакетна вставка
+        (вже з увімкненими перевірками). binary_columns (bytes у DataFrame) пишуться в TSV
+        у hex і розпаковуються через UNHEX; '\\' у рядках подвоюється, NULL - це \\N.
+        """
+        connection = connection or self.connection
+        if not self.bulk:
+            self.insert_data_batch(cursor, fallback_query, to_rows(df), connection=connection)
+            return
+
+        staged = df.assign(**{
+            name: df[name].map(bytes.hex, na_action='ignore') if column in binary_columns
+            else escape_backslashes(df[name])
+            for name, column in zip(df.columns, columns)
+        })
+        targets = [f'@{column}' if column in binary_columns else column for column in columns]
+        assignments = ', '.join(f'{column} = UNHEX(@{column})' for column in binary_columns)
+
+        os.makedirs(STAGING_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=f'{table}_', suffix='.tsv', dir=STAGING_DIR)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                staged.to_csv(f, sep='\t', header=False, index=False, na_rep='\\N', lineterminator='\n')
+
+            if not unique_checks:
+                cursor.execute("SET unique_checks = 0")
+            cursor.execute("SET foreign_key_checks = 0")
+            start = time.perf_counter()
+            disabled_error = None
+            try:
+                cursor.execute(f"""
+                    LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE {table}
+                    CHARACTER SET utf8mb4
+                    FIELDS TERMINATED BY '\\t' OPTIONALLY ENCLOSED BY '"' ESCAPED BY '\\\\'
+                    LINES TERMINATED BY '\\n'
+                    ({', '.join(targets)})
+                    {f'SET {assignments}' if assignments else ''}
+                """, (os.path.abspath(path),))
+                connection.commit()
+                # Уся таблиця - один пакет
+                self.metrics.record_batch(table, time.perf_counter() - start, len(df))
+            except Error as e:
+                connection.rollback()
+                if e.errno not in LOCAL_INFILE_DISABLED_ERRORS:
+                    raise
+                disabled_error = e
+            finally:
+                cursor.execute("SET unique_checks = 1")
+                cursor.execute("SET foreign_key_checks = 1")
+        finally:
+            os.remove(path)
+
+        if disabled_error is not None:
+            # Пакетна вставка - вже з увімкненими перевірками ключів
+            print(f"⚠️ LOAD DATA LOCAL INFILE недоступний ({disabled_error}), перемикаємось на пакетну вставку")
+            self.metrics.increment('bulk_fallbacks')
+            self.bulk = False
+            self.insert_data_batch(cursor, fallback_query, to_rows(df), connection=connection)
+
+    def insert_dimensions(self, cursor):
+        """Вставка довідкових таблиць: рекламодавці, кампанії, користувачі, інтереси"""
+        # 1. Рекламодавці (з перевіркою дублікатів)
+        advertiser_mapping = self.get_or_create_advertiser_mapping()
+
+        # 2. Кампанії
+        with self.metrics.stage('transform_campaigns', len(self.campaigns)):
+            campaigns_transformed = self.transform_campaigns(advertiser_mapping)
+        campaign_data = to_rows(campaigns_transformed)
+
+        # Бюджети змінюються між завантаженнями, тому оновлюємо їх замість ігнорування
+        self.insert_data_batch(cursor, """
+            INSERT INTO campaigns (campaign_id, advertiser_id, campaign_name, 
+                                 start_date, end_date, targeting_criteria, 
+                                 ad_slot_size, budget, remaining_budget)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE budget = VALUES(budget), remaining_budget = VALUES(remaining_budget)
+        """, campaign_data)
+        print(f"✅ Вставлено {len(campaigns_transformed)} кампаній")
+
+        # Мапінг назв кампаній до ID з бази тим самим set-based запитом
+        campaign_names = pd.unique(self.campaigns['CampaignName'].dropna()).tolist()
+        self.campaign_mapping = self.fetch_name_mapping(
+            cursor, 'campaigns', 'campaign_id', 'campaign_name', campaign_names
+        )
+
+        # 3. Користувачі (спершу нові локації в довідник locations)
+        self.upsert_locations(cursor, self.users['Location'])
+        with self.metrics.stage('transform_users_and_interests', len(self.users)):
+            users_clean, interests_df = self.transform_users_and_interests()
+        user_data = to_rows(users_clean)
+
+        self.insert_data_batch(cursor, """
+            INSERT IGNORE INTO users (user_id, age, gender, location_id, signup_date)
+            VALUES (%s, %s, %s, %s, %s)
+        """, user_data)
+        print(f"✅ Вставлено {len(users_clean)} користувачів")
+
+        # 4. Інтереси користувачів
+        if not interests_df.empty:
+            interest_data = to_rows(interests_df)
+            self.insert_data_batch(cursor, """
+                INSERT IGNORE INTO user_interests (user_id, interest) VALUES (%s, %s)
+            """, interest_data)
+            print(f"✅ Вставлено {len(interests_df)} інтересів")
+
+        # Бюджети та користувачі змінюють звіти без нових подій
+        self.bump_data_version(cursor)
+        self.connection.commit()
+
+    def insert_events(self, cursor, ad_events=None):
+        """Вставка рекламних подій та кліків (усіх або одного чанку).
+
+        Дні кампаній із пакету запам'ятовуються в self.rollup_keys, rollup для них
+        перераховує refresh_rollup після вставки.
+        """
+        if self.watermark is not None:
+            ad_events = self.filter_new_events(self.ad_events if ad_events is None else ad_events)
+        self.upsert_locations(cursor, (self.ad_events if ad_events is None else ad_events)['Location'])
+        with self.metrics.stage('transform_ad_events_and_clicks') as stage:
+            ad_events_final, clicks_data = self.transform_ad_events_and_clicks(ad_events)
+            stage['rows'] = len(ad_events_final)
+        # Ключі всього пакету, а не лише нових подій: після збою між вставкою і перерахунком
+        # повторний запуск перераховує ті самі дні
+        keys = pd.DataFrame({'campaign_id': ad_events_final['campaign_id'],
+                             'day': pd.to_datetime(ad_events_final['Timestamp']).dt.date}).drop_duplicates()
+        self.rollup_keys.update(keys.itertuples(index=False, name=None))
+        if self.check_loaded:
+            ad_events_final, clicks_data = self.drop_loaded_events(cursor, ad_events_final, clicks_data)
+        self.track_watermark(ad_events_final)
+        if self.pool is None:
+            self.insert_event_frames(cursor, ad_events_final, clicks_data)
+        else:
+            self.insert_event_partitions(ad_events_final, clicks_data)
+        return len(ad_events_final), len(clicks_data)
+
+    def drop_loaded_events(self, cursor, ad_events_final, clicks_data, chunk_size=1000):
+        """Відкидання подій (і їхніх кліків), чий event_id уже є в ad_events.
+
+        Первинний ключ ad_events - (event_id, timestamp), тож INSERT IGNORE сам по собі
+        не відсікає ту ж подію з іншим timestamp.
+        """
+        keys = ad_events_final['event_key'].tolist()
+        loaded = set()
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"SELECT event_id FROM ad_events WHERE event_id IN ({placeholders})", chunk)
+            loaded.update(bytes(event_id) for event_id, in cursor.fetchall())
+        if not loaded:
+            return ad_events_final, clicks_data
+
+        print(f"♻️ Пропущено {len(loaded)} вже завантажених подій")
+        self.metrics.increment('duplicate_events', len(loaded))
+        # object-масив: з множини bytes numpy зробив би S16 і обрізав кінцеві нульові байти
+        loaded = np.array(list(loaded), dtype=object)
+        return (ad_events_final[~ad_events_final['event_key'].isin(loaded)],
+                clicks_data[~clicks_data['event_key'].isin(loaded)])
+
+    def insert_event_frames(self, cursor, ad_events_final, clicks_data, connection=None):
+        """Вставка вже трансформованих подій, а потім їхніх кліків"""
+        # 5. Рекламні події
+        self.load_data_infile(cursor, 'ad_events', [
+            'event_id', 'campaign_id', 'user_id', 'device',
+            'location_id', 'timestamp', 'bid_amount', 'ad_cost', 'ad_revenue'
+        ], ad_events_final, """
+            INSERT IGNORE INTO ad_events (event_id, campaign_id, user_id, device, 
+                                 location_id, timestamp, bid_amount, ad_cost, ad_revenue)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, connection=connection, binary_columns=['event_id'])
+
+        # 6. Кліки
+        if not clicks_data.empty:
+            # UNIQUE (event_id): повторно завантажені кліки ігноруються
+            self.load_data_infile(cursor, 'clicks', ['event_id', 'click_timestamp'], clicks_data, """
+                INSERT IGNORE INTO clicks (event_id, click_timestamp) VALUES (%s, %s)
+            """, connection=connection, binary_columns=['event_id'], unique_checks=True)
+
+    def refresh_rollup(self, cursor):
+        """Перерахування ad_events_daily_rollup для днів кампаній з self.rollup_keys.
+
+        Значення рахуються з ad_events і clicks, а не додаються з пакету: дублікати,
+        відхилені рядки та повторне читання не змінюють агрегати. Ключі ставляться
+        в тимчасову таблицю, перерахунок - одна транзакція.
+        """
+        if not self.rollup_keys:
+            return
+        keys = sorted(self.rollup_keys)
+        with self.metrics.stage('refresh_rollup', len(keys)):
+            cursor.execute("""
+                CREATE TEMPORARY TABLE IF NOT EXISTS rollup_keys (
+                    campaign_id INT NOT NULL,
+                    day DATE NOT NULL,
+                    PRIMARY KEY (campaign_id, day)
+                )
+            """)
+            cursor.execute("DELETE FROM rollup_keys")
+            for i in range(0, len(keys), 1000):
+                cursor.executemany("INSERT INTO rollup_keys (campaign_id, day) VALUES (%s, %s)", keys[i:i + 1000])
+            cursor.execute("""
+                INSERT INTO ad_events_daily_rollup (campaign_id, day, device, location_id,
+                                                    impressions, clicks, cost_sum, revenue_sum)
+                SELECT ae.campaign_id, DATE(ae.timestamp), ae.device, ae.location_id,
+                       COUNT(*), COUNT(cl.event_id), SUM(ae.ad_cost), SUM(ae.ad_revenue)
+                FROM rollup_keys k
+                JOIN ad_events ae ON ae.campaign_id = k.campaign_id
+                                 AND ae.timestamp >= k.day AND ae.timestamp < k.day + INTERVAL 1 DAY
+                LEFT JOIN clicks cl ON cl.event_id = ae.event_id
+                GROUP BY ae.campaign_id, DATE(ae.timestamp), ae.device, ae.location_id
+                ON DUPLICATE KEY UPDATE
+                    impressions = VALUES(impressions),
+                    clicks = VALUES(clicks),
+                    cost_sum = VALUES(cost_sum),
+                    revenue_sum = VALUES(revenue_sum)
+            """)
+            self.bump_data_version(cursor)
+            self.connection.commit()
+        self.rollup_keys.clear()
+        print(f"✅ ad_events_daily_rollup оновлено для {len(keys)} днів кампаній")
+
+    def rebuild_rollup(self):
+        """Повне перерахування ad_events_daily_rollup з ad_events та clicks (для відновлення)"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("DELETE FROM ad_events_daily_rollup")
+            cursor.execute("""
+                INSERT INTO ad_events_daily_rollup (campaign_id, day, device, location_id,
+                                                    impressions, clicks, cost_sum, revenue_sum)
+                SELECT ae.campaign_id, DATE(ae.timestamp), ae.device, ae.location_id,
+                       COUNT(*), COUNT(cl.event_id), SUM(ae.ad_cost), SUM(ae.ad_revenue)
+                FROM ad_events ae
+                LEFT JOIN clicks cl ON cl.event_id = ae.event_id
+                GROUP BY ae.campaign_id, DATE(ae.timestamp), ae.device, ae.location_id
+            """)
+            self.bump_data_version(cursor)
+            self.connection.commit()
+            print("✅ ad_events_daily_rollup перераховано")
+        except Error as e:
+            print(f"❌ Помилка при перерахуванні rollup: {e}")
+            self.connection.rollback()
+        finally:
+            cursor.close()
+
+    def insert_partition(self, ad_events_part, clicks_part):
+        """Вставка однієї партиції через окреме з'єднання з пулу"""
+        connection = self.pool.get_connection()
+        cursor = connection.cursor()
+        try:
+            self.insert_event_frames(cursor, ad_events_part, clicks_part, connection=connection)
+        finally:
+            cursor.close()
+            connection.close()  # повертає з'єднання в пул
+
+    def insert_event_partitions(self, ad_events_final, clicks_data):
+        """Паралельна вставка подій і кліків, розбитих на партиції за хешем campaign_id.
+
+        Кліки потрапляють у ту ж партицію, що й їхні події, тому всередині партиції
+        подія завжди вставляється раніше за свій клік.
+        """
+        partition = pd.util.hash_pandas_object(ad_events_final['campaign_id'], index=False) % self.workers
+        clicks_partition = partition.loc[clicks_data.index]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(self.insert_partition,
+                                ad_events_final[partition == part],
+                                clicks_data[clicks_partition == part])
+                for part in range(self.workers)
+            ]
+            for future in futures:
+                future.result()
+
+    def insert_data_to_db(self):
+        """Вставка даних до бази"""
+        cursor = self.connection.cursor()
+
+        try:
+            self.insert_dimensions(cursor)
+
+            events_count, clicks_count = self.insert_events(cursor)
+            print(f"✅ Вставлено {events_count} рекламних подій")
+            if clicks_count:
+                print(f"✅ Вставлено {clicks_count} кліків")
+            self.refresh_rollup(cursor)
+
+            self.record_watermark(cursor)
+
+            print("🎉 Всі дані успішно перенесені!")
+
+        except Error as e:
+            print(f"❌ Загальна помилка при вставці: {e}")
+            self.connection.rollback()
+        finally:
+            cursor.close()
+
+    def insert_data_streaming(self, chunksize=100_000):
+        """Потокова вставка: кожен чанк ad_events трансформується і вставляється до читання наступного.
+
+        Наступний чанк парситься у фоновому потоці, поки поточний вставляється,
+        тому в пам'яті одночасно не більше трьох чанків (див. prefetch) незалежно від розміру файлу.
+        """
+        cursor = self.connection.cursor()
+        chunks = ()
+
+        try:
+            self.insert_dimensions(cursor)
+
+            total_events, total_clicks = 0, 0
+            chunks = () if self.skip_events else prefetch(self.iter_ad_events_chunks(chunksize))
+            for chunk_no, chunk in enumerate(chunks, start=1):
+                events_count, clicks_count = self.insert_events(cursor, chunk)
+                total_events += events_count
+                total_clicks += clicks_count
+                print(f"📦 Чанк {chunk_no}: {events_count} подій, {clicks_count} кліків")
+
+            print(f"✅ Вставлено {total_events} рекламних подій")
+            print(f"✅ Вставлено {total_clicks} кліків")
+            # Один перерахунок після всіх чанків: чанки в довільному порядку зачіпають ті самі дні
+            self.refresh_rollup(cursor)
+
+            self.record_watermark(cursor)
+            print("🎉 Всі дані успішно перенесені!")
+
+        except Error as e:
+            print(f"❌ Загальна помилка при вставці: {e}")
+            self.connection.rollback()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()  # зупинка фонового читання, якщо вставка перервалась
+            cursor.close()
+
+    def run_full_import(self, clear_data=False, stream=False, chunksize=100_000, bulk=False, workers=1,
+                        incremental=False, metrics_path=None, profile=None):
+        """Повний імпорт даних
+
+        stream=True вмикає потоковий режим: ad_events читаються чанками по chunksize рядків.
+        bulk=True вантажить ad_events і clicks через LOAD DATA LOCAL INFILE.
+        workers > 1 вставляє події та кліки паралельно через пул з'єднань
+        (після того як рекламодавці, кампанії та користувачі вже вставлені).
+        incremental=True вантажить лише події, новіші за watermark з import_watermarks;
+        файл, що вже був завантажений без змін, пропускається повністю.
+        metrics_path - файл звіту метрик (*.json або *.prom для Prometheus);
+        profile - профілювання етапів, напр. {'transform_ad_events_and_clicks': 'cprofile'};
+        профілюється лише головний потік і лише зовнішній з вкладених етапів (див. ImportMetrics).
+        """
+        self.bulk = bulk
+        self.workers = workers
+        self.metrics = ImportMetrics(profile)
+        try:
+            self.connect_db()
+            if not self.connection:
+                return
+
+            if self.bulk:
+                cursor = self.connection.cursor()
+                try:
+                    self.bulk = self.local_infile_enabled(cursor)
+                finally:
+                    cursor.close()
+                if not self.bulk:
+                    print("⚠️ Сервер не дозволяє local_infile, використовується пакетна вставка")
+
+            if self.workers > 1:
+                self.pool = pooling.MySQLConnectionPool(pool_name='adtech_import', pool_size=self.workers,
+                                                        allow_local_infile=self.bulk, **self.config)
+
+            if clear_data:
+                with self.metrics.stage('clear_existing_data'):
+                    self.clear_existing_data()
+            self.check_loaded = not clear_data
+
+            if incremental:
+                self.read_watermark()
+                self.skip_events = self.source_signature() in self.ingested_files
+                if self.skip_events:
+                    print("📭 Файл подій вже завантажено, оновлюються лише довідкові таблиці")
+
+            self.load_csv_data(load_events=not (stream or self.skip_events))
+
+            with self.metrics.stage('insert'):
+                if stream or self.skip_events:
+                    self.insert_data_streaming(chunksize)
+                else:
+                    self.insert_data_to_db()
+
+        finally:
+            self.pool = None
+            if self.connection:
+                self.connection.close()
+                print("🔌 З'єднання закрито")
+            if metrics_path:
+                self.metrics.write(metrics_path)
+                print(f"📊 Метрики імпорту: {metrics_path}")
+
+
+# Конфігурація підключення
+config = {
+    'host': 'mysql',
+    'port': 3306,
+    'database': 'adtech_db',
+    'user': 'adtech_user',
+    'password': 'adtech_pass'
+}
+
+# Використання
+if __name__ == "__main__":
+    transformer = AdTechDataTransformer(config)
+
+    # Запуск з очищенням даних (якщо потрібно)
+    transformer.run_full_import(clear_data=True)  # True для очищення існуючих даних
+
+    # Або без очищення (дані додадуться до існуючих)
+    # transformer.run_full_import(clear_data=False)
+
+    # Потоковий режим для великих файлів (пам'ять не залежить від розміру ad_events.csv)
+    # transformer.run_full_import(clear_data=True, stream=True, chunksize=100_000)
+
+    # Масове завантаження подій і кліків через LOAD DATA LOCAL INFILE
+    # transformer.run_full_import(clear_data=True, bulk=True)
+
+    # Паралельна вставка подій і кліків 4 потоками через пул з'єднань
+    # transformer.run_full_import(clear_data=True, workers=4)
+
+    # Звіт метрик по етапах і таблицях (JSON або *.prom для Prometheus) з профілюванням трансформації подій
+    # transformer.run_full_import(clear_data=True, metrics_path='output/import_metrics.json',
+    #                             profile={'transform_ad_events_and_clicks': 'cprofile'})
+
+    # Щоденний інкрементальний імпорт: лише нові події після watermark, оновлення бюджетів кампаній
+    # transformer.run_full_import(incremental=True, stream=True)
\ No newline at end of file